@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the provider's /city/<id> endpoint: concurrent
+clients request random city ids and the script reports requests per second
+and p50/p99 latency. Run it against the same provider before and after a
+change to compare.
+
+Usage:
+    python scripts/city_load_benchmark.py --url http://localhost:5004 \
+        [--cities 10] [--concurrency 16] [--requests 5000] [--batch N | --mix FILE]
+
+With --batch N each request asks /cities?ids= for N random ids at once.
+With --mix FILE the requests are replayed from a request-mix file written by
+db_setup.py --mix-out ("METHOD PATH" per line, cycled until --requests).
+"""
+
+import argparse
+import random
+import threading
+import time
+
+import requests
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load /city/<id> and report throughput")
+    parser.add_argument("--url", default="http://localhost:5004")
+    parser.add_argument("--cities", type=int, default=10, help="city ids are drawn from 1..N")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=0, help="ids per /cities request (0 = /city/<id>)")
+    parser.add_argument("--mix", help="request-mix file from db_setup.py --mix-out")
+    args = parser.parse_args()
+
+    mix = []
+    if args.mix:
+        with open(args.mix) as f:
+            mix = [line.split(None, 1) for line in f if line.strip()]
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    remaining = [args.requests]
+
+    def client():
+        session = requests.Session()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                n = args.requests - remaining[0]
+                remaining[0] -= 1
+            method = "GET"
+            if mix:
+                method, path = mix[n % len(mix)]
+                url = f"{args.url}{path.strip()}"
+            elif args.batch:
+                ids = ",".join(str(random.randint(1, args.cities)) for _ in range(args.batch))
+                url = f"{args.url}/cities?ids={ids}"
+            else:
+                url = f"{args.url}/city/{random.randint(1, args.cities)}"
+            started = time.perf_counter()
+            try:
+                ok = session.request(method, url, timeout=10).status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                (latencies if ok else errors).append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    endpoint = f"mix {args.mix}" if mix else f"/cities (batch {args.batch})" if args.batch else "/city"
+    print(f"{endpoint} load against {args.url}: {args.requests} requests, concurrency {args.concurrency}")
+    print(f"  ok: {len(latencies)}  errors: {len(errors)}  wall: {wall:.2f}s")
+    print(f"  throughput:  {len(latencies) / wall:.1f} req/s ({len(latencies) * max(args.batch, 1) / wall:.1f} cities/s)")
+    print(f"  latency p50: {percentile(latencies, 50) * 1000:.2f} ms")
+    print(f"  latency p99: {percentile(latencies, 99) * 1000:.2f} ms")
+    try:
+        print(f"  db: {requests.get(f'{args.url}/db_metrics', timeout=5).json()}")
+    except (requests.exceptions.RequestException, ValueError):
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: launch a local master, requester and provider one after
+another and measure, per role, how long until the node answers /livez
+(HTTP server up) and /readyz (joined the network and caught up).
+
+Usage:
+    python scripts/cold_start_benchmark.py [--runs N] [--timeout SECONDS]
+
+Run it once with BACKGROUND_JOIN=1 (default) and once with BACKGROUND_JOIN=0
+to compare the non-blocking join against the old blocking startup.
+Non-master roles register through the JWT issuer, so point JWT_ISSUER_URL at a
+running issuer (and mount the keys under /secrets) before measuring readiness.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+ROLES = [("master", 5002), ("requester", 5003), ("provider", 5004)]
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for(url, deadline):
+    """Poll url until it returns 200; return the response JSON or None on timeout."""
+    while time.time() < deadline:
+        try:
+            r = requests.get(url, timeout=0.5)
+            if r.status_code == 200:
+                return r.json()
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.05)
+    return None
+
+
+def run_once(timeout):
+    """Start every role in order and return {role: timings} for this run."""
+    results = {}
+    procs = []
+    state_dir = tempfile.mkdtemp(prefix="cold_start_")
+    env = dict(os.environ, BOOTSTRAP_HOST="127.0.0.1", POD_IP="127.0.0.1",
+               PEER_TABLE_PATH=os.path.join(state_dir, "peer_table_{role}.json"))
+    try:
+        for role, port in ROLES:
+            started = time.time()
+            procs.append(subprocess.Popen(
+                [sys.executable, "-u", f"src/{role}.py", str(port)],
+                cwd=REPO_ROOT, env=dict(env, POD_NAME=f"bench-{role}"),
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            deadline = started + timeout
+            live = wait_for(f"http://127.0.0.1:{port}/livez", deadline)
+            live_s = time.time() - started if live is not None else None
+            ready = wait_for(f"http://127.0.0.1:{port}/readyz", deadline)
+            ready_s = time.time() - started if ready is not None else None
+            results[role] = {
+                "live_s": live_s,
+                "ready_s": ready_s,
+                "self_reported": (ready or live or {}).get("startup", {})
+            }
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                p.kill()
+    return results
+
+
+def fmt(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return "timeout"
+    return f"median {statistics.median(values):.2f}s  max {max(values):.2f}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure node time-to-live and time-to-ready")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=90.0)
+    args = parser.parse_args()
+
+    print(f"BACKGROUND_JOIN={os.environ.get('BACKGROUND_JOIN', '1')}, {args.runs} runs")
+    runs = []
+    for i in range(args.runs):
+        run = run_once(args.timeout)
+        runs.append(run)
+        for role, t in run.items():
+            print(f"  run {i + 1} {role:<10} live={t['live_s']} ready={t['ready_s']} node={t['self_reported']}")
+
+    print("\nSummary")
+    for role, _ in ROLES:
+        print(f"  {role:<10} time-to-live:  {fmt([r[role]['live_s'] for r in runs])}")
+        print(f"  {'':<10} time-to-ready: {fmt([r[role]['ready_s'] for r in runs])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,279 @@
 # db_setup.py
-import sqlite3
+"""
+Create the disaster_resources SQLite database.
+
+By default this writes the 10 sample cities. --cities N adds synthetic cities
+up to N (ids 11..N) with a skewed risk distribution, bulk loaded in large
+executemany batches inside one transaction with journaling off; the file is
+built next to the target and renamed into place when complete. The optional
+risk-level index is created after the rows are in.
+
+An existing database is only replaced with --force. Replacing it discards
+the world-state tables (state_*) the nodes keep in it, and the write-behind
+journals next to it are removed so their updates are not replayed into the
+new cities; journals a running provider still holds are reported instead.
+
+--mix-out writes a request-mix file for scripts/city_load_benchmark.py --mix:
+one "METHOD PATH" line per request, with city ids drawn from a Zipf
+distribution so a few hot cities take most of the traffic.
+
+Usage:
+    python scripts/db_setup.py [--cities N] [--risk-weights 0.55,0.3,0.12,0.03]
+        [--db-path PATH] [--force] [--insert-batch 50000] [--risk-index] [--seed 42]
+        [--mix-out FILE --mix-requests 100000 --mix city=80,cities=10,update=10
+         --mix-batch 20 --zipf 1.1]
+"""
+import argparse
+import bisect
+import fcntl
+import glob
 import os
+import random
+import sqlite3
+import time
+from itertools import accumulate, chain, islice
+
+DEFAULT_DB_PATH = os.environ.get("RESOURCE_DB_PATH", "/data/disaster_resources.db")
+
+# Insert sample data - 10 cities with disaster management resources
+SAMPLE_DATA = [
+    (1, 'New York', 'Emergency Vehicles', 300, '2024-01-15', 'High'),
+    (2, 'Los Angeles', 'Medical Supplies', 200, '2024-01-20', 'Medium'),
+    (3, 'Chicago', 'Food Packages', 200, '2024-02-01', 'Medium'),
+    (4, 'Houston', 'Water Purification Units', 100, '2024-02-10', 'Low'),
+    (5, 'Miami', 'Evacuation Buses', 400, '2024-01-25', 'Very High'),
+    (6, 'San Francisco', 'Emergency Shelters', 300, '2024-02-05', 'High'),
+    (7, 'Seattle', 'Communication Equipment', 200, '2024-01-30', 'Medium'),
+    (8, 'Denver', 'Rescue Helicopters', 200, '2024-02-15', 'Medium'),
+    (9, 'Phoenix', 'Fire Trucks', 300, '2024-01-18', 'High'),
+    (10, 'Boston', 'Emergency Personnel', 200, '2024-02-08', 'Medium')
+]
+
+RESOURCE_TYPES = sorted({row[2] for row in SAMPLE_DATA})
+RISK_LEVELS = [("Low", 100), ("Medium", 200), ("High", 300), ("Very High", 400)]
+# Risk levels accepted by the provider's /direct_update_resource endpoint
+UPDATE_RISK_LEVELS = ["low", "medium", "high", "veryHigh"]
+
+CREATE_TABLE = '''
+    CREATE TABLE disaster_resources (
+        city_id INTEGER PRIMARY KEY,
+        city_name TEXT NOT NULL,
+        resource_type TEXT NOT NULL,
+        resources_allocated INTEGER NOT NULL,
+        allocation_date TEXT NOT NULL,
+        disaster_risk_level TEXT NOT NULL
+    )
+'''
+
+INSERT_CITY = '''
+    INSERT INTO disaster_resources
+    (city_id, city_name, resource_type, resources_allocated, allocation_date, disaster_risk_level)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
 
-def setup_database():
+CREATE_RISK_INDEX = '''
+    CREATE INDEX idx_disaster_resources_risk ON disaster_resources (disaster_risk_level)
+'''
+
+
+def synthetic_cities(first_id, last_id, risk_weights, rng):
+    """Yield rows for city ids first_id..last_id with risk levels drawn from risk_weights."""
+    cum_weights = list(accumulate(risk_weights))
+    for city_id in range(first_id, last_id + 1):
+        risk_level, resources = RISK_LEVELS[bisect.bisect_right(cum_weights, rng.random() * cum_weights[-1])]
+        yield (city_id, f"Region {city_id:07d}", RESOURCE_TYPES[city_id % len(RESOURCE_TYPES)], resources,
+               f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", risk_level)
+
+
+def existing_state(db_path):
+    """Row counts of the world-state tables (state_*) in an existing database, {} if it has none."""
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            tables = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'state\\_%' ESCAPE '\\'")]
+            return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables}
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return {}
+
+
+def clear_write_behind_journals(db_path):
     """
-    Create SQLite database with disaster management resource allocation data
+    Remove the write-behind journals kept for the database at db_path (same
+    directory rules as resource_db). Returns the journals a running provider
+    still holds, which are left in place.
     """
-    # Ensure /data directory exists
-    os.makedirs('/data', exist_ok=True)
-    # Create database file
-    db_path = '/data/disaster_resources.db'
-    
-    # Remove existing database if it exists
-    if os.path.exists(db_path):
-        os.remove(db_path)
-    
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
+    journal_dir = os.environ.get("WRITE_BEHIND_JOURNAL_DIR",
+                                 os.path.join(os.path.dirname(db_path) or ".", "write_behind"))
+    held = []
+    for journal in sorted(glob.glob(os.path.join(journal_dir, "*.journal"))):
+        with open(journal + ".lock", "a") as lock:
+            try:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                held.append(journal)
+                continue
+            os.remove(journal)
+            os.remove(journal + ".lock")
+        print(f"  removed write-behind journal {journal}")
+    return held
+
+
+def setup_database(db_path=DEFAULT_DB_PATH, cities=len(SAMPLE_DATA), risk_weights=(0.55, 0.3, 0.12, 0.03),
+                   insert_batch=50000, risk_index=False, seed=42, force=False):
+    """
+    Create SQLite database with disaster management resource allocation data.
+    An existing database is left alone (FileExistsError) unless force is set.
+    """
+    if os.path.exists(db_path) and not force:
+        raise FileExistsError(f"{db_path} already exists; pass --force to replace it "
+                              "(its world state and pending write-behind updates are lost)")
+    # Ensure the target directory exists
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    build_path = db_path + ".building"
+    if os.path.exists(build_path):
+        os.remove(build_path)
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(build_path, isolation_level=None)
+    # A half-built file is simply discarded, so skip journaling and fsyncs while loading
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+    conn.execute("PRAGMA cache_size=-262144")
+
     # Create table for disaster resource allocation
-    cursor.execute('''
-        CREATE TABLE disaster_resources (
-            city_id INTEGER PRIMARY KEY,
-            city_name TEXT NOT NULL,
-            resource_type TEXT NOT NULL,
-            resources_allocated INTEGER NOT NULL,
-            allocation_date TEXT NOT NULL,
-            disaster_risk_level TEXT NOT NULL
-        )
-    ''')
-    
-    # Insert sample data - 10 cities with disaster management resources
-    sample_data = [
-        (1, 'New York', 'Emergency Vehicles', 300, '2024-01-15', 'High'),
-        (2, 'Los Angeles', 'Medical Supplies', 200, '2024-01-20', 'Medium'),
-        (3, 'Chicago', 'Food Packages', 200, '2024-02-01', 'Medium'),
-        (4, 'Houston', 'Water Purification Units', 100, '2024-02-10', 'Low'),
-        (5, 'Miami', 'Evacuation Buses', 400, '2024-01-25', 'Very High'),
-        (6, 'San Francisco', 'Emergency Shelters', 300, '2024-02-05', 'High'),
-        (7, 'Seattle', 'Communication Equipment', 200, '2024-01-30', 'Medium'),
-        (8, 'Denver', 'Rescue Helicopters', 200, '2024-02-15', 'Medium'),
-        (9, 'Phoenix', 'Fire Trucks', 300, '2024-01-18', 'High'),
-        (10, 'Boston', 'Emergency Personnel', 200, '2024-02-08', 'Medium')
-    ]
-    
-    cursor.executemany('''
-        INSERT INTO disaster_resources 
-        (city_id, city_name, resource_type, resources_allocated, allocation_date, disaster_risk_level)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', sample_data)
-    
-    conn.commit()
+    conn.execute(CREATE_TABLE)
+
+    rows = iter(SAMPLE_DATA[:cities])
+    if cities > len(SAMPLE_DATA):
+        rows = chain(SAMPLE_DATA, synthetic_cities(len(SAMPLE_DATA) + 1, cities, risk_weights, random.Random(seed)))
+    conn.execute("BEGIN")
+    loaded = 0
+    while True:
+        batch = list(islice(rows, insert_batch))
+        if not batch:
+            break
+        conn.executemany(INSERT_CITY, batch)
+        loaded += len(batch)
+        if loaded % (insert_batch * 20) == 0:
+            print(f"  {loaded} rows ({loaded / (time.perf_counter() - started):.0f} rows/s)")
+    conn.execute("COMMIT")
+    load_seconds = time.perf_counter() - started
+
+    index_seconds = 0
+    if risk_index:
+        index_started = time.perf_counter()
+        conn.execute(CREATE_RISK_INDEX)
+        index_seconds = time.perf_counter() - index_started
+    conn.execute("ANALYZE")
     conn.close()
-    
-    print(f"Database '{db_path}' created successfully with 10 sample records")
-    print("Sample data includes disaster management resources for major cities")
+
+    # Remove existing database if it exists, by renaming the finished one over it;
+    # a leftover WAL or journal from the old file must not be replayed into the new one
+    if os.path.exists(db_path):
+        state = existing_state(db_path)
+        if state:
+            print(f"Replacing '{db_path}': dropping its world state "
+                  f"({', '.join(f'{table}: {count} rows' for table, count in state.items())}); "
+                  "nodes rebuild it from the chain")
+        for journal in clear_write_behind_journals(db_path):
+            print(f"WARNING: {journal} is held by a running provider; its pending updates "
+                  "will be written to the new database. Stop it and rerun with --force to drop them.")
+    for suffix in ("-wal", "-shm", "-journal"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    os.replace(build_path, db_path)
+    total_seconds = time.perf_counter() - started
+
+    print(f"Database '{db_path}' created successfully with {loaded} records")
+    print(f"  load:  {load_seconds:.2f}s ({loaded / load_seconds:.0f} rows/s, batches of {insert_batch})")
+    if risk_index:
+        print(f"  index: {index_seconds:.2f}s (built after the load)")
+    print(f"  total: {total_seconds:.2f}s, {os.path.getsize(db_path) / 1e6:.1f} MB")
+    if cities <= len(SAMPLE_DATA):
+        print("Sample data includes disaster management resources for major cities")
+    return loaded
+
+
+def zipf_sampler(n, s, rng):
+    """Return a function drawing ids 1..n with Zipf(s) popularity; hot ids are scattered, not 1, 2, 3..."""
+    cum_weights = list(accumulate(1 / rank ** s for rank in range(1, n + 1)))
+    ids = list(range(1, n + 1))
+    rng.shuffle(ids)
+    total = cum_weights[-1]
+    return lambda: ids[bisect.bisect_left(cum_weights, rng.random() * total)]
+
+
+def write_request_mix(path, cities, requests, mix, batch, zipf, seed=42):
+    """
+    Write one request per line ("GET /city/<id>", "GET /cities?ids=...",
+    "POST /direct_update_resource/<id>/<risk>") in the proportions of mix.
+    """
+    rng = random.Random(seed)
+    next_id = zipf_sampler(cities, zipf, rng)
+    kinds = list(mix)
+    cum_weights = list(accumulate(mix[k] for k in kinds))
+    started = time.perf_counter()
+    counts = dict.fromkeys(kinds, 0)
+    with open(path, "w") as f:
+        for _ in range(requests):
+            kind = kinds[bisect.bisect_right(cum_weights, rng.random() * cum_weights[-1])]
+            counts[kind] += 1
+            if kind == "city":
+                f.write(f"GET /city/{next_id()}\n")
+            elif kind == "cities":
+                f.write(f"GET /cities?ids={','.join(str(next_id()) for _ in range(batch))}\n")
+            else:
+                f.write(f"POST /direct_update_resource/{next_id()}/{rng.choice(UPDATE_RISK_LEVELS)}\n")
+    print(f"Request mix '{path}': {requests} requests {counts}, Zipf s={zipf} over {cities} cities "
+          f"({time.perf_counter() - started:.2f}s)")
+
+
+def parse_mix(raw):
+    mix = {}
+    for part in raw.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in ("city", "cities", "update"):
+            raise argparse.ArgumentTypeError(f"unknown request kind '{kind}' (city, cities, update)")
+        mix[kind] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the disaster_resources database and request-mix files")
+    parser.add_argument("--cities", type=int, default=len(SAMPLE_DATA), help="total cities (ids 1..N)")
+    parser.add_argument("--risk-weights", default="0.55,0.3,0.12,0.03",
+                        help="relative weights of Low,Medium,High,Very High for synthetic cities")
+    parser.add_argument("--db-path", default=DEFAULT_DB_PATH)
+    parser.add_argument("--force", action="store_true",
+                        help="replace an existing database (drops its world state and write-behind journals)")
+    parser.add_argument("--insert-batch", type=int, default=50000)
+    parser.add_argument("--risk-index", action="store_true", help="index disaster_risk_level after loading")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-db", action="store_true", help="only write the request-mix file")
+    parser.add_argument("--mix-out", help="write a request-mix file for city_load_benchmark.py --mix")
+    parser.add_argument("--mix-requests", type=int, default=100000)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("city=80,cities=10,update=10"))
+    parser.add_argument("--mix-batch", type=int, default=20, help="ids per /cities request in the mix")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of city popularity (0 = uniform)")
+    args = parser.parse_args()
+
+    risk_weights = [float(w) for w in args.risk_weights.split(",")]
+    if len(risk_weights) != len(RISK_LEVELS) or min(risk_weights) < 0 or sum(risk_weights) <= 0:
+        parser.error(f"--risk-weights needs {len(RISK_LEVELS)} non-negative weights")
+
+    if not args.skip_db:
+        try:
+            setup_database(args.db_path, args.cities, risk_weights, args.insert_batch, args.risk_index, args.seed,
+                           args.force)
+        except FileExistsError as e:
+            parser.error(str(e))
+    if args.mix_out:
+        write_request_mix(args.mix_out, args.cities, args.mix_requests, args.mix, args.mix_batch, args.zipf, args.seed)
+
 
 if __name__ == '__main__':
-    setup_database()
\ No newline at end of file
+    main()
@@ -2,11 +2,16 @@
 """
 Generate RSA keypair for JWT signing and verification.
 This script creates the private and public keys needed for JWT authentication.
+
+Usage: python generate_jwt_keys.py [RS256|ES256|EdDSA]
+ES256 (P-256) and EdDSA (Ed25519) keys sign and verify much faster than RSA;
+the issuer picks the algorithm from the key type.
 """
 
 import os
+import sys
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
 from cryptography.hazmat.backends import default_backend
 import base64
 
@@ -24,6 +29,18 @@ def generate_rsa_keypair():
     
     return private_key, public_key
 
+def generate_keypair(alg):
+    """Generate a keypair for the given JWS algorithm (RS256, ES256 or EdDSA)."""
+    if alg == "RS256":
+        return generate_rsa_keypair()
+    if alg == "ES256":
+        private_key = ec.generate_private_key(ec.SECP256R1(), backend=default_backend())
+    elif alg == "EdDSA":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        raise SystemExit(f"Unsupported algorithm {alg}; use RS256, ES256 or EdDSA")
+    return private_key, private_key.public_key()
+
 def save_key_to_pem(key, filename, is_private=True):
     """Save key to PEM format file."""
     if is_private:
@@ -49,10 +66,11 @@ def get_base64_encoded_key(pem_bytes):
     return base64.b64encode(pem_bytes).decode('utf-8')
 
 def main():
-    print("Generating RSA keypair for JWT authentication...")
+    alg = sys.argv[1] if len(sys.argv) > 1 else "RS256"
+    print(f"Generating {alg} keypair for JWT authentication...")
     
     # Generate keypair
-    private_key, public_key = generate_rsa_keypair()
+    private_key, public_key = generate_keypair(alg)
     
     # Save keys to files
     private_pem = save_key_to_pem(private_key, 'private.pem', is_private=True)
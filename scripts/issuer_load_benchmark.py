@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the JWT issuer: many concurrent clients POST /token, the
+way a fleet of pods refreshes tokens right after a rollout. Reports tokens
+per second and p50/p99 latency.
+
+Usage:
+    python scripts/issuer_load_benchmark.py --url http://localhost:8443 \
+        --api-key <NODE_API_KEY> [--concurrency 32] [--requests 2000]
+
+Compare RS256 / ES256 / EdDSA by restarting the issuer with a key of each
+type (see generate_jwt_keys.py), and the dev server against
+gunicorn --workers N.
+"""
+
+import argparse
+import threading
+import time
+
+import requests
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Issue tokens concurrently and report throughput")
+    parser.add_argument("--url", default="http://localhost:8443")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    remaining = [args.requests]
+
+    def client():
+        session = requests.Session()
+        headers = {"Authorization": f"Bearer {args.api_key}"}
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                r = session.post(f"{args.url}/token", headers=headers, timeout=10)
+                ok = r.status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                (latencies if ok else errors).append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    alg = None
+    try:
+        alg = requests.get(f"{args.url}/.well-known/jwks.json", timeout=5).json()["keys"][0]["alg"]
+    except Exception:
+        pass
+    print(f"Issuer {args.url} (alg={alg}), concurrency {args.concurrency}")
+    print(f"  tokens issued: {len(latencies)}  errors: {len(errors)}  wall: {wall:.2f}s")
+    print(f"  throughput:    {len(latencies) / wall:.1f} tokens/s")
+    print(f"  latency p50:   {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"  latency p99:   {percentile(latencies, 99) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 
 import sys
 import requests
-from flask import Flask, jsonify, abort
+from flask import Flask, jsonify, abort, request
 import node as node
 from node import BlockchainNode
 
@@ -70,5 +70,48 @@ def forward_request(city_id):
     except requests.exceptions.RequestException:
         return abort(503, description=f"Cannot reach next hop at {next_hop}")
 
+@app.route('/request', methods=['GET'])
+def forward_batch_request():
+    """
+    Batch variant of /request/<city_id>: /request?ids=1,2,3
+    Forward the whole batch in one call (provider /cities or the next
+    intermediary's /request) and add one blockTransactionData for the batch.
+    """
+    ids = request.args.get('ids')
+    if not ids:
+        return jsonify({"error": "Missing ids"}), 400
+    print(f"[GET /request?ids={ids}] Handled by intermediary: {my_node.MY_ADDRESS}")
+    try:
+        if next_hop.endswith(":5003"):
+            print(f"→ Forwarding batch to provider: {next_hop}")
+            response = requests.get(f"http://{next_hop}/cities", params={"ids": ids}, timeout=5)
+        else:
+            print(f"→ Forwarding batch to next intermediary: {next_hop}")
+            response = requests.get(f"http://{next_hop}/request", params={"ids": ids}, timeout=5)
+    except requests.exceptions.RequestException:
+        return abort(503, description=f"Cannot reach next hop at {next_hop}")
+    if response.status_code in (400, 404):
+        return jsonify(response.json()), response.status_code
+    if response.status_code != 200:
+        return jsonify({"error": "Provider/intermediary error"}), 503
+    data = response.json()
+
+    # Our blockTransactionData first, then whatever the next hop collected
+    block_transactions = [{
+        "sender": f"intermediary_{my_node.MY_ADDRESS}",
+        "recipient": "BackToSender",
+        "requestInfo": f"/request?ids={ids}"
+    }]
+    if data.get("blockTransactionDataList"):
+        block_transactions.extend(data["blockTransactionDataList"])
+    elif data.get("blockTransactionData"):
+        block_transactions.append(data["blockTransactionData"])
+
+    return jsonify({
+        "city_data": data.get("city_data", []),
+        "missing": data.get("missing", []),
+        "blockTransactionDataList": block_transactions
+    }), 200
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=my_node.PORT, threaded=True)
\ No newline at end of file
@@ -1,15 +1,22 @@
 #!/usr/bin/env python3
 """
 JWT Issuer Service
-Issues JWT tokens for node registration using RSA signing.
+Issues JWT tokens for node registration, signed with RS256, ES256 or EdDSA
+depending on the key type. Keys are loaded once at startup and request
+handling keeps no mutable state, so it can run under a multi-worker server:
+    gunicorn --workers 2 --bind 0.0.0.0:8443 --chdir src issuer:app
 """
 
 import os
 import jwt
+import json
 import base64
+import hashlib
 import secrets
 from datetime import datetime, timedelta
 from flask import Flask, request, jsonify
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
 
 app = Flask(__name__)
 
@@ -20,18 +27,58 @@ VALID_KEYS = os.environ.get("VALID_KEYS", "").split(",") if os.environ.get("VALI
 
 # Load private key for signing
 PRIVATE_KEY_PATH = "/secrets/private.pem"
+# Key ring for rotation: every listed key is published in the JWKS, the first one
+# signs new tokens. To rotate, append the new key, move it to the front once nodes
+# have refreshed their JWKS, then drop the old one after its last tokens expire.
+SIGNING_KEY_PATHS = [p for p in os.environ.get("SIGNING_KEY_PATHS", PRIVATE_KEY_PATH).split(",") if p]
 
-def load_private_key():
-    """Load the RSA private key for signing JWTs."""
-    try:
-        with open(PRIVATE_KEY_PATH, 'r') as f:
-            return f.read()
-    except FileNotFoundError:
-        print(f"ERROR: Private key not found at {PRIVATE_KEY_PATH}")
-        return None
-    except Exception as e:
-        print(f"ERROR: Failed to load private key: {e}")
-        return None
+def jwk_thumbprint(jwk):
+    """RFC 7638 thumbprint of a public JWK, used as its key id."""
+    required = {"RSA": ("e", "kty", "n"), "EC": ("crv", "kty", "x", "y"), "OKP": ("crv", "kty", "x")}
+    members = {k: jwk[k] for k in required[jwk["kty"]]}
+    digest = hashlib.sha256(json.dumps(members, separators=(",", ":"), sort_keys=True).encode()).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+def signing_alg_for(private_key):
+    """JWS algorithm for a key: RSA → RS256, P-256 → ES256, Ed25519 → EdDSA."""
+    if isinstance(private_key, rsa.RSAPrivateKey):
+        return "RS256"
+    if isinstance(private_key, ec.EllipticCurvePrivateKey) and private_key.curve.name == "secp256r1":
+        return "ES256"
+    if isinstance(private_key, ed25519.Ed25519PrivateKey):
+        return "EdDSA"
+    raise ValueError(f"unsupported signing key type {type(private_key).__name__}")
+
+def load_key_ring():
+    """
+    Load and parse every key in SIGNING_KEY_PATHS. Returns a list of
+    {"kid", "alg", "private_key", "jwk"} dicts, signing key first; keys that
+    fail to load are skipped.
+    """
+    ring = []
+    algorithms = jwt.algorithms.get_default_algorithms()
+    for path in SIGNING_KEY_PATHS:
+        try:
+            with open(path, 'rb') as f:
+                private_key = serialization.load_pem_private_key(f.read(), password=None)
+            alg = signing_alg_for(private_key)
+        except FileNotFoundError:
+            print(f"ERROR: Private key not found at {path}")
+            continue
+        except Exception as e:
+            print(f"ERROR: Failed to load private key {path}: {e}")
+            continue
+        public_jwk = algorithms[alg].to_jwk(private_key.public_key(), as_dict=True)
+        kid = jwk_thumbprint(public_jwk)
+        public_jwk.update({"kid": kid, "alg": alg, "use": "sig"})
+        ring.append({"kid": kid, "alg": alg, "private_key": private_key, "jwk": public_jwk})
+    return ring
+
+# Parsed once per process (each server worker loads its own copy) and only read afterwards
+KEY_RING = load_key_ring()
+JWKS = {"keys": [entry["jwk"] for entry in KEY_RING]}
+if KEY_RING:
+    print(f"Loaded {len(KEY_RING)} signing keys; signing with {KEY_RING[0]['alg']} kid={KEY_RING[0]['kid']}")
 
 def generate_node_api_key():
     """Generate a random 32-byte base64 API key for node identification."""
@@ -42,6 +89,11 @@ def health_check():
     """Health check endpoint."""
     return jsonify({"status": "healthy", "service": "jwt-issuer"})
 
+@app.route('/.well-known/jwks.json', methods=['GET'])
+def jwks():
+    """Publish the public half of every key in the ring so nodes can verify by kid."""
+    return jsonify(JWKS)
+
 @app.route('/token', methods=['POST'])
 def issue_token():
     """
@@ -67,10 +119,10 @@ def issue_token():
         if api_key not in VALID_KEYS:
             return jsonify({"error": "Invalid API key"}), 401
         
-        # Load private key
-        private_key = load_private_key()
-        if not private_key:
+        # The first key of the preloaded ring signs
+        if not KEY_RING:
             return jsonify({"error": "Failed to load signing key"}), 500
+        signing_key = KEY_RING[0]
         
         # Create JWT payload
         now = datetime.utcnow()
@@ -83,8 +135,9 @@ def issue_token():
             'scope': 'blockchain:register blockchain:mine blockchain:receive_block blockchain:sync blockchain:metrics'
         }
         
-        # Sign JWT with RS256
-        token = jwt.encode(payload, private_key, algorithm='RS256')
+        # Sign with the key's algorithm, naming the key so nodes can pick it from the JWKS
+        token = jwt.encode(payload, signing_key["private_key"], algorithm=signing_key["alg"],
+                           headers={"kid": signing_key["kid"]})
         
         return jsonify({
             "token": token,
@@ -114,12 +167,14 @@ if __name__ == '__main__':
     if not VALID_KEYS:
         print("WARNING: No valid API keys configured. Set VALID_KEYS environment variable.")
     
-    if not os.path.exists(PRIVATE_KEY_PATH):
-        print(f"WARNING: Private key not found at {PRIVATE_KEY_PATH}")
+    missing = [path for path in SIGNING_KEY_PATHS if not os.path.exists(path)]
+    for path in missing:
+        print(f"WARNING: Private key not found at {path}")
+    if missing:
         print("Make sure the JWT issuer key secret is properly mounted.")
     
     print(f"Starting JWT Issuer on port {ISSUER_PORT}")
     print(f"Node ID: {NODE_ID}")
     print(f"Valid API keys: {len(VALID_KEYS)} configured")
     
-    app.run(host='0.0.0.0', port=ISSUER_PORT, debug=False) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=ISSUER_PORT, debug=False, threaded=True) 
\ No newline at end of file
@@ -1,32 +1,1252 @@
 # node.py
-import sys, threading, requests, hashlib, json
+import sys, threading, requests, hashlib, hmac, base64, json, random, queue, glob, tempfile
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from time import time, sleep
-from urllib.parse import urlparse
-from flask  import Flask, request, jsonify, Blueprint
+from urllib.parse import urlparse, parse_qsl, urlencode
+from flask  import Flask, request, jsonify, Blueprint, Response, stream_with_context, has_request_context, g
 import os
 import socket
 import jwt
+import resource_db
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
 
 # ─── Bootstrap Settings ─────────────────────────────────────────────
 BOOTSTRAP_PORT = int(os.environ.get("BOOTSTRAP_PORT", "5002"))
 BOOTSTRAP_HOST = os.getenv("BOOTSTRAP_HOST", "127.0.0.1")
 BOOTSTRAP_ADDRESS = f"{BOOTSTRAP_HOST}:{BOOTSTRAP_PORT}"
 
+# ─── Gossip Settings ───────────────────────────────────────────────
+# GOSSIP_FANOUT peers are picked at random for each relay hop (0 = relay to all),
+# and a block stops being relayed once its TTL reaches zero.
+GOSSIP_FANOUT = int(os.environ.get("GOSSIP_FANOUT", "3"))
+GOSSIP_TTL = int(os.environ.get("GOSSIP_TTL", "4"))
+SEEN_BLOCK_CACHE_SIZE = int(os.environ.get("SEEN_BLOCK_CACHE_SIZE", "1024"))
+
+# ─── Sync Settings ─────────────────────────────────────────────────
+# Deadline (seconds) for the parallel /chain/summary round of a sync
+SYNC_SUMMARY_TIMEOUT = float(os.environ.get("SYNC_SUMMARY_TIMEOUT", "1.0"))
+
+# ─── Peer Health Settings ──────────────────────────────────────────
+# Adaptive timeout = RTT EWMA * multiplier, clamped to [PEER_TIMEOUT_MIN, caller default].
+# RTT is tracked separately for reads (GET) and writes (POST /receive_block,
+# /inv, ...) so cheap reads never shrink the timeout of a heavy write, and a
+# write that times out after the peer accepted it is not a liveness failure.
+# After PEER_BREAKER_THRESHOLD consecutive failures a peer is skipped for a backoff
+# window that doubles per further failure, up to PEER_BREAKER_MAX_BACKOFF seconds.
+PEER_RTT_ALPHA = float(os.environ.get("PEER_RTT_ALPHA", "0.3"))
+PEER_TIMEOUT_MIN = float(os.environ.get("PEER_TIMEOUT_MIN", "0.5"))
+PEER_TIMEOUT_RTT_MULTIPLIER = float(os.environ.get("PEER_TIMEOUT_RTT_MULTIPLIER", "4"))
+PEER_BREAKER_THRESHOLD = int(os.environ.get("PEER_BREAKER_THRESHOLD", "2"))
+PEER_BREAKER_BASE_BACKOFF = float(os.environ.get("PEER_BREAKER_BASE_BACKOFF", "5"))
+PEER_BREAKER_MAX_BACKOFF = float(os.environ.get("PEER_BREAKER_MAX_BACKOFF", "120"))
+PEER_EVICT_FAILURES = int(os.environ.get("PEER_EVICT_FAILURES", "3"))
+
+# ─── Peer Gossip Settings ──────────────────────────────────────────
+GOSSIP_INTERVAL = int(os.environ.get("GOSSIP_INTERVAL", "30"))
+PEER_PROBE_TIMEOUT = float(os.environ.get("PEER_PROBE_TIMEOUT", "1.0"))
+PEER_CHANGELOG_SIZE = int(os.environ.get("PEER_CHANGELOG_SIZE", "256"))
+
+# ─── Peer Table Persistence ────────────────────────────────────────
+# Saved to /data after every gossip cycle, one file per pod ({pod} is POD_NAME),
+# and every table of our role found there is read on start, so a restarted node
+# can rejoin through peers already known. Providers share the Filestore volume,
+# so a replacement pod also finds its replicas' tables; masters and requesters
+# mount /data as emptyDir, which only outlives container restarts, not the pod.
+PEER_TABLE_PATH = os.environ.get("PEER_TABLE_PATH", "/data/peer_table_{role}_{pod}.json")
+PEER_TABLE_MAX_AGE = float(os.environ.get("PEER_TABLE_MAX_AGE", "86400"))
+
+# ─── Address Resolution Settings ───────────────────────────────────
+DNS_CACHE_TTL = float(os.environ.get("DNS_CACHE_TTL", "60"))
+DNS_NEGATIVE_TTL = float(os.environ.get("DNS_NEGATIVE_TTL", "5"))
+DNS_REFRESH_INTERVAL = float(os.environ.get("DNS_REFRESH_INTERVAL", "15"))
+DNS_LOOKUP_WAIT = float(os.environ.get("DNS_LOOKUP_WAIT", "5"))   # max wait on another thread's lookup
+
+# ─── Block Ingress Settings ────────────────────────────────────────
+# Blocks received over HTTP are queued and committed by one worker in order.
+# INGRESS_QUEUE_SIZE=0 processes them inline in the request handler instead.
+INGRESS_QUEUE_SIZE = int(os.environ.get("INGRESS_QUEUE_SIZE", "256"))
+INGRESS_RETRY_AFTER = int(os.environ.get("INGRESS_RETRY_AFTER", "1"))
+
+# ─── Block Stream Settings ─────────────────────────────────────────
+# Roles that subscribe to a master's /blocks/stream instead of waiting for pushes
+BLOCK_STREAM_ROLES = [r for r in os.environ.get("BLOCK_STREAM_ROLES", "provider").split(",") if r]
+BLOCK_STREAM_QUEUE_SIZE = int(os.environ.get("BLOCK_STREAM_QUEUE_SIZE", "1000"))
+BLOCK_STREAM_HEARTBEAT = float(os.environ.get("BLOCK_STREAM_HEARTBEAT", "15"))
+# A full ingress queue stalls the stream reader (TCP backpressure on the master)
+# for up to this long before the subscription is dropped and resumed from our tip.
+BLOCK_STREAM_ENQUEUE_WAIT = float(os.environ.get("BLOCK_STREAM_ENQUEUE_WAIT", "5"))
+
+# ─── Block Filter Settings ─────────────────────────────────────────
+# A node can ask peers for headers plus matching transactions only, e.g.
+# BLOCK_FILTER_AUTHORITY=provider on providers. Unset = receive full blocks.
+BLOCK_FILTER_KEYS = ("contract_id", "authority", "city_id_min", "city_id_max")
+
+# ─── Startup Settings ──────────────────────────────────────────────
+# The HTTP server comes up immediately; discovery, registration and chain sync
+# run in the background (BACKGROUND_JOIN=0 restores the old blocking join).
+# /readyz reports ready once joined and holding READY_SYNC_THRESHOLD of the
+# longest chain seen during the join.
+BACKGROUND_JOIN = os.environ.get("BACKGROUND_JOIN", "1") == "1"
+READY_SYNC_THRESHOLD = float(os.environ.get("READY_SYNC_THRESHOLD", "1.0"))
+_startup_state = {"started_at": time(), "live_at": None, "joined_at": None, "target_length": 0}
+
+# ─── JWT Token Refresh Settings ────────────────────────────────────
+# This node's own token is renewed by a background thread once
+# JWT_REFRESH_FRACTION of its lifetime has passed; failed fetches back off
+# with jitter between JWT_BACKOFF_BASE and JWT_BACKOFF_MAX seconds. Background
+# callers wait up to JWT_WAIT_TIMEOUT for a token; request handlers that must
+# push a block wait at most JWT_REQUEST_WAIT and otherwise hand the push to a
+# background thread rather than sending it unauthenticated.
+JWT_ISSUER_URL = os.environ.get("JWT_ISSUER_URL", "http://jwt-issuer-service:8443")
+JWT_REFRESH_FRACTION = float(os.environ.get("JWT_REFRESH_FRACTION", "0.5"))
+JWT_EXPIRY_MARGIN = float(os.environ.get("JWT_EXPIRY_MARGIN", "5"))
+JWT_FETCH_TIMEOUT = float(os.environ.get("JWT_FETCH_TIMEOUT", "5"))
+JWT_BACKOFF_BASE = float(os.environ.get("JWT_BACKOFF_BASE", "1"))
+JWT_BACKOFF_MAX = float(os.environ.get("JWT_BACKOFF_MAX", "60"))
+JWT_WAIT_TIMEOUT = float(os.environ.get("JWT_WAIT_TIMEOUT", "15"))
+JWT_REQUEST_WAIT = float(os.environ.get("JWT_REQUEST_WAIT", "2"))
+
+# ─── JWT Verification Settings ─────────────────────────────────────
+# The public key is parsed once and re-read only when the file's mtime changes
+# (checked at most every JWT_KEY_CHECK_INTERVAL seconds). Verified tokens are
+# cached by digest until their exp, so a reused peer token is checked once.
+JWT_PUBLIC_KEY_PATH = os.environ.get("JWT_PUBLIC_KEY_PATH", "/secrets/public.pem")
+JWT_KEY_CHECK_INTERVAL = float(os.environ.get("JWT_KEY_CHECK_INTERVAL", "5"))
+JWT_VERIFY_CACHE_SIZE = int(os.environ.get("JWT_VERIFY_CACHE_SIZE", "4096"))
+# Tokens carrying a kid are verified against a local copy of the issuer's JWKS,
+# refreshed in the background; tokens without one fall back to the PEM above.
+JWKS_URL = os.environ.get("JWKS_URL", f"{JWT_ISSUER_URL}/.well-known/jwks.json")
+JWKS_REFRESH_INTERVAL = float(os.environ.get("JWKS_REFRESH_INTERVAL", "300"))
+JWKS_MIN_REFRESH_INTERVAL = float(os.environ.get("JWKS_MIN_REFRESH_INTERVAL", "10"))
+
+# ─── Peer Session Ticket Settings ──────────────────────────────────
+# After a peer's JWT checks out, we hand it an HMAC session ticket bound to its
+# address and the token's expiry; its later calls are signed with that key and
+# checked with one HMAC instead of a public-key verification. The key travels
+# in a response header, so tickets are only as private as the pod network.
+SESSION_TICKETS = os.environ.get("SESSION_TICKETS", "1") == "1"
+SESSION_TICKET_TTL = float(os.environ.get("SESSION_TICKET_TTL", "300"))
+SESSION_TICKET_SKEW = float(os.environ.get("SESSION_TICKET_SKEW", "30"))
+# Signatures seen within the skew window, to refuse a replayed request
+SESSION_TICKET_REPLAY_CACHE = int(os.environ.get("SESSION_TICKET_REPLAY_CACHE", "100000"))
+
+# ─── World State Settings ──────────────────────────────────────────
+# Roles that materialize contract effects into the resource database. The
+# database tracks the blocks it has applied; STATE_UNDO_DEPTH of them keep
+# before-images for reorg rollback, and every STATE_SNAPSHOT_INTERVAL-th block
+# a snapshot is kept (STATE_SNAPSHOT_KEEP of them) for deeper forks.
+WORLD_STATE_ROLES = {r for r in os.environ.get("WORLD_STATE_ROLES", "provider").split(",") if r}
+STATE_UNDO_DEPTH = int(os.environ.get("STATE_UNDO_DEPTH", "500"))
+STATE_SNAPSHOT_INTERVAL = int(os.environ.get("STATE_SNAPSHOT_INTERVAL", "100"))
+STATE_SNAPSHOT_KEEP = int(os.environ.get("STATE_SNAPSHOT_KEEP", "3"))
+
 # ─── JWT Token Cache ───────────────────────────────────────────────
-_jwt_token_cache = {"token": None, "expires_at": 0}
+class NodeTokenCache:
+    """
+    This node's own issuer token. refresh_loop renews it well before expiry
+    and retries failures with jittered exponential backoff. Readers only look
+    at memory; a miss wakes the refresher, and however many threads miss at
+    once, at most one issuer call is in flight (single-flight).
+    """
+    def __init__(self):
+        self.token = None
+        self.expires_at = 0
+        self.refresh_at = 0      # when the refresher renews a valid token
+        self.retry_at = 0        # earliest retry after a failed fetch
+        self._inflight = None    # Event set when the in-flight fetch finishes
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self.fetches = 0
+        self.fetch_failures = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    def valid(self):
+        return self.token is not None and self.expires_at > time() + JWT_EXPIRY_MARGIN
+
+    def get(self, wait=0):
+        """
+        Return the cached token, or None if there is no usable one. On a miss
+        the refresher is woken; with wait > 0 the caller also joins (or leads)
+        the single in-flight fetch for up to `wait` seconds.
+        """
+        if self.valid():
+            return self.token
+        self.misses += 1
+        self._wake.set()
+        if wait > 0:
+            self.fetch(wait)
+        return self.token if self.valid() else None
+
+    def fetch(self, wait=JWT_FETCH_TIMEOUT):
+        """Fetch a token, or wait for the fetch another thread already started."""
+        with self._lock:
+            inflight = self._inflight
+            leader = inflight is None
+            if leader:
+                inflight = self._inflight = threading.Event()
+            else:
+                self.coalesced += 1
+        if not leader:
+            inflight.wait(wait)
+            return self.valid()
+        try:
+            return self._fetch_from_issuer()
+        finally:
+            with self._lock:
+                self._inflight = None
+            inflight.set()
+
+    def _fetch_from_issuer(self):
+        """One POST /token attempt; never sleeps or retries."""
+        api_key = os.environ.get("NODE_API_KEY", "GxhLsgzHORw1rTDJMX3L2T85i9r52bQlLIhWxpGYjhA=")
+        self.fetches += 1
+        try:
+            resp = requests.post(f"{JWT_ISSUER_URL}/token", headers={"Authorization": f"Bearer {api_key}"},
+                                 timeout=JWT_FETCH_TIMEOUT)
+            if resp.status_code != 200:
+                print(f"[JWT] Failed to get token: {resp.status_code} {resp.text}")
+                self.fetch_failures += 1
+                return False
+            data = resp.json()
+            expires_in = data.get("expires_in", 600)  # Default 10 minutes
+            now = time()
+            self.token = data["token"]
+            self.expires_at = now + expires_in
+            # Renew after about half the lifetime, jittered so pods drift apart
+            self.refresh_at = now + expires_in * JWT_REFRESH_FRACTION * random.uniform(0.8, 1.0)
+            self.retry_at = 0
+            print(f"[JWT] Got fresh token, expires in {expires_in}s")
+            return True
+        except Exception as e:
+            print(f"[JWT] Error getting token from {JWT_ISSUER_URL}: {e}")
+            self.fetch_failures += 1
+            return False
+
+    def refresh_loop(self):
+        backoff = JWT_BACKOFF_BASE
+        while True:
+            now = time()
+            if now >= self.refresh_at or (not self.valid() and now >= self.retry_at):
+                if self.fetch():
+                    backoff = JWT_BACKOFF_BASE
+                else:
+                    self.retry_at = self.refresh_at = time() + random.uniform(backoff / 2, backoff)
+                    backoff = min(backoff * 2, JWT_BACKOFF_MAX)
+            next_at = self.refresh_at if self.valid() else self.retry_at
+            self._wake.wait(max(0.0, next_at - time()))
+            self._wake.clear()
+
+    def metrics(self):
+        return {
+            "valid": self.valid(),
+            "expires_in_s": max(0.0, self.expires_at - time()),
+            "refresh_in_s": max(0.0, self.refresh_at - time()),
+            "fetches": self.fetches,
+            "fetch_failures": self.fetch_failures,
+            "coalesced_waiters": self.coalesced,
+            "misses": self.misses
+        }
+
+_jwt_token_cache = NodeTokenCache()
+
+# ─── Pod Address Cache ─────────────────────────────────────────────
+class AddressCache:
+    """
+    TTL cache of pod FQDN → IP lookups for get_pod_host_port, with negative
+    caching of failed lookups. A background refresher re-resolves entries in
+    use before they expire, so kube-dns latency stays off the request path.
+    Concurrent misses for one name share a single lookup (single-flight).
+    """
+    def __init__(self):
+        self._entries = {}   # fqdn → {"ip": str or None, "expires_at": float, "used": bool}
+        self._inflight = {}  # fqdn → Event set when its in-flight lookup finishes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.resolutions = 0
+        self.resolution_time = 0.0
+        self.failures = 0
+        self.coalesced = 0
+
+    def _lookup(self, fqdn):
+        started = time()
+        try:
+            ip = socket.gethostbyname(fqdn)
+        except socket.gaierror:
+            ip = None
+        elapsed = time() - started
+        with self._lock:
+            self.resolutions += 1
+            self.resolution_time += elapsed
+            if ip is None:
+                self.failures += 1
+            ttl = DNS_CACHE_TTL if ip else DNS_NEGATIVE_TTL
+            used = self._entries.get(fqdn, {}).get("used", True)
+            self._entries[fqdn] = {"ip": ip, "expires_at": time() + ttl, "used": used}
+        return ip
+
+    def resolve(self, fqdn):
+        """Return the cached IP for fqdn (None if it recently failed to resolve)."""
+        with self._lock:
+            entry = self._entries.get(fqdn)
+            if entry and entry["expires_at"] > time():
+                entry["used"] = True
+                if entry["ip"] is None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                return entry["ip"]
+            self.misses += 1
+            inflight = self._inflight.get(fqdn)
+            leader = inflight is None
+            if leader:
+                inflight = self._inflight[fqdn] = threading.Event()
+            else:
+                self.coalesced += 1
+        if not leader:
+            inflight.wait(DNS_LOOKUP_WAIT)
+            with self._lock:
+                entry = self._entries.get(fqdn)
+                if entry and entry["expires_at"] > time():
+                    return entry["ip"]
+            return None
+        try:
+            return self._lookup(fqdn)
+        finally:
+            with self._lock:
+                self._inflight.pop(fqdn, None)
+            inflight.set()
+
+    def invalidate(self, fqdn):
+        with self._lock:
+            self._entries.pop(fqdn, None)
+
+    def refresh_loop(self):
+        """Re-resolve entries used since the last pass; drop entries nobody asked for."""
+        while True:
+            sleep(DNS_REFRESH_INTERVAL)
+            with self._lock:
+                stale = [f for f, e in self._entries.items() if not e["used"]]
+                for fqdn in stale:
+                    del self._entries[fqdn]
+                due = [f for f, e in self._entries.items()
+                       if e["ip"] is not None and e["expires_at"] - time() <= DNS_REFRESH_INTERVAL * 2]
+                for e in self._entries.values():
+                    e["used"] = False
+            for fqdn in due:
+                self._lookup(fqdn)
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.negative_hits) / lookups if lookups else 0,
+                "resolutions": self.resolutions,
+                "resolution_failures": self.failures,
+                "coalesced_misses": self.coalesced,
+                "resolution_time_avg_ms": (self.resolution_time / self.resolutions) * 1000 if self.resolutions else 0
+            }
+
+_address_cache = AddressCache()
+
+# ─── Block Ingress Pipeline ────────────────────────────────────────
+class LatencyHistogram:
+    """Cumulative latency histogram with fixed millisecond buckets."""
+    BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.total = 0.0
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        with self._lock:
+            idx = next((i for i, b in enumerate(self.BUCKETS_MS) if ms <= b), len(self.BUCKETS_MS))
+            self.counts[idx] += 1
+            self.total += ms
+            self.samples += 1
+
+    def to_dict(self):
+        with self._lock:
+            buckets = {f"le_{b}ms": c for b, c in zip(self.BUCKETS_MS, self.counts)}
+            buckets["le_inf"] = self.counts[-1]
+            return {"buckets": buckets, "count": self.samples,
+                    "avg_ms": self.total / self.samples if self.samples else 0}
+
+
+class BlockIngress:
+    """
+    Bounded queue between the block-receiving HTTP handlers and a single
+    worker that validates and commits blocks in arrival order. Handlers only
+    do cheap checks and enqueue; when the queue is full they shed load with
+    503 + Retry-After instead of piling up threads.
+    """
+    def __init__(self, max_size):
+        self.queue = queue.Queue(maxsize=max_size) if max_size > 0 else None
+        self.pending_tip = 0        # highest block index queued or in progress
+        self.enqueued = 0
+        self.rejected = 0
+        self.processed = 0
+        self.stage_latency = {"queue_wait": LatencyHistogram(), "process": LatencyHistogram()}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.queue is not None
+
+    def submit(self, blocks, ttl, relayed_by, fetch_from=None, wait=0):
+        """
+        Queue a block run for the worker. With fetch_from set, blocks are
+        /inv items whose bodies the worker first pulls from that peer.
+        Returns False if the queue is (still, after up to `wait` seconds) full.
+        """
+        try:
+            self.queue.put((blocks, ttl, relayed_by, time(), fetch_from), timeout=wait or None, block=wait > 0)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+            self.pending_tip = max(self.pending_tip, max(b.get('index', 0) for b in blocks))
+        return True
+
+    def expected_next_index(self, chain_tip_index):
+        """Index a pushed block must not exceed to be accepted without a gap."""
+        with self._lock:
+            return max(chain_tip_index, self.pending_tip) + 1
+
+    def worker_loop(self, app):
+        """Validate and commit queued blocks one run at a time, in order."""
+        while True:
+            blocks, ttl, relayed_by, enqueued_at, fetch_from = self.queue.get()
+            started = time()
+            self.stage_latency["queue_wait"].observe(started - enqueued_at)
+            committed = False
+            try:
+                with app.app_context():
+                    if fetch_from:
+                        blocks = fetch_announced_blocks(blocks, fetch_from)
+                    with bc.chain_lock:
+                        if len(blocks) == 1:
+                            _, status = process_incoming_block(blocks[0], ttl=ttl, relayed_by=relayed_by)
+                        elif blocks:
+                            _, status = process_incoming_segment(blocks, ttl=ttl, relayed_by=relayed_by)
+                        else:
+                            status = 200
+                        committed = status < 300
+            except Exception as e:
+                print(f"[INGRESS] Error processing queued block(s): {e}")
+            finally:
+                self.stage_latency["process"].observe(time() - started)
+                with self._lock:
+                    self.processed += 1
+                    if self.queue.empty():
+                        self.pending_tip = 0
+                    elif not committed:
+                        # The run never landed: only the real tip and what is still queued count
+                        queued = [b.get('index', 0) for item in list(self.queue.queue) for b in item[0]]
+                        self.pending_tip = max([bc.last_block['index']] + queued)
+                self.queue.task_done()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "queue_depth": self.queue.qsize() if self.enabled else 0,
+                "queue_capacity": INGRESS_QUEUE_SIZE,
+                "enqueued": self.enqueued,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "stage_latency": {stage: h.to_dict() for stage, h in self.stage_latency.items()}
+            }
+
+_block_ingress = BlockIngress(INGRESS_QUEUE_SIZE)
+
+# ─── Transaction Merkle Tree ───────────────────────────────────────
+# Version 2 blocks carry tx_count and tx_root (the Merkle root of their
+# transactions) and are hashed over these header fields, so a headers-only
+# view can be checked against its hash: each transaction it carries comes
+# with a proof. Blocks without a version field are version 1 and keep the
+# original whole-block hash.
+BLOCK_VERSION = 2
+VIEW_ONLY_FIELDS = ('transactions', 'headers_only', 'block_hash', 'tx_proofs')
+
+def block_version(block):
+    """The block's format version: 1 when it has no version field, None when the field is invalid."""
+    version = block.get('version', 1)
+    return version if type(version) is int and 1 <= version <= BLOCK_VERSION else None
+
+def merkle_leaf(tx):
+    return hashlib.sha256(b"\x00" + json.dumps(tx, sort_keys=True).encode()).hexdigest()
+
+def merkle_node(left, right):
+    return hashlib.sha256(b"\x01" + (left + right).encode()).hexdigest()
+
+def merkle_levels(transactions):
+    """All levels of the tree, leaves first; an odd last node is paired with itself."""
+    levels = [[merkle_leaf(tx) for tx in transactions]]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        levels.append([merkle_node(level[i], level[min(i + 1, len(level) - 1)]) for i in range(0, len(level), 2)])
+    return levels
+
+def merkle_root(transactions):
+    if not transactions:
+        return hashlib.sha256(b"").hexdigest()
+    return merkle_levels(transactions)[-1][0]
+
+def merkle_proof(levels, index):
+    """{"index", "path"} proving leaf `index`: its sibling on every level below the root."""
+    path, position = [], index
+    for level in levels[:-1]:
+        path.append(level[min(position ^ 1, len(level) - 1)])
+        position //= 2
+    return {"index": index, "path": path}
+
+def verify_merkle_proof(tx, proof, tx_count, root):
+    """True when `proof` places `tx` at its index in a tree of tx_count leaves with this root."""
+    try:
+        position, path = int(proof["index"]), list(proof["path"])
+        tx_count = int(tx_count)
+    except (KeyError, TypeError, ValueError):
+        return False
+    if not 0 <= position < tx_count or not all(isinstance(h, str) for h in path):
+        return False
+    node, width = merkle_leaf(tx), tx_count
+    for sibling in path:
+        if width == 1:
+            return False  # longer path than the tree is deep
+        if position % 2:
+            node = merkle_node(sibling, node)
+        elif position == width - 1 and sibling != node:
+            return False  # an odd last node can only be paired with itself
+        else:
+            node = merkle_node(node, sibling)
+        position //= 2
+        width = (width + 1) // 2
+    return width == 1 and node == root
+
+
+# ─── Block Stream Hub ──────────────────────────────────────────────
+def normalize_block_filter(raw):
+    """Keep only known filter keys from a dict / query args, with city_id bounds as ints."""
+    block_filter = {}
+    for key in BLOCK_FILTER_KEYS:
+        value = raw.get(key) if raw else None
+        if value in (None, ""):
+            continue
+        try:
+            block_filter[key] = int(value) if key.startswith("city_id") else str(value)
+        except (TypeError, ValueError):
+            continue
+    return block_filter
+
+def block_filter_from_env():
+    return normalize_block_filter({key: os.environ.get(f"BLOCK_FILTER_{key.upper()}") for key in BLOCK_FILTER_KEYS})
+
+def block_view(block, mode="full", filters=None):
+    """
+    Shape a block for a subscriber or filtered peer. mode="full" sends the
+    block as is; mode="headers" sends the header fields plus only the
+    transactions matching `filters` (contract_id / authority / city_id range),
+    each with a Merkle proof against the block's tx_root so the receiver can
+    check them. Version 1 blocks have no tx_root to prove against, so they are
+    always sent whole and stay verifiable by their hash.
+    """
+    if mode != "headers" or block.get('headers_only') or block_version(block) != 2:
+        return block
+    filters = filters or {}
+    def matches(tx):
+        payload = tx.get('contract_payload', {})
+        if filters.get('contract_id') and tx.get('contract_id') != filters['contract_id']:
+            return False
+        if filters.get('authority') and payload.get('authority') != filters['authority']:
+            return False
+        if 'city_id_min' in filters or 'city_id_max' in filters:
+            try:
+                city_id = int(payload.get('city_id'))
+            except (TypeError, ValueError):
+                return False
+            if city_id < filters.get('city_id_min', city_id) or city_id > filters.get('city_id_max', city_id):
+                return False
+        return bool(filters) or 'contract_id' in tx
+    transactions = block.get('transactions', [])
+    view = {k: v for k, v in block.items() if k != 'transactions'}
+    view['tx_count'] = len(transactions)
+    matched = [i for i, tx in enumerate(transactions) if matches(tx)]
+    view['transactions'] = [transactions[i] for i in matched]
+    levels = merkle_levels(transactions)
+    view['tx_proofs'] = [merkle_proof(levels, i) for i in matched]
+    view['block_hash'] = Blockchain.hash(block)
+    view['headers_only'] = True
+    return view
+
+
+class BlockStreamHub:
+    """
+    Fan-out of newly appended blocks to /blocks/stream subscribers. Each
+    subscriber has a bounded queue; a subscriber that falls too far behind is
+    dropped and resumes from its last index when it reconnects.
+    """
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=BLOCK_STREAM_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, block):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(block)
+            except queue.Full:
+                # Too slow: close its stream, it will reconnect and resume
+                self.unsubscribe(q)
+                try:
+                    q.get_nowait()
+                    q.put_nowait(None)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def __len__(self):
+        return len(self._subscribers)
+
+_block_stream = BlockStreamHub()
+
+# ─── Seen Block Cache ──────────────────────────────────────────────
+class SeenBlockCache:
+    """
+    Bounded LRU set of recently seen block hashes. Lets /receive_block drop
+    gossip duplicates before doing any validation work.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._hashes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, block_hash):
+        with self._lock:
+            if block_hash in self._hashes:
+                self._hashes.move_to_end(block_hash)
+                return True
+            return False
+
+    def add(self, block_hash):
+        with self._lock:
+            self._hashes[block_hash] = True
+            self._hashes.move_to_end(block_hash)
+            while len(self._hashes) > self.max_size:
+                self._hashes.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._hashes)
+
+# ─── Verified Token Cache ──────────────────────────────────────────
+class VerifiedTokenCache:
+    """
+    Bounded LRU of tokens that already passed signature verification, keyed
+    by SHA-256 digest. An entry lives until the token's own exp claim, so a
+    peer reusing its token only pays for the RS256 check once.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # digest → (payload, exp)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.verifications = 0
+        self.verify_time = 0.0
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token):
+        """Return the cached payload for token, or None if unknown or expired."""
+        digest = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry and entry[1] > time():
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[digest]
+            self.misses += 1
+            return None
+
+    def put(self, token, payload, verify_seconds):
+        """Remember a freshly verified token and how long verifying it took."""
+        with self._lock:
+            self.verifications += 1
+            self.verify_time += verify_seconds
+            exp = payload.get('exp')
+            if not isinstance(exp, (int, float)):
+                return
+            digest = self._digest(token)
+            self._entries[digest] = (payload, exp)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg = self.verify_time / self.verifications if self.verifications else 0
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0,
+                "verifications": self.verifications,
+                "verify_time_avg_ms": avg * 1000,
+                "verify_time_saved_ms": self.hits * avg * 1000
+            }
+
+# ─── JWKS Cache ────────────────────────────────────────────────────
+class JWKSCache:
+    """
+    Local copy of the issuer's JWKS, keyed by kid. A background loop refreshes
+    it every JWKS_REFRESH_INTERVAL seconds, or early when a token names a kid we
+    do not know yet (no more often than JWKS_MIN_REFRESH_INTERVAL). Lookups only
+    read memory, so verification never waits on the issuer during a rotation.
+    """
+    def __init__(self, url):
+        self.url = url
+        self._keys = {}  # kid → (key object, alg)
+        self._wake = threading.Event()
+        self._last_refresh = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.unknown_kids = 0
+
+    def get(self, kid):
+        """Return (key, alg) for kid, or None and schedule an early refresh."""
+        entry = self._keys.get(kid)
+        if entry is None:
+            self.unknown_kids += 1
+            self._wake.set()
+        return entry
+
+    def refresh(self):
+        """Fetch the JWKS and swap it in; return the kids that were retired."""
+        self._last_refresh = time()
+        r = requests.get(self.url, timeout=5)
+        r.raise_for_status()
+        algorithms = jwt.algorithms.get_default_algorithms()
+        keys = {}
+        for jwk_dict in r.json().get("keys", []):
+            kid, alg = jwk_dict.get("kid"), jwk_dict.get("alg", "RS256")
+            if not kid or alg not in algorithms:
+                continue
+            try:
+                keys[kid] = (algorithms[alg].from_jwk(jwk_dict), alg)
+            except Exception as e:
+                print(f"[JWKS] Skipping key {kid}: {e}")
+        retired = set(self._keys) - set(keys)
+        self._keys = keys
+        self.refreshes += 1
+        return retired
+
+    def refresh_loop(self):
+        while True:
+            try:
+                retired = self.refresh()
+                if retired and bc is not None:
+                    # Tokens signed by a retired key must be verified again
+                    bc.verified_tokens.clear()
+                    print(f"[JWKS] Retired keys {sorted(retired)}")
+            except Exception as e:
+                self.refresh_failures += 1
+                print(f"[JWKS] Refresh from {self.url} failed: {e}")
+            self._wake.wait(JWKS_REFRESH_INTERVAL)
+            self._wake.clear()
+            sleep(max(0, self._last_refresh + JWKS_MIN_REFRESH_INTERVAL - time()))
+
+    def metrics(self):
+        return {
+            "kids": sorted(self._keys),
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "unknown_kids": self.unknown_kids,
+            "last_refresh_age_s": time() - self._last_refresh if self._last_refresh else None
+        }
+
+_jwks_cache = JWKSCache(JWKS_URL)
+
+# ─── Peer Session Tickets ──────────────────────────────────────────
+class SessionTickets:
+    """
+    Symmetric session tickets between peers, both sides of the exchange.
+
+    Server side: once a peer's JWT verifies, issue() returns an opaque ticket
+    (peer IP, sub, scope, expiry capped at the JWT's exp) and its key,
+    HMAC(secret, ticket), where the secret lives only in this process. The
+    ticket is stateless, so verify() just re-derives the key. Requests are
+    signed over method, path, canonical query string, timestamp, a random
+    nonce and body digest, which stops a captured call being replayed with
+    other query arguments, another body or after SESSION_TICKET_SKEW; within
+    the skew window, signatures already seen are refused.
+
+    Client side: tickets received from each peer are kept per peer address and
+    used by peer_request in place of the bearer JWT until shortly before expiry.
+    """
+    def __init__(self):
+        self._secret = os.urandom(32)
+        self._held = {}  # peer → (ticket, key bytes, exp)
+        self._seen = OrderedDict()  # signature → time it stops being accepted, oldest first
+        self._seen_lock = threading.Lock()
+        self.issued = 0
+        self.verified = 0
+        self.rejected = 0
+        self.replays = 0
+        self.used = 0
+        self.fallbacks = 0
+
+    @staticmethod
+    def canonical_query(pairs):
+        """Query (key, value) pairs as one string, independent of their order."""
+        return urlencode(sorted((str(k), str(v)) for k, v in pairs))
+
+    @staticmethod
+    def query_pairs(path, params):
+        """The (key, value) pairs requests will send: the path's own query plus `params`."""
+        pairs = parse_qsl(urlparse(path).query, keep_blank_values=True)
+        if isinstance(params, (str, bytes)):
+            params = parse_qsl(params.decode() if isinstance(params, bytes) else params, keep_blank_values=True)
+        for key, value in (params.items() if isinstance(params, dict) else params or []):
+            for v in (value if isinstance(value, (list, tuple)) else [value]):
+                if v is not None:
+                    pairs.append((key, v))
+        return pairs
+
+    @staticmethod
+    def signature(key, method, path, query, timestamp, nonce, body):
+        message = "\n".join([method.upper(), path, query, timestamp, nonce, hashlib.sha256(body or b"").hexdigest()])
+        return hmac.new(key, message.encode(), hashlib.sha256).hexdigest()
+
+    def _key_for(self, ticket):
+        return hmac.new(self._secret, ticket.encode(), hashlib.sha256).digest()
+
+    # Server side
+    def issue(self, peer_ip, payload):
+        """Return (ticket, key, exp) for a peer whose JWT payload just verified."""
+        exp = min(payload.get('exp', 0), time() + SESSION_TICKET_TTL)
+        claims = {"ip": peer_ip, "sub": payload.get('sub'), "scope": payload.get('scope', ''), "exp": exp}
+        ticket = base64.urlsafe_b64encode(json.dumps(claims, separators=(",", ":")).encode()).decode()
+        self.issued += 1
+        return ticket, self._key_for(ticket), exp
+
+    def first_use(self, sig, timestamp):
+        """
+        Record a signature until its timestamp leaves the skew window. False if
+        it was already used, or if the cache is full of live signatures (the
+        caller then falls back to its JWT).
+        """
+        now = time()
+        with self._seen_lock:
+            while self._seen and next(iter(self._seen.values())) <= now:
+                self._seen.popitem(last=False)
+            if sig in self._seen or len(self._seen) >= SESSION_TICKET_REPLAY_CACHE:
+                return False
+            self._seen[sig] = timestamp + SESSION_TICKET_SKEW
+            return True
+
+    def verify(self, ticket, timestamp, nonce, sig, method, path, query, body, peer_ip, required_scope=None):
+        """
+        Return the ticket's claims if the signed request checks out and was
+        not seen before, else None. query is the request's (key, value) argument pairs.
+        """
+        try:
+            claims = json.loads(base64.urlsafe_b64decode(ticket.encode()))
+            expected = self.signature(self._key_for(ticket), method, path, self.canonical_query(query),
+                                      timestamp, nonce, body)
+            ok = (hmac.compare_digest(expected, sig or "")
+                  and claims.get("ip") == peer_ip
+                  and claims.get("exp", 0) > time()
+                  and abs(time() - float(timestamp)) <= SESSION_TICKET_SKEW
+                  and (not required_scope or required_scope in claims.get("scope", "").split()))
+        except (ValueError, TypeError):
+            ok = False
+        if not ok:
+            self.rejected += 1
+            return None
+        # The signature covers the ticket, timestamp and nonce, so it identifies the request
+        if not self.first_use(sig, float(timestamp)):
+            self.replays += 1
+            self.rejected += 1
+            return None
+        self.verified += 1
+        return claims
+
+    # Client side
+    def remember(self, peer, response):
+        """Keep the ticket a peer attached to its response, if any."""
+        ticket = response.headers.get("X-Session-Ticket")
+        if ticket:
+            try:
+                key = base64.b64decode(response.headers["X-Session-Key"])
+                exp = float(response.headers["X-Session-Ticket-Expires"])
+            except (KeyError, ValueError):
+                return
+            self._held[peer] = (ticket, key, exp)
+
+    def forget(self, peer):
+        if self._held.pop(peer, None):
+            self.fallbacks += 1
+
+    def authorize(self, peer, method, path, kwargs):
+        """
+        Rewrite bearer-authenticated request kwargs for peer: sign with our
+        ticket if we hold a live one, else keep the JWT and ask for a ticket.
+        Returns (kwargs, used_ticket).
+        """
+        headers = dict(kwargs.get('headers') or {})
+        held = self._held.get(peer)
+        if not held or held[2] <= time() + 2:
+            headers["X-Session-Ticket-Request"] = "1"
+            return dict(kwargs, headers=headers), False
+        ticket, key, _ = held
+        kwargs = dict(kwargs)
+        if 'json' in kwargs:
+            kwargs['data'] = json.dumps(kwargs.pop('json')).encode()
+            headers["Content-Type"] = "application/json"
+        timestamp = f"{time():.3f}"
+        nonce = os.urandom(8).hex()
+        headers.pop("Authorization", None)
+        headers.update({
+            "Authorization": f"Ticket {ticket}",
+            "X-Ticket-Time": timestamp,
+            "X-Ticket-Nonce": nonce,
+            "X-Ticket-Signature": self.signature(
+                key, method, path.split('?', 1)[0], self.canonical_query(self.query_pairs(path, kwargs.get('params'))),
+                timestamp, nonce, kwargs.get('data'))
+        })
+        kwargs['headers'] = headers
+        self.used += 1
+        return kwargs, True
+
+    def metrics(self):
+        return {
+            "enabled": SESSION_TICKETS,
+            "issued": self.issued,
+            "verified": self.verified,
+            "rejected": self.rejected,
+            "replays_rejected": self.replays,
+            "replay_cache_size": len(self._seen),
+            "held": len(self._held),
+            "used": self.used,
+            "fallbacks_to_jwt": self.fallbacks
+        }
+
+_session_tickets = SessionTickets()
+
+# ─── World State Engine ────────────────────────────────────────────
+class WorldState:
+    """
+    Keeps the resource database equal to the contract effects of our chain.
+    sync() finds the newest applied block that is still on the chain, rolls
+    the database back to it and replays only the blocks after it. When the
+    fork is older than the undo history, the newest snapshot still on the
+    chain is restored first, so a rebuild never replays from genesis. Updates
+    the provider endpoints made after the fork are written back before the
+    replay rather than lost with the abandoned blocks.
+    """
+    def __init__(self, blockchain):
+        self.bc = blockchain
+        self.active = False
+        self._lock = threading.Lock()
+        self.applied_index = None
+        self.applied_hash = None
+        self.blocks_applied = 0
+        self.blocks_rolled_back = 0
+        self.rows_changed = 0
+        self.snapshots_taken = 0
+        self.snapshot_restores = 0
+        self.direct_writes_reapplied = 0
+        self.reorgs = 0
+        self.errors = 0
+        self.last_sync_seconds = 0
+
+    def attach(self, role):
+        """Start materializing our chain; nodes outside WORLD_STATE_ROLES never touch the DB."""
+        if role not in WORLD_STATE_ROLES:
+            return False
+        if not resource_db.database_exists():
+            print(f"[WORLD_STATE] DB not found at {resource_db.DB_PATH}, state engine disabled")
+            return False
+        resource_db.ensure_state_tables()
+        self.active = True
+        self.sync()
+        return True
+
+    def _chain_hash(self, chain, block_index):
+        if block_index == resource_db.BASE_STATE_INDEX:
+            return ""
+        pos = block_index - chain[0]['index']
+        if 0 <= pos < len(chain) and chain[pos]['index'] == block_index:
+            return self.bc.hash(chain[pos])
+        return None
+
+    def sync(self):
+        """Bring the database to the tip of bc.chain; return the number of blocks replayed, or None."""
+        if not self.active:
+            return None
+        with self._lock:
+            started = time()
+            chain = list(self.bc.chain)
+            touched, restored, rolled_back, replayed, changed, reapplied = set(), False, 0, 0, 0, []
+            try:
+                # Queued endpoint updates were acknowledged first, so they land first
+                resource_db.flush_write_behind()
+                with resource_db.transaction(immediate=True) as conn:
+                    history = resource_db.state_history(conn)
+                    fork = next((index for index, block_hash in history
+                                 if self._chain_hash(chain, index) == block_hash), None)
+                    if fork is None:
+                        snapshot = next((snap for snap in resource_db.state_snapshots(conn)
+                                         if self._chain_hash(chain, snap[1]) == snap[2]), None)
+                        if snapshot is None:
+                            raise RuntimeError("no applied block or snapshot lies on our chain")
+                        fork, _ = resource_db.restore_snapshot(conn, snapshot[0])
+                        restored = True
+                        # The snapshot predates every endpoint update filed at its block or later
+                        reapplied = resource_db.reapply_direct_writes(conn, fork, fork)
+                    elif history[0][0] > fork:
+                        rolled_back = sum(1 for index, _ in history if index > fork)
+                        touched |= resource_db.rollback_state(conn, fork)
+                        reapplied = resource_db.reapply_direct_writes(conn, fork + 1, fork)
+                    touched.update(reapplied)
+
+                    for block in chain:
+                        if block['index'] <= fork:
+                            continue
+                        updates = self.bc.contract_allocations(block)
+                        block_hash = self.bc.hash(block)
+                        changed += resource_db.apply_block_state(conn, block['index'], block_hash, updates)
+                        touched.update(updates)
+                        replayed += 1
+                        if STATE_SNAPSHOT_INTERVAL and block['index'] % STATE_SNAPSHOT_INTERVAL == 0:
+                            resource_db.take_snapshot(conn, block['index'], block_hash, keep=STATE_SNAPSHOT_KEEP)
+                            self.snapshots_taken += 1
+                    if replayed:
+                        resource_db.prune_state(conn, chain[-1]['index'] - STATE_UNDO_DEPTH)
+            except Exception as e:
+                self.errors += 1
+                print(f"[WORLD_STATE] Sync failed, state left at block {self.applied_index}: {e}")
+                return None
+            finally:
+                resource_db.invalidate_cities(None if restored else touched)
+
+            self.applied_index = chain[-1]['index']
+            self.applied_hash = self.bc.hash(chain[-1])
+            self.blocks_applied += replayed
+            self.blocks_rolled_back += rolled_back
+            self.rows_changed += changed
+            self.snapshot_restores += restored
+            self.direct_writes_reapplied += len(reapplied)
+            self.reorgs += bool(rolled_back or restored)
+            self.last_sync_seconds = time() - started
+            if rolled_back or restored:
+                how = "restored snapshot" if restored else f"rolled back {rolled_back} blocks"
+                print(f"[WORLD_STATE] Reorg: {how} to block {fork}, re-applied {len(reapplied)} endpoint "
+                      f"updates, replayed {replayed} blocks")
+            elif replayed:
+                print(f"[WORLD_STATE] Applied {replayed} blocks ({changed} rows), tip {self.applied_index}")
+            return replayed
+
+    def metrics(self):
+        return {
+            "active": self.active,
+            "applied_index": self.applied_index,
+            "applied_hash": self.applied_hash,
+            "blocks_applied": self.blocks_applied,
+            "blocks_rolled_back": self.blocks_rolled_back,
+            "rows_changed": self.rows_changed,
+            "reorgs": self.reorgs,
+            "snapshots_taken": self.snapshots_taken,
+            "snapshot_restores": self.snapshot_restores,
+            "direct_writes_reapplied": self.direct_writes_reapplied,
+            "errors": self.errors,
+            "last_sync_seconds": self.last_sync_seconds
+        }
+
+
+# ─── Peer Health Table ─────────────────────────────────────────────
+class PeerUnavailable(requests.exceptions.RequestException):
+    """Raised instead of dialing a peer whose circuit breaker is open."""
+
+
+class PeerHealth:
+    """
+    Per-peer RTT EWMA (one per endpoint class: "read" or "write"), failure-rate
+    EWMA and last success time, fed by every outbound peer call. Drives
+    adaptive timeouts, a circuit breaker that skips known-bad peers for a
+    backoff window, and fastest-first peer ordering (by read RTT).
+    """
+    RTT_KEYS = {"read": "rtt_ewma", "write": "write_rtt_ewma"}
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, peer):
+        return self._stats.setdefault(peer, {
+            "rtt_ewma": None,
+            "write_rtt_ewma": None,
+            "failure_rate": 0.0,
+            "consecutive_failures": 0,
+            "last_success": None,
+            "open_until": 0.0
+        })
+
+    def record_success(self, peer, rtt, kind="read"):
+        key = self.RTT_KEYS[kind]
+        with self._lock:
+            e = self._entry(peer)
+            e[key] = rtt if e[key] is None else PEER_RTT_ALPHA * rtt + (1 - PEER_RTT_ALPHA) * e[key]
+            e["failure_rate"] = (1 - PEER_RTT_ALPHA) * e["failure_rate"]
+            e["consecutive_failures"] = 0
+            e["last_success"] = time()
+            e["open_until"] = 0.0
+
+    def record_failure(self, peer):
+        with self._lock:
+            e = self._entry(peer)
+            e["failure_rate"] = PEER_RTT_ALPHA + (1 - PEER_RTT_ALPHA) * e["failure_rate"]
+            e["consecutive_failures"] += 1
+            excess = e["consecutive_failures"] - PEER_BREAKER_THRESHOLD
+            if excess >= 0:
+                backoff = min(PEER_BREAKER_BASE_BACKOFF * (2 ** excess), PEER_BREAKER_MAX_BACKOFF)
+                e["open_until"] = time() + backoff
+
+    def is_available(self, peer):
+        """False while the peer's breaker is open; after the window one trial call is let through."""
+        with self._lock:
+            e = self._stats.get(peer)
+            return e is None or e["open_until"] <= time()
+
+    def consecutive_failures(self, peer):
+        with self._lock:
+            e = self._stats.get(peer)
+            return e["consecutive_failures"] if e else 0
+
+    def timeout_for(self, peer, default, kind="read"):
+        key = self.RTT_KEYS[kind]
+        with self._lock:
+            e = self._stats.get(peer)
+            if not e or e[key] is None:
+                return default
+            return min(default, max(PEER_TIMEOUT_MIN, e[key] * PEER_TIMEOUT_RTT_MULTIPLIER))
+
+    def is_healthy(self, peer, within):
+        """True if the peer answered a call in the last `within` seconds."""
+        with self._lock:
+            e = self._stats.get(peer)
+            return bool(e and e["last_success"] and time() - e["last_success"] <= within)
+
+    def rank(self, peers):
+        """Return available peers ordered fastest-first; peers without samples go last, in input order."""
+        with self._lock:
+            def key(peer):
+                e = self._stats.get(peer)
+                rtt = e["rtt_ewma"] if e and e["rtt_ewma"] is not None else float("inf")
+                return (rtt, e["failure_rate"] if e else 0.0)
+            now = time()
+            available = [p for p in peers if p not in self._stats or self._stats[p]["open_until"] <= now]
+            return sorted(available, key=key)
+
+    def forget(self, peer):
+        with self._lock:
+            self._stats.pop(peer, None)
+
+    def prune(self, keep):
+        """Drop stats for every peer not in keep (e.g. probed candidates that never registered)."""
+        with self._lock:
+            stale = [peer for peer in self._stats if peer not in keep]
+            for peer in stale:
+                del self._stats[peer]
+            return len(stale)
+
+    def export(self, peer):
+        """Persistable stats for one peer (see save_peer_table)."""
+        with self._lock:
+            e = self._stats.get(peer)
+            if not e:
+                return {}
+            return {"rtt_ewma": e["rtt_ewma"], "failure_rate": e["failure_rate"], "last_success": e["last_success"]}
+
+    def seed(self, peer, stats):
+        """Restore persisted stats for a peer we have no fresher data on."""
+        with self._lock:
+            if peer in self._stats or not stats:
+                return
+            e = self._entry(peer)
+            e["rtt_ewma"] = stats.get("rtt_ewma")
+            e["failure_rate"] = stats.get("failure_rate", 0.0)
+            e["last_success"] = stats.get("last_success")
+
+    def snapshot(self):
+        with self._lock:
+            now = time()
+            return {
+                peer: {
+                    "rtt_ewma_ms": round(e["rtt_ewma"] * 1000, 2) if e["rtt_ewma"] is not None else None,
+                    "write_rtt_ewma_ms": round(e["write_rtt_ewma"] * 1000, 2) if e["write_rtt_ewma"] is not None else None,
+                    "failure_rate": round(e["failure_rate"], 3),
+                    "consecutive_failures": e["consecutive_failures"],
+                    "last_success": e["last_success"],
+                    "circuit_open": e["open_until"] > now
+                }
+                for peer, e in self._stats.items()
+            }
 
 # ─── Blockchain Class ──────────────────────────────────────────────
 class Blockchain:
     def __init__(self):
         self.master_peers = set()      # set of all known master peer addresses (excluding ourselves)
         self.chain = []
+        self.block_positions = {}      # block hash → position in self.chain, for find_block
+        self.chain_lock = threading.RLock()  # held across "check the tip, then change the chain"
         self.current_transactions = []
         self.nodes = set()             # peer addresses (host:port)
         self.peers_roles = {}          # peer_address → role string
+        self.peer_filters = {}         # peer_address → block filter it registered with
+        self.block_filter = block_filter_from_env()  # our own filter ({} = full blocks)
+        self.peers_version = 0         # bumped on every peer table change
+        self.peer_changes = deque(maxlen=PEER_CHANGELOG_SIZE)  # (version, address, role or None if removed)
         self.local_node = None         # this node's own address (host:port)
         self.bootstrap_node = None     # will store BOOTSTRAP_HOST
         self.mining_in_progress = False
         self.users = {}
+        self.seen_blocks = SeenBlockCache(SEEN_BLOCK_CACHE_SIZE)
+        self.best_known_length = 0  # longest tip any peer reported to fetch_best_chain
+        self.peer_health = PeerHealth()
         # ─── Block Propagation State ─────────────────────────────────────────────
         self.startTime = []
         self.chainSyncedTime = []
@@ -35,15 +1255,22 @@ class Blockchain:
         self.dataReceivedAtProviderTime = []
         self.endTime = []
         # JWT Configuration
-        self.public_key_path = "/secrets/public.pem"
+        self.public_key_path = JWT_PUBLIC_KEY_PATH
+        self._public_key = None          # parsed key object, not PEM text
+        self._public_key_alg = 'RS256'   # ES256 / EdDSA when the issuer signs with those keys
+        self._public_key_mtime = None
+        self._public_key_checked = 0
+        self.verified_tokens = VerifiedTokenCache(JWT_VERIFY_CACHE_SIZE)
+        self.world_state = WorldState(self)  # attached once the node has joined
         # Creating the genesis block
         self.new_block(previous_hash='1', proof=100, mined_by="Genesis", transactions=[], timestamp=time())
 
     # ─── NODE REGISTRATION / ROLES ───────────────────────────────────────────────
-    def register_node(self, address, is_local=False):
+    def register_node(self, address, is_local=False, role=None):
         """
         Register a new node by its address. If is_local=True, that is this node.
-        Otherwise, add to the peer set (excluding our own address).
+        Otherwise, add to the peer set (excluding our own address). Passing the
+        peer's role records it with the addition, as one peer change.
         """
         parsed = urlparse(address if address.startswith('http') else f"http://{address}")
         node_address = parsed.netloc
@@ -53,11 +1280,48 @@ class Blockchain:
             print(f"Registered local node as: {self.local_node}")
         else:
             if node_address != self.local_node and node_address not in self.nodes:
+                if role:
+                    self.peers_roles[node_address] = role
                 self.nodes.add(node_address)
-                print(f"Added remote node: {node_address}")
+                self._record_peer_change(node_address, self.peers_roles.get(node_address, "unknown"))
+                print(f"Added remote node: {node_address} ({self.peers_roles.get(node_address, 'unknown')})")
+            if role and node_address != self.local_node:
+                self.set_peer_role(node_address, role)
+
+    def remove_node(self, address):
+        """Forget a peer entirely (peer set, role and master set)."""
+        if address in self.nodes:
+            self._record_peer_change(address, None)
+        self.nodes.discard(address)
+        self.peers_roles.pop(address, None)
+        self.peer_filters.pop(address, None)
+        self.master_peers.discard(address)
+
+    def _record_peer_change(self, address, role):
+        self.peers_version += 1
+        self.peer_changes.append((self.peers_version, address, role))
+
+    def peer_delta(self, since):
+        """
+        Return (added, removed) peer changes after version `since`, or None if
+        the change log no longer reaches back that far (caller sends the full list).
+        """
+        if since > self.peers_version:
+            return None
+        if since < self.peers_version and (not self.peer_changes or self.peer_changes[0][0] > since + 1):
+            return None
+        latest = {}
+        for version, address, role in list(self.peer_changes):
+            if version > since:
+                latest[address] = role
+        added = [self.peer_info(a) for a, r in latest.items() if r is not None and a in self.nodes]
+        removed = [a for a, r in latest.items() if r is None and a not in self.nodes]
+        return added, removed
 
     def set_peer_role(self, address, role):
         """Record a peer's role (e.g. 'provider', 'requester', 'user_contract', 'master')."""
+        if address != self.local_node and address in self.nodes and self.peers_roles.get(address) != role:
+            self._record_peer_change(address, role)
         self.peers_roles[address] = role
         # Maintain master_peers set
         if role == "master" and address != self.local_node:
@@ -65,15 +1329,82 @@ class Blockchain:
         elif address in self.master_peers:
             self.master_peers.discard(address)
 
+    def peer_info(self, address):
+        """Peer entry as exchanged in /nodes and /nodes/register responses."""
+        info = {"address": address, "role": self.peers_roles.get(address, "unknown")}
+        if self.peer_filters.get(address):
+            info["filter"] = self.peer_filters[address]
+        return info
+
+    def set_peer_filter(self, address, block_filter):
+        """Record the block filter a peer registered with (empty = full blocks)."""
+        block_filter = normalize_block_filter(block_filter)
+        if block_filter:
+            self.peer_filters[address] = block_filter
+        else:
+            self.peer_filters.pop(address, None)
+
+    def block_for_peer(self, peer, block):
+        """The block as a given peer asked to receive it: full, or its filtered headers view."""
+        block_filter = self.peer_filters.get(peer)
+        return block_view(block, "headers", block_filter) if block_filter else block
+
+    def save_peer_table(self, path):
+        """
+        Write the peer table (address, role, filter, health stats, last seen) to
+        `path` atomically. Best effort: a missing or read-only volume is logged.
+        """
+        # Include ourselves: replicas sharing the volume (e.g. providers on Filestore) can rejoin via us
+        peers = [dict(self.peer_info(self.local_node), health={}, last_seen=time())] if self.local_node else []
+        for addr in self.get_node_addresses():
+            entry = self.peer_info(addr)
+            entry["health"] = self.peer_health.export(addr)
+            entry["last_seen"] = entry["health"].get("last_success")
+            peers.append(entry)
+        try:
+            directory = os.path.dirname(path) or "."
+            os.makedirs(directory, exist_ok=True)
+            # A unique temp name: PIDs repeat across pods sharing the volume
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump({"saved_at": time(), "local": self.local_node, "peers": peers}, f)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            print(f"[PEER_TABLE] Could not save peer table to {path}: {e}")
+
     def get_node_addresses(self):
         """Return a list of all peer addresses (excluding ourselves)."""
         return [n for n in self.nodes if n != self.local_node]
 
     def load_public_key(self):
-        """Load the RSA public key for JWT verification."""
+        """
+        Return the parsed RSA public key for JWT verification. The file is
+        stat'ed at most every JWT_KEY_CHECK_INTERVAL seconds and re-parsed only
+        when its mtime changes, which also drops every cached verification.
+        """
+        now = time()
+        if self._public_key is not None and now - self._public_key_checked < JWT_KEY_CHECK_INTERVAL:
+            return self._public_key
+        self._public_key_checked = now
         try:
-            with open(self.public_key_path, 'r') as f:
-                return f.read()
+            mtime = os.stat(self.public_key_path).st_mtime
+            if self._public_key is None or mtime != self._public_key_mtime:
+                with open(self.public_key_path, 'rb') as f:
+                    self._public_key = serialization.load_pem_public_key(f.read())
+                if isinstance(self._public_key, ec.EllipticCurvePublicKey):
+                    self._public_key_alg = 'ES256'
+                elif isinstance(self._public_key, ed25519.Ed25519PublicKey):
+                    self._public_key_alg = 'EdDSA'
+                else:
+                    self._public_key_alg = 'RS256'
+                self._public_key_mtime = mtime
+                self.verified_tokens.clear()
+                print(f"[JWT] Loaded public key from {self.public_key_path}")
+            return self._public_key
         except FileNotFoundError:
             print(f"WARNING: Public key not found at {self.public_key_path}")
             return None
@@ -93,18 +1424,28 @@ class Blockchain:
             dict: Decoded payload if valid, None if invalid
         """
         try:
-            public_key = self.load_public_key()
-            if not public_key:
-                return None
-            
-            # Decode and verify JWT
-            payload = jwt.decode(
-                token,
-                public_key,
-                algorithms=['RS256'],
-                audience='blockchain-master',
-                issuer='blockchain-node-issuer'
-            )
+            # Reuse an earlier verification of the same token until it expires
+            payload = self.verified_tokens.get(token)
+            if payload is None:
+                # Pick the key named by the token's kid from the JWKS cache,
+                # falling back to the mounted PEM for tokens without one
+                kid = jwt.get_unverified_header(token).get('kid')
+                jwk_entry = _jwks_cache.get(kid) if kid else None
+                if jwk_entry:
+                    public_key, alg = jwk_entry
+                else:
+                    public_key, alg = self.load_public_key(), self._public_key_alg
+                    if not public_key:
+                        return None
+                started = time()
+                payload = jwt.decode(
+                    token,
+                    public_key,
+                    algorithms=[alg],
+                    audience='blockchain-master',
+                    issuer='blockchain-node-issuer'
+                )
+                self.verified_tokens.put(token, payload, time() - started)
             
             # Check scope if required
             if required_scope:
@@ -136,11 +1477,21 @@ class Blockchain:
             dict: JWT payload if valid, None if invalid
         """
         auth_header = request.headers.get('Authorization')
+        if SESSION_TICKETS and auth_header and auth_header.startswith('Ticket '):
+            return _session_tickets.verify(
+                auth_header.split(' ')[1], request.headers.get('X-Ticket-Time', ''),
+                request.headers.get('X-Ticket-Nonce', ''), request.headers.get('X-Ticket-Signature'),
+                request.method, request.path,
+                request.args.items(multi=True), request.get_data(), request.remote_addr, required_scope)
         if not auth_header or not auth_header.startswith('Bearer '):
             return None
         
         jwt_token = auth_header.split(' ')[1]
-        return self.verify_jwt_token(jwt_token, required_scope)
+        payload = self.verify_jwt_token(jwt_token, required_scope)
+        if payload and SESSION_TICKETS and request.headers.get('X-Session-Ticket-Request'):
+            # Attached to the response by attach_session_ticket
+            g.session_ticket = _session_tickets.issue(request.remote_addr, payload)
+        return payload
 
     # ─── CONSENSUS / VALIDATION ─────────────────────────────────────────────────
     def valid_chain(self, chain):
@@ -148,6 +1499,8 @@ class Blockchain:
         Check that a given chain is valid:
         - Each block's previous_hash matches the SHA-256 of the prior block.
         - Each proof matches valid_proof(prev_proof, proof).
+        - Each block has a known version, and a version 2 block's transactions
+          (or a view's proofs) match its tx_root.
         """
         if not chain:
             return False
@@ -162,6 +1515,10 @@ class Blockchain:
             # Check proof of work:
             if not self.valid_proof(last_block['proof'], block['proof']):
                 return False
+            if block_version(block) is None:
+                return False
+            if block_version(block) == 2 and not self.transactions_verified(block):
+                return False
 
             last_block = block
             idx += 1
@@ -170,41 +1527,121 @@ class Blockchain:
 
     def resolve_conflicts(self):
         """
-        Consensus: query all peers'/chain. If a longer valid chain is found,
-        replace our own. Return True if replaced, False otherwise.
+        Consensus: compare all peers' chain summaries and download the best
+        longer valid chain, replacing our own. Return True if replaced, False otherwise.
         """
-        new_chain = None
-        max_length = len(self.chain)
-
         # Query bootstrap first if present
-        nodes_to_query = list(self.nodes)
+        nodes_to_query = [n for n in self.nodes if n != self.local_node]
         if self.bootstrap_node in nodes_to_query:
             nodes_to_query.remove(self.bootstrap_node)
             nodes_to_query.insert(0, self.bootstrap_node)
 
-        for node_addr in nodes_to_query:
-            if node_addr == self.local_node:
-                continue
-            try:
-                host_port = get_pod_host_port(node_addr)
-                r = requests.get(f"http://{host_port}/chain", timeout=5)
-                if r.status_code == 200:
-                    data = r.json()
-                    length = data.get('length')
-                    chain = data.get('chain')
-                    if length and chain and length > max_length and self.valid_chain(chain):
-                        max_length = length
-                        new_chain = chain
-            except requests.exceptions.RequestException:
-                continue
+        new_chain = self.fetch_best_chain(nodes_to_query)
 
         if new_chain:
-            self.chain = new_chain
+            self.replace_chain(new_chain)
             print(f"Chain replaced with longer chain of length {len(new_chain)}")
             return True
 
         return False
 
+    def block_filter_params(self):
+        """Query params asking a peer for our filtered view, or None for full blocks."""
+        return dict(self.block_filter, mode="headers") if self.block_filter else None
+
+    def fetch_chain_summaries(self, peers, timeout=SYNC_SUMMARY_TIMEOUT):
+        """
+        Query /chain/summary on all peers in parallel and return
+        {peer: {"length": <int>, "last_hash": <str>, "genesis_hash": <str>}} for those that answered
+        before the deadline. Stragglers are abandoned, not waited for.
+        """
+        def fetch(peer):
+            r = peer_request("GET", peer, "/chain/summary", timeout=timeout)
+            if r.status_code == 200:
+                return r.json()
+            return None
+
+        if not peers:
+            return {}
+        summaries = {}
+        executor = ThreadPoolExecutor(max_workers=min(len(peers), 16))
+        futures = {executor.submit(fetch, peer): peer for peer in peers}
+        done, _ = wait(futures, timeout=timeout)
+        executor.shutdown(wait=False)
+        for future in done:
+            try:
+                summary = future.result()
+            except Exception:
+                continue
+            if summary and summary.get('length') and summary.get('last_hash'):
+                summaries[futures[future]] = summary
+        return summaries
+
+    def fetch_best_chain(self, peers, min_length=None):
+        """
+        Sync planner: compare tips via parallel /chain/summary calls, pick the
+        longest tip (ties broken by how many peers agree on its hash) and
+        download the full chain from one peer holding it, falling back to the
+        next peer or tip only if that download fails validation.
+        Peers with an open circuit breaker are skipped; within a tip the
+        fastest healthy peer is preferred.
+        Returns the chain, or None if no peer has a valid chain of min_length
+        blocks (default: longer than ours).
+        """
+        if min_length is None:
+            min_length = len(self.chain) + 1
+        peers = self.peer_health.rank(peers)
+        summaries = self.fetch_chain_summaries(peers)
+        self.best_known_length = max([self.best_known_length] + [s['length'] for s in summaries.values()])
+
+        tips = {}
+        for peer in peers:
+            summary = summaries.get(peer)
+            if summary and summary['length'] >= min_length:
+                tips.setdefault((summary['length'], summary['last_hash']), []).append(peer)
+        ranked = sorted(tips.items(), key=lambda t: (t[0][0], len(t[1])), reverse=True)
+
+        for (length, last_hash), holders in ranked:
+            for peer in holders:
+                try:
+                    chain = self.download_chain(peer, summaries[peer].get('genesis_hash'))
+                    if chain and not self.block_filter and any(b.get('headers_only') for b in chain):
+                        continue  # a filtered node's chain cannot serve a full node
+                    if chain and len(chain) >= min_length and self.valid_chain(chain):
+                        print(f"[SYNC] Fetched chain of length {len(chain)} from {peer} ({len(summaries)}/{len(peers)} summaries)")
+                        return chain
+                except Exception as e:
+                    print(f"[SYNC] Error fetching chain from {peer}: {e}")
+        return None
+
+    def download_chain(self, peer, peer_genesis_hash=None):
+        """
+        Fetch peer's chain. When we already hold blocks past a genesis the peer
+        shares, ask only for the ones past our tip (/chain?since=<our length>)
+        and stitch them onto our chain; if they do not extend our tip (a fork)
+        or the peer ignores `since`, fall back to its full chain. Every node
+        mints its own genesis, so a genesis-only chain or a different genesis
+        goes straight to the full chain. Returns the chain, or None on a bad response.
+        """
+        base = list(self.chain)
+        params = self.block_filter_params() or {}
+        shares_genesis = peer_genesis_hash is None or (base and peer_genesis_hash == self.hash(base[0]))
+        if len(base) > 1 and shares_genesis:
+            r = peer_request("GET", peer, "/chain", timeout=5, adaptive=False,
+                             params=dict(params, since=len(base)))
+            if r.status_code != 200:
+                return None
+            data = r.json()
+            blocks = data.get('chain')
+            if data.get('since') is None:
+                return blocks  # peer sent its full chain
+            if blocks and blocks[0].get('previous_hash') == self.hash(base[-1]):
+                return base + blocks
+        r = peer_request("GET", peer, "/chain", timeout=5, adaptive=False, params=params or None)
+        if r.status_code != 200:
+            return None
+        return r.json().get('chain')
+
     # ─── BLOCK & TRANSACTION MANAGEMENT ────────────────────────────────────────
     def new_block(self, proof, previous_hash=None, mined_by="Unknown", transactions=None, timestamp=None):
         """
@@ -216,6 +1653,7 @@ class Blockchain:
         - timestamp: time of block mined
         """
         block = {
+            'version': BLOCK_VERSION,
             'index': len(self.chain) + 1,
             'timestamp': timestamp if timestamp is not None else time(),
             'transactions': transactions if transactions is not None else self.current_transactions.copy(),
@@ -223,11 +1661,56 @@ class Blockchain:
             'previous_hash': previous_hash or self.hash(self.chain[-1]),
             'mined_by': mined_by
         }
+        block['tx_count'] = len(block['transactions'])
+        block['tx_root'] = merkle_root(block['transactions'])
         self.current_transactions = []
-        self.chain.append(block)
-        self.apply_contracts(block)
+        self.append_block(block)
         return block
 
+    def append_block(self, block):
+        """
+        Append an already validated block to our chain: mark it seen, apply its
+        contracts and publish it to /blocks/stream subscribers.
+        """
+        block_hash = self.hash(block)
+        with self.chain_lock:
+            self.block_positions[block_hash] = len(self.chain)
+            self.chain.append(block)
+            self.seen_blocks.add(block_hash)
+            self.apply_contracts(block)
+        _block_stream.publish(block)
+
+    def adopt_joined_chain(self, chain):
+        """
+        Replace our chain with one fetched while joining. The join runs beside
+        the ingress worker, so this takes the chain lock and keeps our chain if
+        the worker has meanwhile synced past the fetched one.
+        """
+        with self.chain_lock:
+            if len(chain) < len(self.chain):
+                print(f"[JOIN] Keeping our chain ({len(self.chain)} blocks) over the fetched one ({len(chain)})")
+                return False
+            self.replace_chain(chain)
+            return True
+
+    def replace_chain(self, chain):
+        """
+        Adopt another (longer, validated) chain and bring the world state with
+        it: roll back to the fork point and apply the contracts of the new blocks.
+        """
+        with self.chain_lock:
+            # Blocks shared with our old chain keep their positions; only the new part is hashed
+            keep = 0
+            for old, new in zip(self.chain, chain):
+                if old is not new:
+                    break
+                keep += 1
+            positions = {h: pos for h, pos in self.block_positions.items() if pos < keep}
+            positions.update((self.hash(block), pos) for pos, block in enumerate(chain[keep:], keep))
+            self.chain = chain
+            self.block_positions = positions
+            self.world_state.sync()
+
     def new_transaction(self, sender, recipient, contract_id=None, contract_payload=None, requested_user_id=None):
         """
         Add a new transaction to the list of pending transactions. If
@@ -256,6 +1739,15 @@ class Blockchain:
     def last_block(self):
         return self.chain[-1]
 
+    def find_block(self, block_hash):
+        """Return the block with the given hash from the position index, or None."""
+        pos = self.block_positions.get(block_hash)
+        chain = self.chain
+        # The index and chain are swapped separately, so confirm the hit
+        if pos is not None and pos < len(chain) and self.hash(chain[pos]) == block_hash:
+            return chain[pos]
+        return None
+
     # ─── PROOF‐OF‐WORK ──────────────────────────────────────────────────────────
     def proof_of_work(self, last_proof):
         """
@@ -282,10 +1774,40 @@ class Blockchain:
         """
         Creates a SHA-256 hash of a block (dictionary). We must sort keys
         to make sure that identical blocks always produce the same hash.
+        Version 2 blocks are hashed over their header, which commits to the
+        transactions through tx_root, so a full block and any headers-only
+        view of it hash alike. Version 1 blocks are hashed whole; a view of
+        one can only carry the hash of the full block it stands for.
         """
+        if block_version(block) == 2:
+            block = {k: v for k, v in block.items() if k not in VIEW_ONLY_FIELDS}
+        elif block.get('headers_only'):
+            return block['block_hash']
         block_string = json.dumps(block, sort_keys=True).encode()
         return hashlib.sha256(block_string).hexdigest()
 
+    @staticmethod
+    def transactions_verified(block):
+        """
+        True when the transactions a block carries are bound to its hash: a
+        version 2 block's must rebuild its tx_root, a headers-only view's must
+        each prove into it. Version 1 full blocks are covered by their hash;
+        version 1 views cannot be checked. Unknown versions never verify.
+        """
+        transactions = block.get('transactions', [])
+        version = block_version(block)
+        if version is None:
+            return False
+        if version == 1:
+            return not block.get('headers_only')
+        if not block.get('headers_only'):
+            return block.get('tx_count') == len(transactions) and merkle_root(transactions) == block['tx_root']
+        proofs = block.get('tx_proofs')
+        if not isinstance(proofs, list) or len(proofs) != len(transactions):
+            return False
+        return all(verify_merkle_proof(tx, proof, block.get('tx_count'), block['tx_root'])
+                   for tx, proof in zip(transactions, proofs))
+
     # ─── UTILITY: Return chain as JSON (for /chain endpoint) ─────────────────
     def to_dict(self):
         return {
@@ -294,71 +1816,73 @@ class Blockchain:
         }
 
     # ─── «SMART CONTRACT» HANDLER ────────────────────────────────────────────────
-    def apply_contracts(self, block):
+    def contract_allocations(self, block):
         """
-        For each transaction in the newly‐appended block, check if it has a
-        'contract_id'. If so, dispatch to the corresponding on‐chain logic:
-          - "update_resource_allocation"
-        
-        Also track metrics for provider nodes when they receive any transactions.
+        Collect the state changes a block's contracts make on this node:
+          - "update_resource_allocation" (when our role is the authority)
+        Returns {city_id: (resources_allocated, risk_level)}, collapsed to the
+        last value per city. Malformed transactions are skipped, never raised
+        on: the world state engine replays every block, so one bad payload
+        must not stop it.
         """
-        print(f"[DEBUG] apply_contracts called with {len(block.get('transactions', []))} transactions")
-        print(f"[DEBUG] local_node: {self.local_node}")
-        print(f"[DEBUG] peers_roles: {self.peers_roles}")
-        print(f"[DEBUG] is_provider: {self.peers_roles.get(self.local_node) == 'provider'}")
-        
-        for tx in block['transactions']:
+        allocations = {}  # city_id → (resources_allocated, risk_level), in last-write order
+        if not self.transactions_verified(block):
+            print(f"[update_resource] Transactions of block {block.get('index')} cannot be verified, skipping contracts.")
+            return allocations
+        transactions = block.get('transactions', [])
+        for tx in transactions if isinstance(transactions, list) else []:
+            if not isinstance(tx, dict):
+                continue
             cid = tx.get('contract_id', "")
             payload = tx.get('contract_payload', {})
 
             if cid == "update_resource_allocation":
+                if not isinstance(payload, dict):
+                    print(f"[update_resource] Invalid payload: {payload}")
+                    continue
                 # Only provider nodes should update the DB
                 if self.peers_roles.get(self.local_node, None) == payload.get("authority"):
                     city_id = payload.get("city_id")
                     risk_level = payload.get("risk_level")
-                    # Map risk levels to resource amounts
-                    resource_map = {
-                        "low": 100,
-                        "medium": 200,
-                        "high": 300,
-                        "veryHigh": 400,
-                        "Very High": 400
-                    }
                     if not city_id or not risk_level:
                         print(f"[update_resource] Missing city_id or risk_level in payload: {payload}")
                         continue
-                    try:
-                        import sqlite3
-                        db_path = "/data/disaster_resources.db"
-                        if not os.path.exists(db_path):
-                            print(f"[update_resource] DB not found at {db_path}")
-                            continue
-                        conn = sqlite3.connect(db_path)
-                        cursor = conn.cursor()
-                        # Update only the risk level and resources_allocated
-                        rl_key = risk_level.lower() if risk_level.lower() in resource_map else risk_level
-                        resources_allocated = resource_map.get(rl_key, None)
-                        if resources_allocated is None:
-                            print(f"[update_resource] Invalid risk_level: {risk_level}")
-                            conn.close()
-                            continue
-                        cursor.execute('''
-                            UPDATE disaster_resources 
-                            SET resources_allocated = ?, disaster_risk_level = ?
-                            WHERE city_id = ?
-                        ''', (resources_allocated, risk_level, city_id))
-                        if cursor.rowcount == 0:
-                            print(f"[update_resource] City not found: {city_id}")
-                        else:
-                            print(f"[update_resource] Updated city_id {city_id} to risk_level {risk_level}")
-                        conn.commit()
-                        conn.close()
-                        print(f"[PROVIDER_METRICS] Database update completed, endTime recorded")
-                    except Exception as e:
-                        print(f"[update_resource] DB error: {e}")
+                    # Whole numbers only (not 2.5 or True), within SQLite's INTEGER range
+                    if isinstance(city_id, str):
+                        try:
+                            city_id = int(city_id)
+                        except ValueError:
+                            pass
+                    if type(city_id) is not int or not 0 < city_id < 2 ** 63:
+                        print(f"[update_resource] Invalid city_id: {city_id}")
+                        continue
+                    # Update only the risk level and resources_allocated
+                    resources_allocated = resource_db.resources_for_risk_level(risk_level)
+                    if resources_allocated is None:
+                        print(f"[update_resource] Invalid risk_level: {risk_level}")
+                        continue
+                    allocations.pop(city_id, None)
+                    allocations[city_id] = (resources_allocated, risk_level)
                 else:
                     print(f"[update_resource] Not a provider node, skipping DB update.")
             # else: unrecognized or no contract_id → do nothing
+        return allocations
+
+    def apply_contracts(self, block):
+        """
+        Called for each newly appended block. The world state engine applies
+        every block it has not yet materialized (normally just this one) in
+        one database transaction, so a block's effects land atomically.
+        
+        Also track metrics for provider nodes when they receive any transactions.
+        """
+        print(f"[DEBUG] apply_contracts called with {len(block.get('transactions', []))} transactions")
+        print(f"[DEBUG] local_node: {self.local_node}")
+        print(f"[DEBUG] peers_roles: {self.peers_roles}")
+        print(f"[DEBUG] is_provider: {self.peers_roles.get(self.local_node) == 'provider'}")
+        
+        if self.world_state.sync():
+            print(f"[PROVIDER_METRICS] Database update completed, endTime recorded")
         
         self.endTime.append(time())
 
@@ -367,30 +1891,101 @@ class Blockchain:
 blockchain_bp = Blueprint('blockchain_bp', __name__)
 bc = None  # Will be set once we instantiate Blockchain() in BlockchainNode
 
+@blockchain_bp.after_request
+def attach_session_ticket(response):
+    """Hand a freshly issued session ticket back to the peer that asked for one."""
+    issued = g.pop('session_ticket', None)
+    if issued:
+        ticket, key, exp = issued
+        response.headers["X-Session-Ticket"] = ticket
+        response.headers["X-Session-Key"] = base64.b64encode(key).decode()
+        response.headers["X-Session-Ticket-Expires"] = str(exp)
+    return response
+
+
 @blockchain_bp.route('/nodes', methods=['GET'])
 def list_nodes():
     """
     Return a list of peers this node currently knows about,
     each entry: { "address": "<host:port>", "role": "<role>" }.
     Only include peers that are still in bc.nodes (i.e., live peers).
+
+    With ?since=<version>, return only the changes after that version:
+    { "version": <int>, "delta": true, "peers": [...added...], "removed": [...] }.
+    If the change log no longer covers it, the full list is returned with "delta": false.
     """
+    since = request.args.get('since', type=int)
+    if since is not None:
+        delta = bc.peer_delta(since)
+        if delta is not None:
+            added, removed = delta
+            return jsonify({'version': bc.peers_version, 'delta': True, 'peers': added, 'removed': removed}), 200
+
     peers_info = []
     for addr in bc.get_node_addresses():
         if addr == bc.local_node:
             continue  # Exclude self, just in case
         if addr not in bc.nodes:
             continue  # Exclude stale peers
-        role = bc.peers_roles.get(addr, "unknown")
-        peers_info.append({"address": addr, "role": role})
-    return jsonify({'peers': peers_info}), 200
+        peers_info.append(bc.peer_info(addr))
+    return jsonify({'version': bc.peers_version, 'delta': False, 'peers': peers_info, 'removed': []}), 200
+
+
+@blockchain_bp.route('/health', methods=['GET'])
+def health_check():
+    """Cheap liveness probe used by peer gossip instead of downloading /chain."""
+    return jsonify({
+        "status": "healthy",
+        "role": bc.peers_roles.get(bc.local_node, "unknown"),
+        "length": len(bc.chain)
+    }), 200
+
+
+def startup_timings():
+    """Milliseconds from process start to each startup milestone reached so far."""
+    started = _startup_state["started_at"]
+    return {
+        f"{k[:-3]}_ms": round((_startup_state[k] - started) * 1000, 1)
+        for k in ("live_at", "joined_at", "ready_at") if _startup_state.get(k)
+    }
+
+
+@blockchain_bp.route('/livez', methods=['GET'])
+def livez():
+    """Liveness: the process is up and serving HTTP, joined or not."""
+    return jsonify({"status": "live", "startup": startup_timings()}), 200
+
+
+@blockchain_bp.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    Readiness: 200 once the background join has finished and our chain holds
+    at least READY_SYNC_THRESHOLD of the longest tip seen while joining,
+    503 until then.
+    """
+    target = _startup_state["target_length"]
+    length = len(bc.chain)
+    ready = _startup_state["joined_at"] is not None and length >= READY_SYNC_THRESHOLD * target
+    if ready and not _startup_state.get("ready_at"):
+        _startup_state["ready_at"] = time()
+    body = {
+        "status": "ready" if ready else "starting",
+        "joined": _startup_state["joined_at"] is not None,
+        "length": length,
+        "target_length": target,
+        "startup": startup_timings()
+    }
+    return jsonify(body), 200 if ready else 503
 
 
 @blockchain_bp.route('/nodes/register', methods=['POST'])
 def register_nodes():
     """
-    Expect JSON: { "nodes": ["http://host:port", ...], "role": "<string>", "is_local": <bool> }.
-    Add each node to bc.nodes, record its role if provided, then return ALL known peers
-    (including ourselves) as { "address": "<host:port>", "role": "<role>" }.
+    Expect JSON: { "nodes": ["http://host:port", ...], "role": "<string>", "is_local": <bool>,
+                   "filter": {"contract_id"|"authority"|"city_id_min"|"city_id_max": ...} }.
+    Add each node to bc.nodes, record its role and block filter if provided, then return
+    ALL known peers (including ourselves) as { "address": "<host:port>", "role": "<role>" }.
+    Filtered peers get headers plus matching transactions only when we push blocks to them.
     
     JWT Authentication: Requires Authorization header with valid JWT token.
     """
@@ -409,37 +2004,47 @@ def register_nodes():
     role = values.get('role', None)
     is_local = values.get('is_local', False)
     nodes = values.get('nodes')
+    block_filter = values.get('filter')
 
     # 1) Register each incoming node and record its role
     for node_url in nodes:
         parsed = urlparse(node_url)
         node_addr = parsed.netloc
         if is_local or node_addr != bc.local_node:
-            bc.register_node(node_addr, is_local=is_local)
-            if role:
+            bc.register_node(node_addr, is_local=is_local, role=None if is_local else role)
+            if role and is_local:
                 bc.set_peer_role(node_addr, role)
+            if not is_local:
+                bc.set_peer_filter(node_addr, block_filter)
                 
     # 2) Build response list of ALL known peers (ourselves + others)
     peer_list = []
     if bc.local_node:
-        peer_list.append({
-            "address": bc.local_node,
-            "role": bc.peers_roles.get(bc.local_node, "unknown")
-        })
+        peer_list.append(bc.peer_info(bc.local_node))
     for addr in bc.get_node_addresses():
-        peer_list.append({
-            "address": addr,
-            "role": bc.peers_roles.get(addr, "unknown")
-        })
+        peer_list.append(bc.peer_info(addr))
 
     return jsonify({"message": "Nodes registered", "peers": peer_list}), 201
 
 
+def is_block_index(value):
+    """True for a non-negative int (not a bool): what block indexes and TTLs must be."""
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
 @blockchain_bp.route('/receive_block', methods=['POST'])
 def receive_block():
     """
     Accepts a block with 'timestamp' and 'transactions' fields (plus others).
-    Validates and appends if valid.
+    Cheap checks run here; the block is then queued (202) for the ingress worker,
+    which validates and appends it. Returns 503 + Retry-After if the queue is full
+    and 409 with our chain length if the block would leave a gap.
+
+    For callers: a queued block answers 202 "Block queued", not the 201
+    "Block accepted" of the inline path (still used with INGRESS_QUEUE_SIZE=0),
+    so treat both as success. This node no longer syncs itself on a gap: the
+    sender must answer 409 by pushing the missing blocks to /receive_blocks,
+    as push_block does.
     
     JWT Authentication: Requires valid JWT token with 'blockchain:receive_block' scope.
     """
@@ -452,14 +2057,66 @@ def receive_block():
     print(f"Receiving block from authenticated node: {node_id}")
     
     data = request.get_json()
-    block = data.get('block')
-    if not block:
+    block = data.get('block') if isinstance(data, dict) else None
+    if not block or not isinstance(block, dict):
         return "Invalid data", 400
+    ttl = data.get('ttl', GOSSIP_TTL)
+    relayed_by = data.get('relayed_by')
+    if not is_block_index(block.get('index')) or not is_block_index(ttl):
+        return jsonify({"error": "'index' and 'ttl' must be non-negative integers"}), 400
+    if block_version(block) is None:
+        return jsonify({"error": "Unsupported block version"}), 400
+
+    if not _block_ingress.enabled:
+        with bc.chain_lock:
+            return process_incoming_block(block, ttl=ttl, relayed_by=relayed_by)
+
+    # Cheap checks only; validation and commit happen on the ingress worker
+    required_fields = ['index','timestamp','transactions','proof','previous_hash','mined_by']
+    if not all(k in block for k in required_fields):
+        return "Missing block fields", 400
+    if bc.hash(block) in bc.seen_blocks:
+        return jsonify({"message": "Block already seen"}), 200
+    if block['index'] <= bc.last_block['index']:
+        return jsonify({"message": "Block already exists or is old"}), 200
+    if block['index'] > _block_ingress.expected_next_index(bc.last_block['index']):
+        # Let the sender fill the gap with /receive_blocks instead of syncing here
+        return jsonify({"error": "Block index too high, please sync", "length": len(bc.chain)}), 409
+    return enqueue_blocks([block], ttl, relayed_by)
 
+
+def enqueue_blocks(blocks, ttl, relayed_by):
+    """Hand blocks to the ingress worker, or shed load with 503 + Retry-After if it is full."""
+    if not _block_ingress.submit(blocks, ttl, relayed_by):
+        response = jsonify({"error": "Block ingress queue full, retry later"})
+        response.headers['Retry-After'] = str(INGRESS_RETRY_AFTER)
+        return response, 503
+    return jsonify({"message": "Block queued", "queue_depth": _block_ingress.queue.qsize()}), 202
+
+
+def process_incoming_block(block, ttl=GOSSIP_TTL, relayed_by=None, announce=True):
+    """
+    Validate a received block and append it if it extends our tip, syncing
+    from masters first when it does not. Accepted blocks are announced onward
+    unless announce=False (the caller batches its own announcement).
+    Returns a Flask response tuple; status 201 means the block was appended.
+    """
     required_fields = ['index','timestamp','transactions','proof','previous_hash','mined_by']
     if not all(k in block for k in required_fields):
         return "Missing block fields", 400
 
+    if block.get('headers_only') and not bc.block_filter:
+        return jsonify({"error": "Headers-only block sent to a full node"}), 400
+    if block_version(block) is None:
+        return jsonify({"error": "Unsupported block version"}), 400
+    if block_version(block) == 2 and not bc.transactions_verified(block):
+        return jsonify({"error": "Block transactions do not match its tx_root"}), 400
+
+    # Drop gossip duplicates before doing any validation work
+    block_hash = bc.hash(block)
+    if block_hash in bc.seen_blocks:
+        return jsonify({"message": "Block already seen"}), 200
+
     last = bc.last_block
     if block['index'] == last['index'] + 1:
         # Validate previous_hash and proof
@@ -468,129 +2125,313 @@ def receive_block():
             if bc.peers_roles.get(bc.local_node) == "provider":
                 bc.dataReceivedAtProviderTime.append(time())
                 
-            bc.chain.append(block)
-            bc.apply_contracts(block)
-
-            # --- Master node: gossip only to other master nodes ---
-            if bc.peers_roles.get(bc.local_node) == "master":
-                jwt_token = get_jwt_token_for_node()
-                headers = {"Authorization": f"Bearer {jwt_token}"} if jwt_token else {}
-                for peer in bc.master_peers:
-                    try:
-                        host_port = get_pod_host_port(peer)
-                        requests.post(f"http://{host_port}/receive_block", json={'block': block}, headers=headers, timeout=2)
-                    except:
-                        pass
-            else:
-                # Non-master: propagate to all peers as before
-                jwt_token = get_jwt_token_for_node()
-                headers = {"Authorization": f"Bearer {jwt_token}"} if jwt_token else {}
-                for peer in bc.get_node_addresses():
-                    try:
-                        host_port = get_pod_host_port(peer)
-                        requests.post(f"http://{host_port}/receive_block", json={'block': block}, headers=headers, timeout=2)
-                    except:
-                        pass
+            bc.append_block(block)
+
+            if announce:
+                announce_accepted_blocks([block], ttl, exclude=relayed_by)
             return jsonify({"message": "Block accepted"}), 201
         else:
             # If block cannot be appended, try to sync with all master peers and retry
             print("[RECEIVE_BLOCK] Block could not be appended, attempting to sync with master peers.")
-            longest_chain = bc.chain
-            for master_peer in bc.master_peers:
-                try:
-                    host_port = get_pod_host_port(master_peer)
-                    r = requests.get(f"http://{host_port}/chain", timeout=5)
-                    if r.status_code == 200:
-                        data = r.json()
-                        length = data.get('length')
-                        chain = data.get('chain')
-                        if length and chain and length > len(longest_chain) and bc.valid_chain(chain):
-                            longest_chain = chain
-                except Exception as e:
-                    print(f"[RECEIVE_BLOCK] Error syncing with master peer {master_peer}: {e}")
-            bc.chain = longest_chain.copy()
+            longest_chain = bc.fetch_best_chain(list(bc.master_peers))
+            if longest_chain:
+                bc.replace_chain(longest_chain.copy())
             # Try to append the block again
             last = bc.last_block
             if block['index'] == last['index'] + 1 and block['previous_hash'] == bc.hash(last) and bc.valid_proof(last['proof'], block['proof']):
-                bc.chain.append(block)
-                bc.apply_contracts(block)
+                bc.append_block(block)
                 return jsonify({"message": "Block accepted after sync"}), 201
             else:
                 return jsonify({"error": "Invalid block, even after sync"}), 400
     elif block['index'] > last['index'] + 1:
         # Automatically sync with master peers and retry
         print(f"[RECEIVE_BLOCK] Block index {block['index']} too high, syncing with master peers.")
-        longest_chain = bc.chain
-        
-        # First try master peers
-        for master_peer in bc.master_peers:
-            try:
-                host_port = get_pod_host_port(master_peer)
-                r = requests.get(f"http://{host_port}/chain", timeout=5)
-                if r.status_code == 200:
-                    data = r.json()
-                    chain = data.get('chain')
-                    if chain and len(chain) >= block['index'] and bc.valid_chain(chain):
-                        longest_chain = chain
-                        print(f"[RECEIVE_BLOCK] Found suitable chain from master peer {master_peer}")
-                        break
-            except Exception as e:
-                print(f"[RECEIVE_BLOCK] Error syncing with master peer {master_peer}: {e}")
-        
-        # If no suitable master chain found, try all peers
-        if len(longest_chain) < block['index']:
-            for peer in bc.get_node_addresses():
-                if peer in bc.master_peers:  # Skip master peers already checked
-                    continue
-                try:
-                    host_port = get_pod_host_port(peer)
-                    r = requests.get(f"http://{host_port}/chain", timeout=5)
-                    if r.status_code == 200:
-                        data = r.json()
-                        chain = data.get('chain')
-                        if chain and len(chain) >= block['index'] and bc.valid_chain(chain):
-                            longest_chain = chain
-                            print(f"[RECEIVE_BLOCK] Found suitable chain from peer {peer}")
-                            break
-                except Exception as e:
-                    print(f"[RECEIVE_BLOCK] Error syncing with peer {peer}: {e}")
-        
-        bc.chain = longest_chain.copy()
+        # First try master peers, then all other peers, for a chain that reaches the block's parent
+        longest_chain = bc.fetch_best_chain(list(bc.master_peers), min_length=block['index'] - 1)
+        if not longest_chain:
+            other_peers = [p for p in bc.get_node_addresses() if p not in bc.master_peers]
+            longest_chain = bc.fetch_best_chain(other_peers, min_length=block['index'] - 1)
+        if longest_chain:
+            bc.replace_chain(longest_chain.copy())
         
         # Now try to append the block again
         last = bc.last_block
         if block['index'] == last['index'] + 1 and block['previous_hash'] == bc.hash(last) and bc.valid_proof(last['proof'], block['proof']):
-            bc.chain.append(block)
-            bc.apply_contracts(block)
+            bc.append_block(block)
             print(f"[RECEIVE_BLOCK] Block {block['index']} accepted after sync")
             return jsonify({"message": "Block accepted after sync"}), 201
         else:
             print(f"[RECEIVE_BLOCK] Block {block['index']} still invalid after sync")
-            return jsonify({"error": "Block index too high, please sync"}), 409
+            return jsonify({"error": "Block index too high, please sync", "length": len(bc.chain)}), 409
     else:
+        bc.seen_blocks.add(block_hash)
         return jsonify({"message": "Block already exists or is old"}), 200
 
 
+def fetch_announced_blocks(items, announced_by):
+    """Pull the bodies of announced {index, hash} items from the announcer, skipping any we got meanwhile."""
+    fetched = []
+    for item in items:
+        if item['hash'] in bc.seen_blocks:
+            continue
+        try:
+            r = peer_request("GET", announced_by, f"/block/{item['hash']}", timeout=2,
+                             params=bc.block_filter_params())
+            if r.status_code != 200:
+                continue
+            block = r.json().get('block')
+        except Exception as e:
+            print(f"[INV] Could not fetch block {item['hash']} from {announced_by}: {e}")
+            continue
+        if block:
+            fetched.append(block)
+    return fetched
+
+
+@blockchain_bp.route('/inv', methods=['POST'])
+def receive_inventory():
+    """
+    Expect JSON: { "inventory": [{"index": <int>, "hash": <str>}, ...],
+                   "announced_by": "<host:port:pod>", "ttl": <int> }.
+    Announced blocks we don't already have are queued (202) for the ingress
+    worker, which pulls their bodies from the announcer's /block/<hash> and
+    processes them like /receive_block, off the request path. Blocks accepted
+    from one announcement are re-announced together in one message.
+
+    JWT Authentication: Requires valid JWT token with 'blockchain:receive_block' scope.
+    """
+    payload = bc.require_jwt_auth(required_scope='blockchain:receive_block')
+    if not payload:
+        return jsonify({"error": "Invalid or missing JWT token with 'blockchain:receive_block' scope"}), 401
+
+    data = request.get_json()
+    inventory = data.get('inventory') if isinstance(data, dict) else None
+    announced_by = data.get('announced_by') if isinstance(data, dict) else None
+    if not inventory or not isinstance(inventory, list) or not announced_by:
+        return jsonify({"error": "supply 'inventory' and 'announced_by'"}), 400
+    ttl = data.get('ttl', GOSSIP_TTL)
+    if (not is_block_index(ttl) or not all(isinstance(item, dict) and is_block_index(item.get('index'))
+                                           and isinstance(item.get('hash'), str) for item in inventory)):
+        return jsonify({"error": "inventory items need an integer 'index' and a string 'hash'; 'ttl' an integer"}), 400
+
+    missing = [item for item in sorted(inventory, key=lambda i: i['index'])
+               if item.get('hash') and item['hash'] not in bc.seen_blocks]
+    if not missing:
+        return jsonify({"announced": len(inventory), "missing": 0}), 200
+    if _block_ingress.enabled:
+        # The ingress worker pulls the bodies and processes them; the announcer is not kept waiting
+        if not _block_ingress.submit(missing, ttl, announced_by, fetch_from=announced_by):
+            response = jsonify({"error": "Block ingress queue full, retry later"})
+            response.headers['Retry-After'] = str(INGRESS_RETRY_AFTER)
+            return response, 503
+        return jsonify({"announced": len(inventory), "missing": len(missing), "queued": True}), 202
+
+    fetched = fetch_announced_blocks(missing, announced_by)
+    if not fetched:
+        return jsonify({"announced": len(inventory), "fetched": 0}), 200
+    if len(fetched) == 1:
+        _, status = process_incoming_block(fetched[0], ttl=ttl, relayed_by=announced_by)
+        accepted = 1 if status == 201 else 0
+    else:
+        response, _ = process_incoming_segment(fetched, ttl=ttl, relayed_by=announced_by)
+        accepted = response.get_json().get('accepted', 0)
+    return jsonify({"announced": len(inventory), "fetched": len(fetched), "accepted": accepted}), 200
+
+
+@blockchain_bp.route('/receive_blocks', methods=['POST'])
+def receive_blocks():
+    """
+    Batch variant of /receive_block. Expect JSON: { "blocks": [<block>, ...], "ttl": <int> }
+    holding an ordered run of consecutive blocks. The run is queued (202) for the
+    ingress worker, which validates it as one chain segment, appends it
+    atomically, applies its contracts in order and announces it onward once.
+
+    JWT Authentication: Requires valid JWT token with 'blockchain:receive_block' scope.
+    """
+    payload = bc.require_jwt_auth(required_scope='blockchain:receive_block')
+    if not payload:
+        return jsonify({"error": "Invalid or missing JWT token with 'blockchain:receive_block' scope"}), 401
+
+    data = request.get_json()
+    blocks = data.get('blocks') if isinstance(data, dict) else None
+    if not blocks or not isinstance(blocks, list):
+        return "Invalid data", 400
+    if (not is_block_index(data.get('ttl', GOSSIP_TTL))
+            or not all(isinstance(b, dict) and is_block_index(b.get('index')) for b in blocks)):
+        return jsonify({"error": "'index' and 'ttl' must be non-negative integers", "accepted": 0}), 400
+    if any(block_version(b) is None for b in blocks):
+        return jsonify({"error": "Unsupported block version", "accepted": 0}), 400
+
+    print(f"Receiving {len(blocks)} blocks from authenticated node: {payload.get('sub', 'unknown')}")
+    ttl = data.get('ttl', GOSSIP_TTL)
+    if not _block_ingress.enabled:
+        with bc.chain_lock:
+            return process_incoming_segment(blocks, ttl=ttl, relayed_by=data.get('relayed_by'))
+
+    required_fields = ['index','timestamp','transactions','proof','previous_hash','mined_by']
+    if not all(isinstance(b, dict) and all(k in b for k in required_fields) for b in blocks):
+        return jsonify({"error": "Missing block fields", "accepted": 0}), 400
+    return enqueue_blocks(blocks, ttl, data.get('relayed_by'))
+
+
+def process_incoming_segment(blocks, ttl=GOSSIP_TTL, relayed_by=None):
+    """
+    Validate an ordered run of blocks as a single chain segment on top of our
+    tip (syncing first if the run starts beyond it), append all of it or none
+    of it, apply contracts block by block and announce the accepted run once.
+    Blocks we already hold are skipped. Returns a Flask response tuple.
+    """
+    required_fields = ['index','timestamp','transactions','proof','previous_hash','mined_by']
+    if not all(isinstance(b, dict) and all(k in b for k in required_fields) for b in blocks):
+        return jsonify({"error": "Missing block fields", "accepted": 0}), 400
+    if not bc.block_filter and any(b.get('headers_only') for b in blocks):
+        return jsonify({"error": "Headers-only blocks sent to a full node", "accepted": 0}), 400
+    if any(block_version(b) is None for b in blocks):
+        return jsonify({"error": "Unsupported block version", "accepted": 0}), 400
+    if any(block_version(b) == 2 and not bc.transactions_verified(b) for b in blocks):
+        return jsonify({"error": "Block transactions do not match their tx_root", "accepted": 0}), 400
+    blocks = sorted(blocks, key=lambda b: b['index'])
+
+    def unseen():
+        tip_index = bc.last_block['index']
+        return [b for b in blocks if b['index'] > tip_index and bc.hash(b) not in bc.seen_blocks]
+
+    new_blocks = unseen()
+    if not new_blocks:
+        return jsonify({"message": "Blocks already exist or are old", "accepted": 0}), 200
+
+    if new_blocks[0]['index'] != bc.last_block['index'] + 1 or new_blocks[0]['previous_hash'] != bc.hash(bc.last_block):
+        # Segment does not start on our tip: catch up from masters first, then others
+        print(f"[RECEIVE_BLOCKS] Segment starts at {new_blocks[0]['index']}, tip is {bc.last_block['index']}; syncing.")
+        longest_chain = bc.fetch_best_chain(list(bc.master_peers), min_length=new_blocks[0]['index'] - 1)
+        if not longest_chain:
+            other_peers = [p for p in bc.get_node_addresses() if p not in bc.master_peers]
+            longest_chain = bc.fetch_best_chain(other_peers, min_length=new_blocks[0]['index'] - 1)
+        if longest_chain:
+            bc.replace_chain(longest_chain.copy())
+        new_blocks = unseen()
+        if not new_blocks:
+            return jsonify({"message": "Blocks already exist after sync", "accepted": 0}), 200
+
+    # One pass over the segment: each block must link to and prove against its predecessor
+    prev = bc.last_block
+    for block in new_blocks:
+        if (block['index'] != prev['index'] + 1 or block['previous_hash'] != bc.hash(prev)
+                or not bc.valid_proof(prev['proof'], block['proof'])):
+            status = 409 if block is new_blocks[0] else 400
+            return jsonify({"error": f"Segment does not link at block {block['index']}",
+                            "accepted": 0, "length": len(bc.chain)}), status
+        prev = block
+
+    if bc.peers_roles.get(bc.local_node) == "provider":
+        bc.dataReceivedAtProviderTime.append(time())
+    for block in new_blocks:
+        bc.append_block(block)
+
+    announce_accepted_blocks(new_blocks, ttl, exclude=relayed_by)
+    print(f"[RECEIVE_BLOCKS] Accepted {len(new_blocks)} blocks, tip now {bc.last_block['index']}")
+    return jsonify({"message": "Blocks accepted", "accepted": len(new_blocks)}), 201
+
+
+@blockchain_bp.route('/blocks/stream', methods=['GET'])
+def block_stream():
+    """
+    Server-Sent Events stream of blocks appended to our chain, one event per block:
+        id: <index>\nevent: block\ndata: <json>\n\n
+    Query params: from_index=<int> (or the Last-Event-ID header) replays our
+    chain from that index before streaming live; mode=headers sends headers
+    plus transactions matching contract_id / authority / city_id_min / city_id_max only.
+
+    JWT Authentication: Requires valid JWT token with 'blockchain:sync' scope.
+    """
+    payload = bc.require_jwt_auth(required_scope='blockchain:sync')
+    if not payload:
+        return jsonify({"error": "Invalid or missing JWT token with 'blockchain:sync' scope"}), 401
+
+    last_event_id = request.headers.get('Last-Event-ID')
+    from_index = request.args.get('from_index', type=int)
+    if from_index is None and last_event_id and last_event_id.isdigit():
+        from_index = int(last_event_id) + 1
+    mode = request.args.get('mode', 'full')
+    filters = normalize_block_filter(request.args)
+    print(f"[STREAM] Subscriber {payload.get('sub', 'unknown')} from_index={from_index} mode={mode} filters={filters}")
+
+    def event(block):
+        return f"id: {block['index']}\nevent: block\ndata: {json.dumps(block_view(block, mode, filters))}\n\n"
+
+    def generate():
+        q = _block_stream.subscribe()
+        try:
+            sent_index = 0
+            if from_index is not None:
+                for block in list(bc.chain):
+                    if block['index'] >= from_index:
+                        sent_index = block['index']
+                        yield event(block)
+            while True:
+                try:
+                    block = q.get(timeout=BLOCK_STREAM_HEARTBEAT)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if block is None:
+                    return
+                if block['index'] > sent_index:
+                    sent_index = block['index']
+                    yield event(block)
+        finally:
+            _block_stream.unsubscribe(q)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@blockchain_bp.route('/block/<block_hash>', methods=['GET'])
+def get_block_by_hash(block_hash):
+    """
+    Return a single block body by its hash, used by peers pulling announced blocks.
+    { "block": {...} }. mode=headers plus filter params returns a filtered view.
+    """
+    block = bc.find_block(block_hash)
+    if block is None:
+        return jsonify({"error": "Block not found"}), 404
+    return jsonify({"block": block_view(block, request.args.get('mode', 'full'), normalize_block_filter(request.args))}), 200
+
+
 @blockchain_bp.route('/chain', methods=['GET'])
 def full_chain():
     """
     Return our local chain as JSON:
     { "chain": [{"timestamp":..., "transactions": [...]}, ...], "length": <int> }
+    mode=headers plus filter params returns filtered views of every block.
+    since=<n> returns only the blocks after the first n (a delta for a peer
+    that already holds them) and echoes "since" back.
     """
-    return jsonify(bc.to_dict()), 200
+    since = request.args.get('since', type=int)
+    chain = bc.chain[since:] if since else bc.chain
+    if request.args.get('mode') == 'headers':
+        filters = normalize_block_filter(request.args)
+        chain = [block_view(b, 'headers', filters) for b in chain]
+    elif since is None:
+        return jsonify(bc.to_dict()), 200
+    body = {'chain': chain, 'length': len(bc.chain)}
+    if since is not None:
+        body['since'] = since
+    return jsonify(body), 200
 
 # --- New: Lightweight chain summary endpoint ---
 @blockchain_bp.route('/chain/summary', methods=['GET'])
 def chain_summary():
     """
-    Return only the last block hash and chain length for efficient sync.
-    { "last_hash": <str>, "length": <int> }
+    Return only the last block hash, chain length and genesis hash for efficient sync.
+    { "last_hash": <str>, "length": <int>, "genesis_hash": <str> }
     """
     if not bc.chain:
-        return jsonify({"last_hash": None, "length": 0}), 200
+        return jsonify({"last_hash": None, "length": 0, "genesis_hash": None}), 200
     last_block = bc.chain[-1]
     last_hash = bc.hash(last_block)
-    return jsonify({"last_hash": last_hash, "length": len(bc.chain)}), 200
+    return jsonify({"last_hash": last_hash, "length": len(bc.chain),
+                    "genesis_hash": bc.hash(bc.chain[0])}), 200
     # chain_summary = [{
     #     "timestamp": block["timestamp"],
     #     "transactions": block["transactions"]
@@ -601,8 +2442,8 @@ def chain_summary():
 @blockchain_bp.route('/sync', methods=['GET'])
 def sync_chain():
     """
-    Query all peers'/chain endpoints.
-    If any peer has a longer valid chain, adopt it and return 200.
+    Compare peers' chain summaries (masters first, then others) and
+    download the best longer valid chain, if any; adopt it and return 200.
     Otherwise return 200 saying "up to date."
     
     JWT Authentication: Requires valid JWT token with 'blockchain:sync' scope.
@@ -614,55 +2455,25 @@ def sync_chain():
     
     node_id = payload.get('sub', 'unknown')
     print(f"Syncing chain from authenticated node: {node_id}")
-    replaced = False
-    longest_chain = bc.chain
-
     # First try master peers for sync
-    for peer in bc.master_peers:
-        try:
-            host_port = get_pod_host_port(peer)
-            r = requests.get(f"http://{host_port}/chain", timeout=3)
-            if r.status_code == 200:
-                data = r.json()
-                length = data.get('length')
-                chain = data.get('chain')
-                if length and chain and length > len(longest_chain) and bc.valid_chain(chain):
-                    longest_chain = chain
-                    replaced = True
-                    print(f"[SYNC] Found longer chain from master peer {peer}: {length} blocks")
-        except requests.exceptions.RequestException:
-            continue
+    longest_chain = bc.fetch_best_chain(list(bc.master_peers))
 
     # If no master peer had a longer chain, try other peers
-    if not replaced:
-        for peer in bc.get_node_addresses():
-            if peer in bc.master_peers:  # Skip master peers already checked
-                continue
-            try:
-                host_port = get_pod_host_port(peer)
-                r = requests.get(f"http://{host_port}/chain", timeout=3)
-                if r.status_code == 200:
-                    data = r.json()
-                    length = data.get('length')
-                    chain = data.get('chain')
-                    if length and chain and length > len(longest_chain) and bc.valid_chain(chain):
-                        longest_chain = chain
-                        replaced = True
-                        print(f"[SYNC] Found longer chain from peer {peer}: {length} blocks")
-            except requests.exceptions.RequestException:
-                continue
+    if not longest_chain:
+        other_peers = [p for p in bc.get_node_addresses() if p not in bc.master_peers]
+        longest_chain = bc.fetch_best_chain(other_peers)
 
-    if replaced:
-        bc.chain = longest_chain.copy()
+    if longest_chain:
+        bc.replace_chain(longest_chain.copy())
         return jsonify({"message": "Chain replaced", "new_length": len(longest_chain)}), 200
 
-    return jsonify({"message": "Our chain is up to date", "length": len(longest_chain)}), 200
+    return jsonify({"message": "Our chain is up to date", "length": len(bc.chain)}), 200
 
 
 @blockchain_bp.route('/mine', methods=['GET'])
 def mine():
     """
-    1) Sync with all peers (pull their /chain).  
+    1) Sync with peers (summary-first, one /chain download).  
     2) Proof-of-Work on our tip.  
     3) new_block(proof) → apply_contracts(block) → broadcast.  
     4) Return the newly mined block.
@@ -677,21 +2488,10 @@ def mine():
     node_id = payload.get('sub', 'unknown')
     print(f"Mining block from authenticated node: {node_id}")
     # Step 1: Sync with master peers first, then regular peers if needed
-    longest_chain = bc.chain
     sync_sources = list(bc.master_peers) if bc.master_peers else bc.get_node_addresses()
-    for peer in sync_sources:
-        try:
-            host_port = get_pod_host_port(peer)
-            r = requests.get(f"http://{host_port}/chain", timeout=3)
-            if r.status_code == 200:
-                data = r.json()
-                length = data.get('length')
-                chain  = data.get('chain')
-                if length and chain and length > len(longest_chain) and bc.valid_chain(chain):
-                    longest_chain = chain
-        except:
-            continue
-    bc.chain = longest_chain.copy()
+    longest_chain = bc.fetch_best_chain(sync_sources)
+    if longest_chain:
+        bc.replace_chain(longest_chain.copy())
 
     # Step 2: Proof-of-Work
     last_proof = bc.last_block['proof']
@@ -706,22 +2506,14 @@ def mine():
     master_peers = list(bc.master_peers)
     other_peers = [p for p in bc.get_node_addresses() if p not in master_peers]
     
-    # Get JWT token for authentication with retry
-    jwt_token = get_jwt_token_with_retry()
-    headers = {"Authorization": f"Bearer {jwt_token}"} if jwt_token else {}
-    
-    for peer in master_peers:
-        try:
-            host_port = get_pod_host_port(peer)
-            requests.post(f"http://{host_port}/receive_block", json={'block': new_block}, headers=headers, timeout=2)
-        except:
-            pass
-    for peer in other_peers:
-        try:
-            host_port = get_pod_host_port(peer)
-            requests.post(f"http://{host_port}/receive_block", json={'block': new_block}, headers=headers, timeout=2)
-        except:
-            pass
+    def send(headers):
+        for peer in master_peers + other_peers:
+            try:
+                push_block(peer, new_block, headers, timeout=2)
+            except:
+                pass
+
+    send_with_token(send, what=f"block {new_block['index']}")
 
     return jsonify({
         "message": "New block forged",
@@ -774,18 +2566,61 @@ def list_master_peers():
             master_peers_info.append({"address": addr, "role": "master"})
     return jsonify({'master_peers': master_peers_info}), 200
 
+@blockchain_bp.route('/ingress_metrics', methods=['GET'])
+def ingress_metrics_endpoint():
+    """
+    Return block ingress queue depth, enqueue/reject counts and the
+    queue_wait / process stage latency histograms.
+    """
+    return jsonify(_block_ingress.metrics()), 200
+
+@blockchain_bp.route('/jwt_cache_metrics', methods=['GET'])
+def jwt_cache_metrics_endpoint():
+    """
+    Return verified-token cache metrics (hit rate, average verification time
+    and the time saved by cache hits) plus the JWKS cache state and this
+    node's own token refresher and peer session tickets.
+    """
+    return jsonify(dict(bc.verified_tokens.metrics(), jwks=_jwks_cache.metrics(),
+                        token=_jwt_token_cache.metrics(), session_tickets=_session_tickets.metrics())), 200
+
+@blockchain_bp.route('/world_state', methods=['GET'])
+def world_state_endpoint():
+    """
+    Return the world state engine's applied tip, reorg/rollback counts and
+    snapshot activity.
+    """
+    return jsonify(bc.world_state.metrics()), 200
+
+@blockchain_bp.route('/address_cache_metrics', methods=['GET'])
+def address_cache_metrics_endpoint():
+    """
+    Return pod address cache metrics: hit rate, negative hits and average
+    DNS resolution latency.
+    """
+    return jsonify(_address_cache.metrics()), 200
+
+@blockchain_bp.route('/peers/health', methods=['GET'])
+def peer_health_endpoint():
+    """
+    Return the peer health table: RTT EWMA, failure rate, last success and
+    circuit-breaker state per peer.
+    """
+    return jsonify({'peers': bc.peer_health.snapshot()}), 200
+
 # ─── BlockchainNode Wrapper ─────────────────────────────────────────────────────
 class BlockchainNode:
     """
     Wraps a Flask app into a P2P/Blockchain node.
-    Decides if we're bootstrap (first on 5002) or a normal node.
-    Registers with bootstrap if needed. Registers core P2P endpoints.
+    Registers core P2P endpoints straight away so the server can start, then
+    joins the network in the background: decides if we're bootstrap (first on
+    5002) or a normal node, registers with peers and syncs the chain.
     """
 
     def __init__(self, app: Flask, desired_port: int, role: str):
         global bc
 
-        # Step 1: Check if someone is listening on port 5002
+        # Step 1: Work out our identity
         requested_port = desired_port
         # Use MY_SERVICE_NAME env var if set, else fallback to BOOTSTRAP_HOST, else default
         local_hostname = os.environ.get("MY_SERVICE_NAME")
@@ -812,10 +2647,62 @@ class BlockchainNode:
         # Register using pod IP to enable direct pod-to-pod communication
         requested_address = f"{pod_ip}:{requested_port}:{pod_name}"
 
+        self.IS_BOOTSTRAP = False
+        self.MY_ADDRESS = requested_address
+        self.PORT = requested_port
+        self.role = role  # e.g. "provider", "requester", or "user_contract"
+        self.peer_table_path = PEER_TABLE_PATH.format(role=role, pod=pod_name)
+        self.peer_table_pattern = PEER_TABLE_PATH.format(role=role, pod="*")
+
+        # Step 2: Instantiate our Blockchain, register ourselves, set role
+        bc = Blockchain()
+        bc.register_node(self.MY_ADDRESS, is_local=True)
+        bc.set_peer_role(self.MY_ADDRESS, role)
+        bc.bootstrap_node = BOOTSTRAP_HOST
+
+        # Step 3: Register the core P2P endpoints and start local workers
+        app.register_blueprint(blockchain_bp)
+        print("Registered blockchain P2P endpoints on Flask app.")
+
+        threading.Thread(target=_address_cache.refresh_loop, daemon=True).start()
+        threading.Thread(target=_jwks_cache.refresh_loop, daemon=True).start()
+        threading.Thread(target=_jwt_token_cache.refresh_loop, daemon=True).start()
+        if _block_ingress.enabled:
+            threading.Thread(target=_block_ingress.worker_loop, args=(app,), daemon=True).start()
+
+        # Expose app and port for others to read
+        self.app = app
+        _startup_state["live_at"] = time()
+
+        # Step 4: Discover peers and sync, off the startup path unless disabled
+        if BACKGROUND_JOIN:
+            threading.Thread(target=self.join_network, daemon=True).start()
+        else:
+            self.join_network()
+
+    def join_network(self):
+        """
+        Find the network and catch up with it: contact remembered peers, wait
+        for the bootstrap master (non-masters with no live remembered master),
+        discover other masters via DNS (masters), register, sync the chain,
+        then start gossip and the sync/stream loops. /readyz flips to ready
+        once this has finished and the chain is caught up.
+        """
+        role = self.role
+
+        # Step 1a: Contact peers remembered from before a restart, all at once
+        known_peers = load_peer_tables(self.peer_table_pattern, local_address=self.MY_ADDRESS)
+        live_known = probe_peer_table(known_peers) if known_peers else {}
+        live_known_masters = [e["address"] for e in known_peers
+                              if e["address"] in live_known and e.get("role") == "master"]
+        if known_peers:
+            print(f"[PEER_TABLE] {len(live_known)}/{len(known_peers)} remembered peers answered "
+                  f"({len(live_known_masters)} masters)")
+
         max_retries = 30
         node_exists_at_5002 = False
-        # Only wait for master if our role is NOT master
-        if role != "master":
+        # Only wait for master if our role is NOT master, and only if no remembered master answered
+        if role != "master" and not live_known_masters:
             for attempt in range(max_retries):
                 try:
                     host_port = get_pod_host_port(BOOTSTRAP_ADDRESS)
@@ -828,8 +2715,6 @@ class BlockchainNode:
                 print(f"[BOOTSTRAP WAIT] Waiting for master at {BOOTSTRAP_ADDRESS}... ({attempt+1}/{max_retries})", flush=True)
                 sleep(2)
 
-        PORT = requested_port
-        MY_ADDRESS = requested_address
         IS_BOOTSTRAP = False
         longest_chain = None
         # New logic: If this is a master node, try to find any existing master chains
@@ -843,50 +2728,47 @@ class BlockchainNode:
                 master_ips = socket.gethostbyname_ex(master_service_name)[2]
             except Exception:
                 master_ips = []
-            found_chain = False
-            max_length = 0
-            for ip in master_ips:
-                if ip == socket.gethostbyname(socket.gethostname()):
-                    continue  # skip self
-                try:
-                    url = f"http://{ip}:{requested_port}/chain"
-                    r = requests.get(url, timeout=2)
-                    if r.status_code == 200:
-                        data = r.json()
-                        chain = data.get('chain')
-                        if chain and len(chain) > max_length:
-                            longest_chain = chain
-                            max_length = len(chain)
-                            found_chain = True
-                except Exception:
-                    continue
-            if found_chain:
-                print(f"[MASTER BOOTSTRAP] Found existing master chain of length {max_length}. Joining it.")
+            # Ask every replica for its tip at once, then download only from the
+            # winner (min_length=1 so a genesis-only master is still joined)
+            my_ip = self.MY_ADDRESS.split(':')[0]
+            replicas = [f"{ip}:{self.PORT}" for ip in master_ips if ip != my_ip]
+            longest_chain = bc.fetch_best_chain(replicas, min_length=1) if replicas else None
+            if longest_chain:
+                print(f"[MASTER BOOTSTRAP] Found existing master chain of length {len(longest_chain)} "
+                      f"among {len(replicas)} replicas. Joining it.")
+            elif live_known_masters:
+                print(f"[MASTER BOOTSTRAP] Rejoining {len(live_known_masters)} remembered masters.")
             else:
                 print(f"[MASTER BOOTSTRAP] No existing master chain found. Bootstrapping new chain.")
                 IS_BOOTSTRAP = True
         else:
-            if node_exists_at_5002:
-                print(f"Detected existing node on 5002. Binding to port {PORT} and registering.")
+            if live_known_masters:
+                print(f"Rejoining via {len(live_known_masters)} remembered masters without waiting for bootstrap.")
+            elif node_exists_at_5002:
+                print(f"Detected existing node on 5002. Binding to port {self.PORT} and registering.")
             else:
                 IS_BOOTSTRAP = True
-                print(f"No node on 5002. Becoming the first node on {MY_ADDRESS}")
+                print(f"No node on 5002. Becoming the first node on {self.MY_ADDRESS}")
 
-        # Step 2: Instantiate our Blockchain, register ourselves, set role
-        bc = Blockchain()
-        bc.register_node(MY_ADDRESS, is_local=True)
-        bc.set_peer_role(MY_ADDRESS, role)
-        bc.bootstrap_node = BOOTSTRAP_HOST
         if longest_chain:
-            bc.chain = longest_chain
-
+            bc.adopt_joined_chain(longest_chain)
+        for entry in known_peers:
+            if entry["address"] in live_known:
+                bc.register_node(entry["address"], is_local=False, role=entry.get("role", "unknown"))
+                bc.set_peer_filter(entry["address"], entry.get("filter"))
+                bc.peer_health.seed(entry["address"], entry.get("health"))
+                bc.peer_health.record_success(entry["address"], live_known[entry["address"]])
         self.IS_BOOTSTRAP = IS_BOOTSTRAP
-        self.MY_ADDRESS = MY_ADDRESS
-        self.PORT = PORT
-        self.role = role  # e.g. "provider", "requester", or "user_contract"
 
-        # Step 3: If not bootstrap, register with bootstrap
-        if not IS_BOOTSTRAP:
+        # Step 3: If remembered masters answered, register with all of them in parallel
+        # and sync from them; otherwise, if not bootstrap, register with bootstrap
+        if live_known_masters:
+            run_concurrently(self.register_with_peer, live_known_masters)
+            chain = bc.fetch_best_chain(bc.peer_health.rank(list(live_known)))
+            if chain and bc.adopt_joined_chain(chain):
+                print(f"Synced chain from remembered peers ({len(chain)} blocks)")
+            bc.save_peer_table(self.peer_table_path)
+        elif not IS_BOOTSTRAP:
             self.register_with_peer(BOOTSTRAP_ADDRESS)
             try:
                 host_port = get_pod_host_port(BOOTSTRAP_ADDRESS)
@@ -894,25 +2776,33 @@ class BlockchainNode:
                 if r.status_code == 200:
                     data = r.json()
                     chain = data.get('chain')
-                    bc.chain = chain
-                    print(f"Synced chain from bootstrap node ({len(chain)} blocks)")
+                    bc.best_known_length = max(bc.best_known_length, len(chain))
+                    if bc.adopt_joined_chain(chain):
+                        print(f"Synced chain from bootstrap node ({len(chain)} blocks)")
             except Exception as e:
                 print(f"Could not sync chain from bootstrap: {e}")
+            bc.save_peer_table(self.peer_table_path)
         else:
             print("🛠️ This node IS acting as the bootstrap.")
 
-        # Step 4: Register the core P2P endpoints and start peer gossip
-        app.register_blueprint(blockchain_bp)
-        print("Registered blockchain P2P endpoints on Flask app.")
-
+        # Step 4: Start peer gossip
         threading.Thread(target=self.peer_gossip_loop, daemon=True).start()
 
         # Automatic chain sync for masters only
         if self.role == "master":
             threading.Thread(target=self.periodic_chain_sync, daemon=True).start()
 
-        # Expose app and port for others to read
-        self.app = app
+        # Non-master roles that act on contracts follow a master's block stream
+        if self.role in BLOCK_STREAM_ROLES and self.role != "master":
+            threading.Thread(target=self.block_stream_loop, daemon=True).start()
+
+        # Materialize contract state for the chain we joined with
+        bc.world_state.attach(self.role)
+
+        _startup_state["target_length"] = max(bc.best_known_length, len(longest_chain or []))
+        _startup_state["joined_at"] = time()
+        print(f"[STARTUP] Joined network in {(_startup_state['joined_at'] - _startup_state['started_at']):.2f}s "
+              f"(chain {len(bc.chain)}/{_startup_state['target_length']} blocks)")
 
     def register_with_peer(self, peer_address: str):
         """
@@ -923,7 +2813,8 @@ class BlockchainNode:
             payload = {
                 "nodes": [f"http://{self.MY_ADDRESS}"],
                 "role": self.role,
-                "is_local": False
+                "is_local": False,
+                "filter": bc.block_filter
             }
             jwt_token = get_jwt_token_with_retry()
             print(f"[DEBUG] Using JWT for registration: {jwt_token}")
@@ -935,15 +2826,15 @@ class BlockchainNode:
                 "Content-Type": "application/json"
             }
             print(f"[DEBUG] Registering with peer {peer_address} using JWT...")
-            r = requests.post(f"http://{peer_address}/nodes/register", json=payload, headers=headers, timeout=3)
+            r = requests.post(f"http://{get_pod_host_port(peer_address)}/nodes/register", json=payload, headers=headers, timeout=3)
             print(f"[DEBUG] Registration response: {r.status_code} {r.text}")
             if r.status_code == 201:
                 returned_peers = r.json().get("peers", [])
                 for pinfo in returned_peers:
                     addr = pinfo.get("address")
                     role = pinfo.get("role", "unknown")
-                    bc.register_node(addr, is_local=False)
-                    bc.set_peer_role(addr, role)
+                    bc.register_node(addr, is_local=False, role=role)
+                    bc.set_peer_filter(addr, pinfo.get("filter"))
                 print(f"Registered with peer at {peer_address}.  Peer returned {len(returned_peers)} peers.")
             else:
                 print(f"Peer at {peer_address} responded {r.status_code} {r.text}")
@@ -952,11 +2843,15 @@ class BlockchainNode:
 
     def peer_gossip_loop(self):
         """
-        Every 30 seconds, fetch each known peer's /nodes list (which includes role info)
-        and merge them into bc.nodes + bc.peers_roles. Remove unreachable peers from all sets.
+        Every GOSSIP_INTERVAL seconds, fetch each known peer's /nodes changes since
+        the last version we saw from it (all peers concurrently), then probe
+        only addresses not already known to be healthy via the cheap /health
+        endpoint, again concurrently. Reachable newcomers are merged into
+        bc.nodes + bc.peers_roles. Remove peers from all sets once
+        PEER_EVICT_FAILURES consecutive calls to them (from any code path) have failed.
         If no peers are present, attempt to re-register with the master (bootstrap) node.
         """
-        self.peer_failures = getattr(self, 'peer_failures', {})
+        peer_versions = {}  # peer → last /nodes version merged from it
         while True:
             current_peers = bc.get_node_addresses().copy()
             # If we have no peers, try to re-register with the master/bootstrap node
@@ -968,56 +2863,121 @@ class BlockchainNode:
                 except Exception as e:
                     print(f"[GOSSIP] Failed to re-register with master: {e}", flush=True)
                 current_peers = bc.get_node_addresses().copy()
-            for peer in current_peers:
+
+            # 1) Exchange peer-list deltas with every peer concurrently
+            def fetch_nodes(peer):
+                since = peer_versions.get(peer)
+                path = f"/nodes?since={since}" if since is not None else "/nodes"
+                r = peer_request("GET", peer, path, timeout=3)
+                if r.status_code != 200:
+                    bc.peer_health.record_failure(peer)
+                    return None
+                return r.json()
+
+            candidates = {}     # address → peer entry advertised by some peer
+            recheck = set()     # addresses some peer reported as removed
+            for peer, listing in run_concurrently(fetch_nodes, current_peers).items():
+                if listing is None:
+                    continue
+                if listing.get('version') is not None:
+                    peer_versions[peer] = listing['version']
+                for pinfo in listing.get("peers", []):
+                    addr = pinfo.get("address")
+                    role = pinfo.get("role")
+                    if addr and role and addr != bc.local_node:
+                        candidates[addr] = pinfo
+                recheck.update(a for a in listing.get("removed", []) if a in bc.nodes)
+
+            # 2) Probe only addresses not already known to be healthy
+            to_probe = {a for a in set(candidates) | recheck
+                        if not bc.peer_health.is_healthy(a, GOSSIP_INTERVAL)}
+            probed = run_concurrently(
+                lambda addr: peer_request("GET", addr, "/health", timeout=PEER_PROBE_TIMEOUT).status_code == 200,
+                to_probe)
+            for addr, pinfo in candidates.items():
+                if addr not in to_probe or probed.get(addr):
+                    bc.register_node(addr, is_local=False, role=pinfo["role"])
+                    bc.set_peer_filter(addr, pinfo.get("filter"))
+
+            # 3) Evict peers that keep failing, whichever code path saw the failures
+            evicted = False
+            for peer in bc.get_node_addresses():
+                if bc.peer_health.consecutive_failures(peer) >= PEER_EVICT_FAILURES:
+                    self.evict_peer(peer)
+                    peer_versions.pop(peer, None)
+                    evicted = True
+            if evicted:
+                # Enhanced: Immediately try to re-register with bootstrap/master node
                 try:
-                    host_port = get_pod_host_port(peer)
-                    r = requests.get(f"http://{host_port}/nodes", timeout=3)
-                    if r.status_code == 200:
-                        # Reset failure count
-                        self.peer_failures[peer] = 0
-                        their_list = r.json().get("peers", [])
-                        for pinfo in their_list:
-                            addr = pinfo.get("address")
-                            role = pinfo.get("role")
-                            if addr and role:
-                                # Only add if reachable
-                                try:
-                                    host_port2 = get_pod_host_port(addr)
-                                    r2 = requests.get(f"http://{host_port2}/chain", timeout=2)
-                                    if r2.status_code == 200:
-                                        bc.register_node(addr, is_local=False)
-                                        bc.set_peer_role(addr, role)
-                                except Exception:
-                                    continue
-                    else:
-                        self.peer_failures[peer] = self.peer_failures.get(peer, 0) + 1
-
-                    if self.peer_failures[peer] >= 3:
-                        bc.nodes.discard(peer)
-                        bc.peers_roles.pop(peer, None)
-                        bc.master_peers.discard(peer)
-                        print(f"Removed unreachable peer after 3 failures: {peer}")
-                        print(f"[DEBUG] After removal, nodes: {bc.nodes}")
-                        print(f"[DEBUG] After removal, master_peers: {bc.master_peers}")
-                except requests.exceptions.RequestException:
-                    self.peer_failures[peer] = self.peer_failures.get(peer, 0) + 1
-
-                    if self.peer_failures[peer] >= 3:
-                        bc.nodes.discard(peer)
-                        bc.peers_roles.pop(peer, None)
-                        bc.master_peers.discard(peer)
-                        print(f"Removed unreachable peer after 3 failures: {peer}")
-                        print(f"[DEBUG] After removal, nodes: {bc.nodes}")
-                        print(f"[DEBUG] After removal, master_peers: {bc.master_peers}")
-                        # Enhanced: Immediately try to re-register with bootstrap/master node
-                        try:
-                            self.register_with_peer(BOOTSTRAP_ADDRESS)
-                            print(f"[GOSSIP] Peer removal triggered re-registration with master at {BOOTSTRAP_ADDRESS}")
-                        except Exception as e:
-                            print(f"[GOSSIP] Re-registration with master failed: {e}")
+                    self.register_with_peer(BOOTSTRAP_ADDRESS)
+                    print(f"[GOSSIP] Peer removal triggered re-registration with master at {BOOTSTRAP_ADDRESS}")
+                except Exception as e:
+                    print(f"[GOSSIP] Re-registration with master failed: {e}")
+            # Probed addresses that never made it into the peer table leave no trace
+            bc.peer_health.prune(set(bc.get_node_addresses()) | {BOOTSTRAP_ADDRESS})
+            bc.save_peer_table(self.peer_table_path)
             print(f"[DEBUG] End of gossip cycle, nodes: {bc.nodes}")
             print(f"[DEBUG] End of gossip cycle, master_peers: {bc.master_peers}")
-            sleep(30)
+            sleep(GOSSIP_INTERVAL)
+
+    def block_stream_loop(self):
+        """
+        Keep one long-lived /blocks/stream subscription open to the fastest
+        healthy master, resuming from our tip after every reconnect, and feed
+        streamed blocks into the normal ingress path (seen-cache dedup drops
+        the copies that also arrive by gossip). A block the ingress queue
+        cannot take ends the subscription, so the resubscribe asks for it again.
+        """
+        backoff = 1
+        while True:
+            masters = bc.peer_health.rank(list(bc.master_peers)) or [BOOTSTRAP_ADDRESS]
+            source = masters[0]
+            try:
+                jwt_token = get_jwt_token_with_retry()
+                if not jwt_token:
+                    # The master would turn an unauthenticated subscription away
+                    raise requests.exceptions.RequestException("no JWT token yet")
+                headers = {"Authorization": f"Bearer {jwt_token}"}
+                host_port = get_pod_host_port(source)
+                params = dict(bc.block_filter_params() or {}, from_index=bc.last_block['index'] + 1)
+                with requests.get(f"http://{host_port}/blocks/stream", params=params, headers=headers,
+                                  stream=True, timeout=(3, BLOCK_STREAM_HEARTBEAT * 2)) as r:
+                    if r.status_code != 200:
+                        raise requests.exceptions.RequestException(f"stream answered {r.status_code}")
+                    print(f"[STREAM] Subscribed to {source} from index {params['from_index']}")
+                    backoff = 1
+                    data_lines = []
+                    for line in r.iter_lines(decode_unicode=True):
+                        if line.startswith('data:'):
+                            data_lines.append(line[5:].strip())
+                        elif not line and data_lines:
+                            self.handle_streamed_block(json.loads("\n".join(data_lines)), source)
+                            data_lines = []
+            except Exception as e:
+                print(f"[STREAM] Subscription to {source} ended: {e}")
+            sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def handle_streamed_block(self, block, source):
+        """Hand a streamed block to the ingress worker without re-announcing it."""
+        if bc.hash(block) in bc.seen_blocks:
+            return
+        if _block_ingress.enabled:
+            if not _block_ingress.submit([block], 1, source, wait=BLOCK_STREAM_ENQUEUE_WAIT):
+                # Dropping it silently would leave a gap until the next sync
+                raise queue.Full(f"ingress queue full at streamed block {block['index']}, resubscribing")
+        else:
+            with self.app.app_context(), bc.chain_lock:
+                process_incoming_block(block, relayed_by=source, announce=False)
+
+    def evict_peer(self, peer):
+        """Drop an unreachable peer from all peer sets and the health table."""
+        bc.remove_node(peer)
+        bc.peer_health.forget(peer)
+        invalidate_peer_address(peer)
+        print(f"Removed unreachable peer after {PEER_EVICT_FAILURES} failures: {peer}")
+        print(f"[DEBUG] After removal, nodes: {bc.nodes}")
+        print(f"[DEBUG] After removal, master_peers: {bc.master_peers}")
 
     def periodic_chain_sync(self):
         while True:
@@ -1069,22 +3029,135 @@ def get_pod_host_port(peer):
 
         # If we also have a pod_name, try to resolve pod_name to IP via DNS
         if len(parts) == 3:
-            _, _, pod_name = parts
-            namespace = os.environ.get("NAMESPACE", "blockchain-microservices")
-            # Try the pod FQDN first; if it resolves, use its IP
-            pod_fqdn = f"{pod_name}.{namespace}.pod.cluster.local"
-            try:
-                pod_ip = socket.gethostbyname(pod_fqdn)
+            # Try the pod FQDN first (cached); if it resolves, use its IP
+            pod_ip = _address_cache.resolve(pod_fqdn_for(peer))
+            if pod_ip:
                 return f"{pod_ip}:{port}"
-            except socket.gaierror:
-                # Fallback: return service-level addressing if we cannot resolve pod
-                return f"{host_or_svc}:{port}"
+            # Fallback: return service-level addressing if we cannot resolve pod
+            return f"{host_or_svc}:{port}"
 
         # No pod specified; return service-level address
         return f"{host_or_svc}:{port}"
 
     return peer
 
+def pod_fqdn_for(peer):
+    """Return the pod DNS name for a "host:port:pod_name" peer triple."""
+    pod_name = peer.split(':')[2]
+    namespace = os.environ.get("NAMESPACE", "blockchain-microservices")
+    return f"{pod_name}.{namespace}.pod.cluster.local"
+
+def invalidate_peer_address(peer):
+    """Drop a peer's cached pod address, e.g. when gossip removes it."""
+    if len(peer.split(':')) == 3:
+        _address_cache.invalidate(pod_fqdn_for(peer))
+
+def peer_request(method, peer, path, timeout=3, adaptive=True, **kwargs):
+    """
+    Issue an HTTP request to a stored peer address and record the outcome in
+    bc.peer_health. Raises PeerUnavailable without dialing while the peer's
+    circuit breaker is open. With adaptive=True the timeout shrinks towards
+    the peer's observed RTT for this endpoint class, never exceeding the given
+    default. Bearer-authenticated calls switch to the peer's session ticket
+    once it issued one.
+    """
+    if not bc.peer_health.is_available(peer):
+        raise PeerUnavailable(f"circuit open for {peer}")
+    kind = "read" if method.upper() in ("GET", "HEAD") else "write"
+    if adaptive:
+        timeout = bc.peer_health.timeout_for(peer, timeout, kind)
+    host_port = get_pod_host_port(peer)
+    bearer = (kwargs.get('headers') or {}).get('Authorization', '').startswith('Bearer ')
+    sent, used_ticket = _session_tickets.authorize(peer, method, path, kwargs) if SESSION_TICKETS and bearer else (kwargs, False)
+    started = time()
+    try:
+        r = requests.request(method, f"http://{host_port}{path}", timeout=timeout, **sent)
+        if used_ticket and r.status_code == 401:
+            # Ticket expired or the peer restarted with a new secret: fall back to the JWT
+            _session_tickets.forget(peer)
+            sent, _ = _session_tickets.authorize(peer, method, path, kwargs)
+            r = requests.request(method, f"http://{host_port}{path}", timeout=timeout, **sent)
+    except requests.exceptions.ReadTimeout:
+        # A write the peer accepted but is still working on: busy, not dead
+        if kind == "read":
+            bc.peer_health.record_failure(peer)
+        raise
+    except requests.exceptions.RequestException:
+        bc.peer_health.record_failure(peer)
+        raise
+    bc.peer_health.record_success(peer, time() - started, kind)
+    if bearer and SESSION_TICKETS:
+        _session_tickets.remember(peer, r)
+    return r
+
+def load_peer_table(path, local_address=None):
+    """
+    Read a peer table written by Blockchain.save_peer_table. Entries for our own
+    address or not seen within PEER_TABLE_MAX_AGE are dropped. Returns [] on any error.
+    """
+    try:
+        with open(path) as f:
+            table = json.load(f)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        print(f"[PEER_TABLE] Could not read peer table {path}: {e}")
+        return []
+    now = time()
+    entries = []
+    for entry in table.get("peers", []):
+        addr = entry.get("address")
+        if not addr or addr == local_address:
+            continue
+        last_seen = entry.get("last_seen") or table.get("saved_at") or 0
+        if now - last_seen > PEER_TABLE_MAX_AGE:
+            continue
+        entries.append(dict(entry, last_seen=last_seen))
+    return entries
+
+def load_peer_tables(pattern, local_address=None):
+    """
+    Read every peer table matching the glob `pattern` (ours and other pods' of
+    the same role on a shared volume), keeping the most recently seen entry per address.
+    """
+    merged = {}
+    for path in glob.glob(pattern):
+        for entry in load_peer_table(path, local_address=local_address):
+            known = merged.get(entry["address"])
+            if known is None or entry["last_seen"] > known["last_seen"]:
+                merged[entry["address"]] = entry
+    return list(merged.values())
+
+def probe_peer_table(entries):
+    """
+    Probe remembered peers' /health concurrently (before our Blockchain exists).
+    Returns {address: rtt_seconds} for the ones that answered.
+    """
+    def probe(addr):
+        started = time()
+        r = requests.get(f"http://{get_pod_host_port(addr)}/health", timeout=PEER_PROBE_TIMEOUT)
+        return time() - started if r.status_code == 200 else None
+    results = run_concurrently(probe, [e["address"] for e in entries])
+    return {addr: rtt for addr, rtt in results.items() if rtt is not None}
+
+def run_concurrently(fn, items, max_workers=16):
+    """
+    Call fn(item) for every item on a thread pool and return {item: result}.
+    Items whose call raised are left out of the result.
+    """
+    items = list(items)
+    if not items:
+        return {}
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(len(items), max_workers)) as executor:
+        futures = {executor.submit(fn, item): item for item in items}
+        for future, item in futures.items():
+            try:
+                results[item] = future.result()
+            except Exception:
+                continue
+    return results
+
 def get_kubernetes_service_name(service_name):
     """Convert service name to Kubernetes DNS format"""
     if service_name.endswith('-service'):
@@ -1114,69 +3187,52 @@ def discover_kubernetes_peers():
 
 def get_jwt_token_for_node():
     """
-    Get JWT token with automatic refresh. Caches token and refreshes before expiration.
-    Returns None if unable to get token after retries.
+    Return this node's cached JWT without touching the issuer, or None if
+    there is none yet (the background refresher is woken to fetch one).
     """
-    global _jwt_token_cache
-    current_time = time()
-    
-    # Check if we have a valid cached token (refresh 60 seconds before expiration)
-    if (_jwt_token_cache["token"] and 
-        _jwt_token_cache["expires_at"] > current_time + 60):
-        return _jwt_token_cache["token"]
-    
-    # Need to get a new token
-    issuer_url = os.environ.get("JWT_ISSUER_URL", "http://jwt-issuer-service:8443")
-    api_key = os.environ.get("NODE_API_KEY", "GxhLsgzHORw1rTDJMX3L2T85i9r52bQlLIhWxpGYjhA=")
-    
-    print(f"[JWT] Fetching new token from {issuer_url}/token")
-    
-    for attempt in range(5):
-        try:
-            resp = requests.post(f"{issuer_url}/token", headers={"Authorization": f"Bearer {api_key}"}, timeout=10)
-            if resp.status_code == 200:
-                data = resp.json()
-                token = data["token"]
-                expires_in = data.get("expires_in", 600)  # Default 10 minutes
-                
-                # Cache token with expiration time
-                _jwt_token_cache["token"] = token
-                _jwt_token_cache["expires_at"] = current_time + expires_in
-                
-                print(f"[JWT] Got fresh token, expires in {expires_in}s")
-                return token
-            else:
-                print(f"[JWT] Failed to get token: {resp.status_code} {resp.text}")
-        except Exception as e:
-            print(f"[JWT] Error getting token (attempt {attempt+1}/5): {e}")
-        
-        if attempt < 4:  # Don't sleep after last attempt
-            sleep(2)
-    
-    print("[JWT] Failed to get token after 5 attempts")
-    return None
+    return _jwt_token_cache.get()
 
-def get_jwt_token_with_retry(max_retries=3):
+def get_jwt_token_with_retry(max_wait=JWT_WAIT_TIMEOUT):
     """
-    Get JWT token with additional retry logic for critical operations.
-    Returns None if unable to get token.
+    Get JWT token for critical operations: wait for the single in-flight
+    fetch up to max_wait seconds, or at most JWT_REQUEST_WAIT inside a
+    request handler.
     """
-    for attempt in range(max_retries):
-        token = get_jwt_token_for_node()
-        if token:
-            return token
-        print(f"[JWT] Retry {attempt+1}/{max_retries} for token")
-        sleep(1)
-    return None
+    return _jwt_token_cache.get(wait=min(max_wait, JWT_REQUEST_WAIT) if has_request_context() else max_wait)
+
+def send_with_token(send, what="block", max_wait=JWT_WAIT_TIMEOUT):
+    """
+    Call send(headers) with this node's bearer token. If no token is there
+    within get_jwt_token_with_retry(max_wait)'s deadline, the send moves to a
+    background thread that waits up to JWT_WAIT_TIMEOUT; peers would reject it
+    without an Authorization header anyway. Returns True if sent right away.
+    """
+    jwt_token = get_jwt_token_with_retry(max_wait)
+    if jwt_token:
+        send({"Authorization": f"Bearer {jwt_token}"})
+        return True
+
+    def deferred():
+        deadline = time() + JWT_WAIT_TIMEOUT
+        token = None
+        while not token and time() < deadline:
+            token = _jwt_token_cache.get(wait=deadline - time())
+            if not token:
+                sleep(min(JWT_BACKOFF_BASE, max(0.0, deadline - time())))
+        if not token:
+            print(f"[JWT] Still no token after {JWT_WAIT_TIMEOUT}s, {what} not sent; peers will sync it")
+            return
+        send({"Authorization": f"Bearer {token}"})
+
+    print(f"[JWT] No token yet, sending {what} once one arrives")
+    threading.Thread(target=deferred, daemon=True).start()
+    return False
 
 def sync_chain_prefer_masters() -> bool:
     """
     Sync local chain preferring master peers first. Only if no longer valid chain
     is found among masters, check other peers. Returns True if chain replaced.
     """
-    replaced = False
-    longest_chain = bc.chain
-
     # Resolve master peers list
     master_peers: list[str] = []
     if hasattr(bc, 'master_peers') and bc.master_peers:
@@ -1187,42 +3243,36 @@ def sync_chain_prefer_masters() -> bool:
             if bc.peers_roles.get(peer) == "master":
                 master_peers.append(peer)
 
-    # 1) Try masters
-    for peer in master_peers:
-        try:
-            host_port = get_pod_host_port(peer)  # Use individual pod addresses
-            r = requests.get(f"http://{host_port}/chain", timeout=3)
-            if r.status_code == 200:
-                data = r.json()
-                length = data.get('length')
-                chain = data.get('chain')
-                if length and chain and length > len(longest_chain) and bc.valid_chain(chain):
-                    longest_chain = chain
-                    replaced = True
-        except Exception:
-            continue
+    # 1) Try masters; 2) only if there are no master peers at all, try other peers
+    candidates = master_peers if master_peers else bc.get_node_addresses()
+    longest_chain = bc.fetch_best_chain(candidates)
 
-    # 2) Only if there are no master peers at all, try other peers
-    if not master_peers:
-        for peer in bc.get_node_addresses():
-            if peer in master_peers:
-                continue
-            try:
-                host_port = get_pod_host_port(peer)  # Use individual pod addresses
-                r = requests.get(f"http://{host_port}/chain", timeout=3)
-                if r.status_code == 200:
-                    data = r.json()
-                    length = data.get('length')
-                    chain = data.get('chain')
-                    if length and chain and length > len(longest_chain) and bc.valid_chain(chain):
-                        longest_chain = chain
-                        replaced = True
-            except Exception:
-                continue
+    if longest_chain:
+        bc.replace_chain(longest_chain.copy())
+        return True
+    return False
 
-    if replaced:
-        bc.chain = longest_chain.copy()
-    return replaced
+def push_block(peer: str, block: dict, headers: dict, timeout: float = 3):
+    """
+    POST a block to a peer's /receive_block. If the peer answers 409 because
+    it is behind, fill the gap by pushing everything after its reported tip
+    (which includes this block) as one /receive_blocks segment.
+    """
+    r = peer_request("POST", peer, "/receive_block", json={'block': bc.block_for_peer(peer, block)},
+                     headers=headers, timeout=timeout)
+    if r.status_code == 409:
+        try:
+            peer_length = r.json().get('length')
+        except ValueError:
+            peer_length = None
+        if peer_length and peer_length < block['index']:
+            segment = [b for b in bc.chain[peer_length:] if b['index'] <= block['index']]
+            if segment and bc.hash(segment[-1]) == bc.hash(block):
+                print(f"[BROADCAST_DEBUG] {peer} is at {peer_length}, pushing {len(segment)} blocks")
+                segment = [bc.block_for_peer(peer, b) for b in segment]
+                r = peer_request("POST", peer, "/receive_blocks", json={'blocks': segment},
+                                 headers=headers, timeout=timeout, adaptive=False)
+    return r
 
 def broadcast_block_with_priority(block: dict) -> None:
     """
@@ -1248,24 +3298,65 @@ def broadcast_block_with_priority(block: dict) -> None:
     print(f"[BROADCAST_DEBUG] Other peers: {other_peers}")
     print(f"[BROADCAST_DEBUG] Current node role: {bc.peers_roles.get(bc.local_node)}")
 
-    jwt_token = get_jwt_token_with_retry()
-    headers = {"Authorization": f"Bearer {jwt_token}"} if jwt_token else {}
-
-    def post_block(peers: list[str]):
+    def post_block(peers: list[str], headers: dict):
         print(f"[BROADCAST_DEBUG] Broadcasting to {len(peers)} peers: {peers}")
         for peer in peers:
             try:
-                host_port = get_pod_host_port(peer)  # Use individual pod addresses
-                print(f"[BROADCAST_DEBUG] Sending block to {peer} at {host_port}")
-                requests.post(f"http://{host_port}/receive_block", json={'block': block}, headers=headers, timeout=3)
+                print(f"[BROADCAST_DEBUG] Sending block to {peer}")
+                push_block(peer, block, headers, timeout=3)
             except Exception as e:
                 print(f"[BROADCAST_DEBUG] Failed to send to {peer}: {e}")
                 continue
 
-    # Priority order
-    post_block(master_peers)
-    post_block(provider_peers)
-    post_block(other_peers)
+    def send(headers):
+        # Priority order
+        post_block(master_peers, headers)
+        post_block(provider_peers, headers)
+        post_block(other_peers, headers)
+
+    send_with_token(send, what=f"block {block['index']}")
+
+def announce_accepted_blocks(blocks: list[dict], ttl: int, exclude: str = None) -> None:
+    """
+    Announce accepted blocks onward: masters only to other masters, everyone
+    else to all peers. Filtered nodes hold partial blocks and stay leaves.
+    """
+    if bc.block_filter:
+        return
+    if bc.peers_roles.get(bc.local_node) == "master":
+        announce_blocks(blocks, ttl, list(bc.master_peers), exclude=exclude)
+    else:
+        announce_blocks(blocks, ttl, bc.get_node_addresses(), exclude=exclude)
+
+def announce_blocks(blocks: list[dict], ttl: int, candidates: list[str], exclude: str = None) -> None:
+    """
+    Announce (index, hash) of freshly accepted blocks to GOSSIP_FANOUT randomly
+    chosen peers with a decremented TTL, batching all blocks into one /inv
+    message. Peers pull bodies via /block/<hash> only for blocks they lack, so
+    replicas hearing about a block from several sources download it once.
+    """
+    ttl = int(ttl) - 1
+    if ttl <= 0 or not blocks:
+        return
+    peers = [p for p in bc.peer_health.rank(candidates) if p != exclude and p != bc.local_node]
+    if GOSSIP_FANOUT > 0 and len(peers) > GOSSIP_FANOUT:
+        peers = random.sample(peers, GOSSIP_FANOUT)
+    if not peers:
+        return
+
+    body = {
+        'inventory': [{'index': b['index'], 'hash': bc.hash(b)} for b in blocks],
+        'announced_by': bc.local_node,
+        'ttl': ttl
+    }
+    def send(headers):
+        for peer in peers:
+            try:
+                peer_request("POST", peer, "/inv", json=body, headers=headers, timeout=2)
+            except Exception:
+                pass
+    # Never hold up the caller (often the ingress worker) waiting for a token
+    send_with_token(send, what="announcement", max_wait=0)
 
 def mine_and_broadcast_transactions(transactions: list[dict], mined_by_identifier: str) -> dict:
     """
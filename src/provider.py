@@ -1,15 +1,16 @@
 # provider.py
 
 import sys
-import requests
 import sqlite3
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
 import node
+import resource_db
 from node import BlockchainNode
 import os
 import time
-from node import get_host_port
-from node import get_jwt_token_for_node
+import threading
+from node import push_block
+from node import send_with_token
 
 app = Flask(__name__)
 
@@ -18,41 +19,24 @@ if len(sys.argv) != 2:
     sys.exit(1)
 
 desired_port = int(sys.argv[1])
+MAX_BATCH_CITIES = int(os.environ.get("MAX_BATCH_CITIES", "1000"))
 
 # ─── 1) Launch the P2P/Blockchain "Provider" Node ─────────────────────────────
 provider_node = BlockchainNode(app, desired_port=desired_port, role="provider")
 
+if resource_db.CITY_CACHE_WARMUP:
+    threading.Thread(target=resource_db.warm_up, daemon=True).start()
+
+# Journal /update_resource writes and apply them in background batches
+resource_db.start_write_behind()
+
 # ─── 2) Database helper function ─────────────────────────────────────────────
 def get_city_resources(city_id):
     """
     Fetch disaster management resource data from local SQLite database
     """
     try:
-        conn = sqlite3.connect('/data/disaster_resources.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT city_id, city_name, resource_type, resources_allocated, 
-                   allocation_date, disaster_risk_level
-            FROM disaster_resources 
-            WHERE city_id = ?
-        ''', (city_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            return {
-                "city_id": row[0],
-                "city_name": row[1],
-                "resource_type": row[2],
-                "resources_allocated": row[3],
-                "allocation_date": row[4],
-                "disaster_risk_level": row[5]
-            }
-        else:
-            return None
-            
+        return resource_db.get_city(city_id)
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return None
@@ -83,6 +67,47 @@ def get_city(city_id):
         "blockTransactionData": blockTransactionData
     }), 200
 
+@app.route('/cities', methods=['GET'])
+def get_cities():
+    """
+    Batch variant of /city/<id>: /cities?ids=1,2,3
+    1) Look up every requested city with one SQL IN query (cached rows skipped).
+    2) Return the rows found (in request order), the ids that were not, and a
+       single blockTransactionData for the whole batch.
+    """
+    raw_ids = request.args.get('ids', '')
+    try:
+        city_ids = [int(x) for x in raw_ids.split(',') if x.strip()]
+    except ValueError:
+        return jsonify({"error": "ids must be a comma-separated list of integers"}), 400
+    if not city_ids:
+        return jsonify({"error": "Missing ids"}), 400
+    if len(city_ids) > MAX_BATCH_CITIES:
+        return jsonify({"error": f"At most {MAX_BATCH_CITIES} ids per batch"}), 400
+    print(f"[GET /cities] {len(city_ids)} ids handled by container: {os.uname()[1]}")
+
+    try:
+        rows = resource_db.get_cities(city_ids)
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return jsonify({"error": "Database error"}), 500
+    city_data = [row for row in rows.values() if row]
+    missing = [city_id for city_id, row in rows.items() if not row]
+    if not city_data:
+        return jsonify({"error": "None of the requested cities were found", "missing": missing}), 404
+
+    blockTransactionData = {
+        "sender": f"provider_{provider_node.MY_ADDRESS}",
+        "recipient": "BackToSender",
+        "requestInfo": f"/cities?ids={raw_ids}"
+    }
+
+    return jsonify({
+        "city_data": city_data,
+        "missing": missing,
+        "blockTransactionData": blockTransactionData
+    }), 200
+
 @app.route('/update_resource/<int:city_id>/<string:risk_level>', methods=['POST'])
 def update_resource(city_id, risk_level):
     """
@@ -92,19 +117,9 @@ def update_resource(city_id, risk_level):
     print(f"[POST /update_resource/{city_id}/{risk_level}] Handled by container: {os.uname()[1]}")
 
     # ─── (1) Sync step ──────────────────────────────────────────────────────────
-    longest_chain = node.bc.chain
-    for peer in node.bc.get_node_addresses():
-        try:
-            r = requests.get(f"http://{peer}/chain", timeout=3)
-            if r.status_code == 200:
-                data = r.json()
-                length = data.get('length')
-                chain  = data.get('chain')
-                if length and chain and length > len(longest_chain) and node.bc.valid_chain(chain):
-                    longest_chain = chain
-        except Exception:
-            continue
-    node.bc.chain = longest_chain.copy()
+    longest_chain = node.bc.fetch_best_chain(node.bc.get_node_addresses())
+    if longest_chain:
+        node.bc.replace_chain(longest_chain.copy())
 
     # ─── (2) Mine a dummy "log request" block ───────────────────────────────────
     # We create a minimal transaction whose only purpose is to record that
@@ -122,53 +137,27 @@ def update_resource(city_id, risk_level):
     new_block = node.bc.new_block(proof, mined_by=f"provider_{provider_node.MY_ADDRESS}")
 
     # Broadcast new block to all peers
-    jwt_token = get_jwt_token_for_node()
-    headers = {"Authorization": f"Bearer {jwt_token}"} if jwt_token else {}
-    
-    for peer in node.bc.get_node_addresses():
-        try:
-            host_port = get_host_port(peer)
-            requests.post(f"http://{host_port}/receive_block", json={'block': new_block}, headers=headers, timeout=2)
-        except Exception:
-            pass
-
-    """
-    Update resource allocation based on risk level:
-    - Low: 100
-    - Medium: 200
-    - High: 300
-    - Very High: 400
-    """
-    # Map risk levels to resource amounts
-    resource_map = {
-        "low": 100,
-        "medium": 200,
-        "high": 300,
-        "veryHigh": 400
-    }
-    
-    if risk_level not in resource_map:
+    def push_to_peers(headers):
+        # push_block answers a peer's 409 (behind) by pushing the missing segment
+        for peer in node.bc.get_node_addresses():
+            try:
+                push_block(peer, new_block, headers, timeout=2)
+            except Exception:
+                pass
+    send_with_token(push_to_peers)
+
+    # Resources per risk level come from the same table the contracts use
+    resources = resource_db.resources_for_risk_level(risk_level)
+    if resources is None:
         return jsonify({"error": "Invalid risk level"}), 400
         
     try:
-        conn = sqlite3.connect('/data/disaster_resources.db')
-        cursor = conn.cursor()
-        
-        # Update the resources_allocated and disaster_risk_level
-        cursor.execute('''
-            UPDATE disaster_resources 
-            SET resources_allocated = ?, disaster_risk_level = ?
-            WHERE city_id = ?
-        ''', (resource_map[risk_level], risk_level, city_id))
-        
-        if cursor.rowcount == 0:
-            conn.close()
+        # Update the resources_allocated and disaster_risk_level (queued under write-behind)
+        updated, queued = resource_db.set_allocation(city_id, resources, risk_level)
+        if updated == 0:
             return jsonify({"error": "City not found"}), 404
-            
-        conn.commit()
-        conn.close()
         
-        return jsonify({"message": "Resource allocation updated successfully"}), 200
+        return jsonify({"message": "Resource allocation updated successfully", "queued": queued}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -179,45 +168,25 @@ def direct_update_resource(city_id, risk_level):
     """
     print(f"[POST /direct_update_resource/{city_id}/{risk_level}] Handled by container: {os.uname()[1]}")
 
-    """
-    Update resource allocation based on risk level:
-    - Low: 100
-    - Medium: 200
-    - High: 300
-    - Very High: 400
-    """
-    # Map risk levels to resource amounts
-    resource_map = {
-        "low": 100,
-        "medium": 200,
-        "high": 300,
-        "veryHigh": 400
-    }
-    
-    if risk_level not in resource_map:
+    # Resources per risk level come from the same table the contracts use
+    resources = resource_db.resources_for_risk_level(risk_level)
+    if resources is None:
         return jsonify({"error": "Invalid risk level"}), 400
         
     try:
-        conn = sqlite3.connect('/data/disaster_resources.db')
-        cursor = conn.cursor()
-        
-        # Update the resources_allocated and disaster_risk_level
-        cursor.execute('''
-            UPDATE disaster_resources 
-            SET resources_allocated = ?, disaster_risk_level = ?
-            WHERE city_id = ?
-        ''', (resource_map[risk_level], risk_level, city_id))
-        
-        if cursor.rowcount == 0:
-            conn.close()
+        # Update the resources_allocated and disaster_risk_level (queued under write-behind)
+        updated, queued = resource_db.set_allocation(city_id, resources, risk_level)
+        if updated == 0:
             return jsonify({"error": "City not found"}), 404
-            
-        conn.commit()
-        conn.close()
         
-        return jsonify({"message": "Resource allocation updated successfully"}), 200
+        return jsonify({"message": "Resource allocation updated successfully", "queued": queued}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/db_metrics', methods=['GET'])
+def db_metrics():
+    """Return the SQLite connection pool state, city cache hit/miss metrics and write-behind queue depth."""
+    return jsonify(resource_db.metrics()), 200
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=provider_node.PORT, threaded=True)
\ No newline at end of file
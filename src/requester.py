@@ -3,7 +3,7 @@
 import sys
 import os
 import requests
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
 import node as node
 from node import BlockchainNode
 import time
@@ -81,6 +81,57 @@ def request_city(city_id):
     ).start()
     return jsonify(response_json), 200
 
+@app.route('/request', methods=['GET'])
+def request_cities():
+    """
+    Batch variant of /request/<city_id>: /request?ids=1,2,3
+    1) Fetch every city from the provider's /cities in one call.
+    2) Add our own blockTransactionData for the batch FIRST, then the provider's.
+    3) Return all rows (plus the ids not found) in one response.
+    4) Mine a single block for the whole batch in the background.
+    """
+    start_time = time.time()
+    ids = request.args.get('ids')
+    if not ids:
+        return jsonify({"error": "Missing ids"}), 400
+    try:
+        provider_service_name = os.environ.get("PROVIDER_SERVICE_NAME", "provider_service")
+        provider_addr = f"{provider_service_name}:5004"
+        host_port = get_host_port(provider_addr)
+        resp = requests.get(f"http://{host_port}/cities", params={"ids": ids}, timeout=5)
+        if resp.status_code in (400, 404):
+            return jsonify(resp.json()), resp.status_code
+        if resp.status_code != 200:
+            return jsonify({"error": "Provider error"}), 503
+        data = resp.json()
+    except Exception as e:
+        return jsonify({"error": "Failed to fetch provider data", "details": str(e)}), 503
+
+    block_transactions = [{
+        "sender": f"requester_{my_node.MY_ADDRESS}",
+        "recipient": provider_addr,
+        "requestInfo": f"/request?ids={ids}"
+    }]
+    if data.get("blockTransactionDataList"):
+        block_transactions.extend(data["blockTransactionDataList"])
+    elif data.get("blockTransactionData"):
+        block_transactions.append(data["blockTransactionData"])
+
+    timeItTook = (time.time() - start_time) * 1000  # ms
+    response_json = {
+        "city_data": data.get("city_data", []),
+        "missing": data.get("missing", []),
+        "message": f"Data for {len(data.get('city_data', []))} cities fetched and time it took was {round(timeItTook, 2)} ms"
+    }
+
+    import threading
+    threading.Thread(
+        target=node.mine_and_broadcast_transactions,
+        args=(block_transactions, f"requester_{my_node.MY_ADDRESS}"),
+        daemon=True
+    ).start()
+    return jsonify(response_json), 200
+
 @app.route('/update_resource/<int:city_id>/<string:risk_level>', methods=['POST'])
 def update_resource_allocation(city_id, risk_level):
     """
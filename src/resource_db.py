@@ -0,0 +1,936 @@
+# resource_db.py
+"""
+Data access layer for the disaster_resources SQLite database shared by the
+provider endpoints and Blockchain.apply_contracts.
+
+Connections are pooled instead of opened and closed per call, each one tuned
+once with the pragmas below. The SQL is fixed module-level text, so sqlite3's
+per-connection statement cache keeps it prepared across calls.
+
+WAL needs shared memory between every process touching the file, which an
+NFS mount (the Filestore volume in Kubernetes) cannot give across pods. So
+DB_JOURNAL_MODE=auto picks WAL on local disks and keeps the rollback journal
+on network filesystems.
+
+The same file also holds the world-state bookkeeping used by node.py's
+WorldState: which blocks have been applied, before-images of the rows each
+one changed (so a reorg can be rolled back to the fork point) and periodic
+snapshots of the allocation columns. Updates made directly by the provider
+endpoints are logged there too, so a rollback or restore re-applies them
+instead of silently reverting acknowledged writes.
+
+WRITE_BEHIND=1 turns allocation updates from the provider endpoints into
+write-behind: each one is appended to a journal on the persistent volume and
+acknowledged, a background writer folds the queued updates into batched
+transactions, and reads see queued values through an overlay until then.
+"""
+import fcntl
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# ─── Database Settings ─────────────────────────────────────────────
+DB_PATH = os.environ.get("RESOURCE_DB_PATH", "/data/disaster_resources.db")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_JOURNAL_MODE = os.environ.get("DB_JOURNAL_MODE", "auto")   # auto, WAL, DELETE, TRUNCATE...
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", "8192"))
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+DB_STATEMENT_CACHE = int(os.environ.get("DB_STATEMENT_CACHE", "64"))
+
+# ─── City Cache Settings ───────────────────────────────────────────
+# Rows are cached read-through and dropped by update_allocation, the only
+# write path. CITY_CACHE_TTL bounds staleness from writes made by other
+# provider pods sharing the same database file. CITY_CACHE_SIZE=0 disables it.
+CITY_CACHE_SIZE = int(os.environ.get("CITY_CACHE_SIZE", "10000"))
+CITY_CACHE_TTL = float(os.environ.get("CITY_CACHE_TTL", "30"))
+CITY_CACHE_WARMUP = os.environ.get("CITY_CACHE_WARMUP", "0") == "1"
+
+# ─── Write-Behind Settings ─────────────────────────────────────────
+# Acknowledged updates must outlive the pod, so each provider journals to its
+# own file (named after POD_NAME) in WRITE_BEHIND_JOURNAL_DIR, by default next
+# to the database on the persistent /data volume. A provider holds a lock on
+# its journal while it runs and, on start, adopts the journals of providers
+# that are gone. The writer refuses to start when the journal would sit on a
+# filesystem that dies with the container (EPHEMERAL_FILESYSTEMS) unless
+# WRITE_BEHIND_ALLOW_EPHEMERAL=1. When WRITE_BEHIND_MAX_PENDING cities are
+# queued, further updates are written synchronously instead.
+WRITE_BEHIND = os.environ.get("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_JOURNAL_DIR = os.environ.get("WRITE_BEHIND_JOURNAL_DIR",
+                                          os.path.join(os.path.dirname(DB_PATH) or ".", "write_behind"))
+WRITE_BEHIND_JOURNAL = os.environ.get("WRITE_BEHIND_JOURNAL", os.path.join(
+    WRITE_BEHIND_JOURNAL_DIR, f"{os.environ.get('POD_NAME') or os.uname().nodename}.journal"))
+WRITE_BEHIND_ALLOW_EPHEMERAL = os.environ.get("WRITE_BEHIND_ALLOW_EPHEMERAL", "0") == "1"
+WRITE_BEHIND_FSYNC = os.environ.get("WRITE_BEHIND_FSYNC", "1") == "1"
+WRITE_BEHIND_BATCH = int(os.environ.get("WRITE_BEHIND_BATCH", "500"))
+WRITE_BEHIND_INTERVAL = float(os.environ.get("WRITE_BEHIND_INTERVAL", "0.2"))
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get("WRITE_BEHIND_MAX_PENDING", "50000"))
+WRITE_BEHIND_COMPACT_BYTES = int(os.environ.get("WRITE_BEHIND_COMPACT_BYTES", str(8 * 1024 * 1024)))
+
+# Resources allocated per risk level by the update_resource_allocation contract
+RISK_LEVEL_RESOURCES = {
+    "low": 100,
+    "medium": 200,
+    "high": 300,
+    "veryHigh": 400,
+    "Very High": 400
+}
+
+NETWORK_FILESYSTEMS = ("nfs", "nfs4", "cifs", "smb3", "fuse.sshfs")
+# Container writable layers and memory-backed mounts: gone with the pod
+EPHEMERAL_FILESYSTEMS = ("overlay", "aufs", "tmpfs", "ramfs")
+
+CITY_COLUMNS = ("city_id", "city_name", "resource_type", "resources_allocated",
+                "allocation_date", "disaster_risk_level")
+
+SELECT_CITY = '''
+    SELECT city_id, city_name, resource_type, resources_allocated,
+           allocation_date, disaster_risk_level
+    FROM disaster_resources
+    WHERE city_id = ?
+'''
+
+SELECT_CITIES_IN = '''
+    SELECT city_id, city_name, resource_type, resources_allocated,
+           allocation_date, disaster_risk_level
+    FROM disaster_resources
+    WHERE city_id IN ({placeholders})
+'''
+
+# Stay under SQLITE_MAX_VARIABLE_NUMBER (999 on older builds) per IN query
+MAX_IN_PARAMS = 500
+
+SELECT_ALL_CITIES = '''
+    SELECT city_id, city_name, resource_type, resources_allocated,
+           allocation_date, disaster_risk_level
+    FROM disaster_resources
+    ORDER BY city_id
+    LIMIT ?
+'''
+
+UPDATE_ALLOCATION = '''
+    UPDATE disaster_resources
+    SET resources_allocated = ?, disaster_risk_level = ?
+    WHERE city_id = ?
+'''
+
+
+# ─── World State Tables ────────────────────────────────────────────
+# state_blocks holds the applied blocks still within the undo window; the
+# highest row is the applied tip. Index -1 is the state before any block.
+# The base snapshot (-1) copies every city; later snapshots copy only the
+# cities in state_dirty_cities, i.e. changed since the base. state_direct_writes
+# logs endpoint updates with the applied tip they were made at; those older
+# than every snapshot but the base shrink to the newest one per city.
+CREATE_STATE_TABLES = (
+    '''
+    CREATE TABLE IF NOT EXISTS state_blocks (
+        block_index INTEGER PRIMARY KEY,
+        block_hash TEXT NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS state_undo (
+        block_index INTEGER NOT NULL,
+        city_id INTEGER NOT NULL,
+        resources_allocated INTEGER NOT NULL,
+        disaster_risk_level TEXT NOT NULL,
+        PRIMARY KEY (block_index, city_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS state_snapshots (
+        snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        block_index INTEGER NOT NULL,
+        block_hash TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS state_snapshot_rows (
+        snapshot_id INTEGER NOT NULL,
+        city_id INTEGER NOT NULL,
+        resources_allocated INTEGER NOT NULL,
+        disaster_risk_level TEXT NOT NULL,
+        PRIMARY KEY (snapshot_id, city_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS state_dirty_cities (
+        city_id INTEGER PRIMARY KEY
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS state_direct_writes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        block_index INTEGER NOT NULL,
+        city_id INTEGER NOT NULL,
+        resources_allocated INTEGER NOT NULL,
+        disaster_risk_level TEXT NOT NULL
+    )
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_state_direct_writes_city ON state_direct_writes (city_id, seq)
+    '''
+)
+
+BASE_STATE_INDEX = -1
+
+SELECT_ALLOCATIONS_IN = '''
+    SELECT city_id, resources_allocated, disaster_risk_level
+    FROM disaster_resources
+    WHERE city_id IN ({placeholders})
+'''
+
+INSERT_UNDO = '''
+    INSERT OR REPLACE INTO state_undo (block_index, city_id, resources_allocated, disaster_risk_level)
+    VALUES (?, ?, ?, ?)
+'''
+
+SELECT_UNDO = '''
+    SELECT resources_allocated, disaster_risk_level, city_id
+    FROM state_undo
+    WHERE block_index = ?
+'''
+
+INSERT_SNAPSHOT_ROWS = '''
+    INSERT INTO state_snapshot_rows (snapshot_id, city_id, resources_allocated, disaster_risk_level)
+    SELECT ?, city_id, resources_allocated, disaster_risk_level
+    FROM disaster_resources
+'''
+
+INSERT_DIRTY_SNAPSHOT_ROWS = '''
+    INSERT INTO state_snapshot_rows (snapshot_id, city_id, resources_allocated, disaster_risk_level)
+    SELECT ?, d.city_id, d.resources_allocated, d.disaster_risk_level
+    FROM disaster_resources AS d
+    JOIN state_dirty_cities AS c ON c.city_id = d.city_id
+'''
+
+MARK_DIRTY = '''
+    INSERT OR IGNORE INTO state_dirty_cities (city_id) VALUES (?)
+'''
+
+# Seeds the dirty set of a database whose snapshots predate it
+MARK_DIRTY_SINCE_BASE = '''
+    INSERT OR IGNORE INTO state_dirty_cities (city_id)
+    SELECT d.city_id
+    FROM disaster_resources AS d
+    JOIN state_snapshot_rows AS b ON b.snapshot_id = ? AND b.city_id = d.city_id
+    WHERE d.resources_allocated != b.resources_allocated OR d.disaster_risk_level != b.disaster_risk_level
+'''
+
+# Only the newest write per city matters once no snapshot predates it
+COMPACT_DIRECT_WRITES = '''
+    DELETE FROM state_direct_writes
+    WHERE block_index < ? AND EXISTS (
+        SELECT 1 FROM state_direct_writes AS n
+        WHERE n.city_id = state_direct_writes.city_id AND n.seq > state_direct_writes.seq)
+'''
+
+INSERT_DIRECT_WRITE = '''
+    INSERT INTO state_direct_writes (block_index, city_id, resources_allocated, disaster_risk_level)
+    VALUES (?, ?, ?, ?)
+'''
+
+SELECT_DIRECT_WRITES_SINCE = '''
+    SELECT resources_allocated, disaster_risk_level, city_id
+    FROM state_direct_writes
+    WHERE block_index >= ?
+    ORDER BY seq
+'''
+
+# Rows a restore to snapshot ? (over base ?) would change: dirty cities that
+# differ from the snapshot's row, or from the base row if the snapshot has none
+COUNT_RESTORE_CHANGES = '''
+    SELECT COUNT(*)
+    FROM disaster_resources AS d
+    JOIN state_dirty_cities AS c ON c.city_id = d.city_id
+    JOIN state_snapshot_rows AS b ON b.snapshot_id = ? AND b.city_id = d.city_id
+    LEFT JOIN state_snapshot_rows AS s ON s.snapshot_id = ? AND s.city_id = d.city_id
+    WHERE d.resources_allocated != COALESCE(s.resources_allocated, b.resources_allocated)
+       OR d.disaster_risk_level != COALESCE(s.disaster_risk_level, b.disaster_risk_level)
+'''
+
+RESTORE_SNAPSHOT = '''
+    UPDATE disaster_resources
+    SET resources_allocated = s.resources_allocated,
+        disaster_risk_level = s.disaster_risk_level
+    FROM state_snapshot_rows AS s
+    WHERE s.snapshot_id = ? AND s.city_id = disaster_resources.city_id
+'''
+
+RESTORE_DIRTY_FROM_BASE = '''
+    UPDATE disaster_resources
+    SET resources_allocated = s.resources_allocated,
+        disaster_risk_level = s.disaster_risk_level
+    FROM state_snapshot_rows AS s
+    WHERE s.snapshot_id = ? AND s.city_id = disaster_resources.city_id
+      AND disaster_resources.city_id IN (SELECT city_id FROM state_dirty_cities)
+'''
+
+
+def filesystem_type(path):
+    """Return the filesystem type of the mount holding path, or None if unknown."""
+    try:
+        with open("/proc/mounts") as f:
+            mounts = [line.split() for line in f]
+    except OSError:
+        return None
+    target = os.path.realpath(os.path.dirname(path) or ".")
+    best, fs_type = "", None
+    for fields in mounts:
+        if len(fields) < 3:
+            continue
+        mount_point = fields[1]
+        if (target == mount_point or target.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) > len(best):
+            best, fs_type = mount_point, fields[2]
+    return fs_type
+
+
+class ConnectionPool:
+    """
+    A small LIFO pool of tuned SQLite connections. Borrowed connections are
+    returned after use; one that raised is closed rather than reused.
+    """
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.journal_mode = None
+        self.opened = 0
+        self.borrowed = 0
+
+    def _journal_mode(self):
+        if DB_JOURNAL_MODE.lower() != "auto":
+            return DB_JOURNAL_MODE
+        return "DELETE" if filesystem_type(self.path) in NETWORK_FILESYSTEMS else "WAL"
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                               check_same_thread=False, cached_statements=DB_STATEMENT_CACHE)
+        wanted = self._journal_mode()
+        mode = conn.execute(f"PRAGMA journal_mode={wanted}").fetchone()[0]
+        if mode.lower() != wanted.lower():
+            print(f"[DB] journal_mode={wanted} not supported for {self.path}, using {mode}")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        # NORMAL is durable under WAL; the rollback journal keeps FULL
+        conn.execute(f"PRAGMA synchronous={'NORMAL' if mode.lower() == 'wal' else 'FULL'}")
+        if mode.lower() == "wal":
+            conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        with self._lock:
+            self.opened += 1
+            if self.journal_mode != mode:
+                self.journal_mode = mode
+                print(f"[DB] Opened {self.path} with journal_mode={mode}")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        with self._lock:
+            self.borrowed += 1
+        try:
+            yield conn
+        except Exception:
+            conn.close()
+            raise
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "journal_mode": self.journal_mode,
+                "pool_size": self.size,
+                "idle": self._idle.qsize(),
+                "opened": self.opened,
+                "borrowed": self.borrowed
+            }
+
+
+class CityCache:
+    """
+    Size-bounded LRU of city rows keyed by city_id, including negative
+    entries for unknown ids. Invalidation bumps a generation counter so a read
+    that raced with a write cannot put the pre-write row back.
+    """
+    MISSING = object()
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._rows = OrderedDict()  # city_id → (row or None, cached_at)
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, city_id):
+        """Return the cached row (None for a known-missing id) or MISSING."""
+        with self._lock:
+            entry = self._rows.get(city_id)
+            if entry and (not self.ttl or time.time() - entry[1] < self.ttl):
+                self._rows.move_to_end(city_id)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._rows[city_id]
+            self.misses += 1
+            return self.MISSING
+
+    def put(self, city_id, row, generation):
+        with self._lock:
+            if generation != self.generation:
+                return  # a write landed while this row was being read
+            self._rows[city_id] = (row, time.time())
+            self._rows.move_to_end(city_id)
+            while len(self._rows) > self.max_size:
+                self._rows.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += len(self._rows)
+            self._rows.clear()
+
+    def invalidate(self, city_ids):
+        with self._lock:
+            self.generation += 1
+            for city_id in city_ids:
+                if self._rows.pop(city_id, None) is not None:
+                    self.invalidations += 1
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.max_size > 0,
+                "entries": len(self._rows),
+                "capacity": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0,
+                "invalidations": self.invalidations
+            }
+
+
+class WriteBehindQueue:
+    """
+    Allocation updates acknowledged before they reach SQLite. submit() appends
+    the update to a local journal (fsynced) and records it in an overlay keyed
+    by city_id, so repeated updates to one city coalesce into one row write.
+    flush() writes up to WRITE_BEHIND_BATCH overlay entries in one
+    transaction, drops those not superseded meanwhile, and truncates (or
+    compacts) the journal. On start the journal, and any journal in the same
+    directory whose owner no longer holds its lock, is replayed into the overlay.
+    """
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self._journal = None
+        self._owner_lock = None  # open <journal>.lock, flocked while we run
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = OrderedDict()  # city_id → (resources_allocated, risk_level, seq, queued_at)
+        self.seq = 0
+        self.running = False
+        self.enqueued = 0
+        self.coalesced = 0
+        self.recovered = 0
+        self.adopted_journals = 0
+        self.flushed_rows = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_flush_seconds = 0
+
+    def start(self):
+        """
+        Lock and replay our journal, adopt orphaned ones, and start the
+        background writer. Raises RuntimeError if the journal would not be
+        durable or another live process owns it.
+        """
+        with self._lock:
+            if self.running:
+                return
+            journal_dir = os.path.dirname(self.journal_path) or "."
+            os.makedirs(journal_dir, exist_ok=True)
+            fs_type = filesystem_type(self.journal_path)
+            if fs_type in EPHEMERAL_FILESYSTEMS and not WRITE_BEHIND_ALLOW_EPHEMERAL:
+                raise RuntimeError(f"write-behind journal {self.journal_path} is on {fs_type}, which does not outlive "
+                                   f"the container; set WRITE_BEHIND_JOURNAL_DIR to a persistent volume")
+            self._owner_lock = self._try_lock(self.journal_path)
+            if self._owner_lock is None:
+                raise RuntimeError(f"write-behind journal {self.journal_path} is in use by another process")
+            self._replay(self.journal_path, keep_seq=True)
+            orphans = []
+            for name in sorted(os.listdir(journal_dir)):
+                path = os.path.join(journal_dir, name)
+                if not name.endswith(".journal") or path == self.journal_path:
+                    continue
+                lock = self._try_lock(path)
+                if lock is None:
+                    continue  # its provider is still running
+                self._replay(path, keep_seq=False)
+                orphans.append((path, lock))
+            self._rewrite_journal()  # adopted entries are durable in ours; also drops a torn tail
+            for path, lock in orphans:
+                if os.path.exists(path):
+                    os.remove(path)
+                    self.adopted_journals += 1
+                os.remove(lock.name)
+                lock.close()
+            self.running = True
+        if self.recovered:
+            print(f"[DB] Recovered {self.recovered} journaled updates ({len(self._pending)} cities) from "
+                  f"{self.journal_path} and {self.adopted_journals} orphaned journals")
+        threading.Thread(target=self.writer_loop, daemon=True).start()
+        if self._pending:
+            self._wakeup.set()
+
+    @staticmethod
+    def _try_lock(journal_path):
+        """Take the exclusive lock on journal_path's owner file; return the open file, or None if held."""
+        lock = open(journal_path + ".lock", "a")
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return None
+        return lock
+
+    def _replay(self, path, keep_seq):
+        """Queue a journal's entries; an adopted journal's are renumbered after ours (caller holds _lock)."""
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # torn final line from a crash mid-append
+                seq = entry["seq"] if keep_seq else self.seq + 1
+                self._record(entry["city_id"], entry["resources_allocated"], entry["risk_level"], seq)
+                self.recovered += 1
+
+    def _record(self, city_id, resources_allocated, risk_level, seq):
+        if self._pending.pop(city_id, None) is not None:
+            self.coalesced += 1
+        self._pending[city_id] = (resources_allocated, risk_level, seq, time.time())
+        self.seq = max(self.seq, seq)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, city_id, resources_allocated, risk_level):
+        """Journal and queue an update; return False if the queue is full or not running."""
+        with self._lock:
+            if not self.running or len(self._pending) >= WRITE_BEHIND_MAX_PENDING:
+                return False
+            seq = self.seq + 1
+            self._journal.write(json.dumps({"seq": seq, "city_id": city_id, "resources_allocated": resources_allocated,
+                                            "risk_level": risk_level}) + "\n")
+            self._journal.flush()
+            if WRITE_BEHIND_FSYNC:
+                os.fsync(self._journal.fileno())
+            self._record(city_id, resources_allocated, risk_level, seq)
+            self.enqueued += 1
+        self._wakeup.set()
+        return True
+
+    def overlay(self, city_id, row):
+        """Return row with any queued update for city_id applied on top."""
+        entry = self._pending.get(city_id)
+        if entry is None or row is None:
+            return row
+        return dict(row, resources_allocated=entry[0], disaster_risk_level=entry[1])
+
+    def flush(self, limit=None):
+        """Write queued updates (all of them, or one batch of limit); return the number of rows written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = list(self._pending.items())[:limit or len(self._pending)]
+                if not batch:
+                    break
+                started = time.time()
+                try:
+                    with transaction() as conn:
+                        rows = [(res, risk, city_id) for city_id, (res, risk, _, _) in batch]
+                        conn.executemany(UPDATE_ALLOCATION, rows)
+                        record_direct_writes(conn, rows)
+                finally:
+                    _city_cache.invalidate([city_id for city_id, _ in batch])
+                with self._lock:
+                    for city_id, (_, _, seq, _) in batch:
+                        if self._pending.get(city_id, (None, None, None))[2] == seq:
+                            del self._pending[city_id]
+                    self._checkpoint()
+                    self.flushed_rows += len(batch)
+                    self.batches += 1
+                    self.last_flush_seconds = time.time() - started
+                written += len(batch)
+                if limit:
+                    break
+        return written
+
+    def _checkpoint(self):
+        """Drop journal entries that are already in SQLite (caller holds _lock)."""
+        if not self._pending:
+            self._journal.seek(0)
+            self._journal.truncate()
+        elif self._journal.tell() > WRITE_BEHIND_COMPACT_BYTES:
+            self._rewrite_journal()
+
+    def _rewrite_journal(self):
+        """Atomically replace the journal with just the pending entries (caller holds _lock)."""
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for city_id, (res, risk, seq, _) in self._pending.items():
+                f.write(json.dumps({"seq": seq, "city_id": city_id, "resources_allocated": res,
+                                    "risk_level": risk}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+        if self._journal:
+            self._journal.close()
+        self._journal = open(self.journal_path, "a")
+
+    def writer_loop(self):
+        delay = WRITE_BEHIND_INTERVAL
+        while True:
+            self._wakeup.wait()
+            time.sleep(delay)  # let more updates arrive and coalesce
+            self._wakeup.clear()
+            try:
+                while self.flush(limit=WRITE_BEHIND_BATCH):
+                    pass
+                delay = WRITE_BEHIND_INTERVAL
+            except Exception as e:
+                self.errors += 1
+                delay = min(delay * 2, 5.0)
+                self._wakeup.set()
+                print(f"[DB] Write-behind flush failed, {len(self._pending)} cities still queued: {e}")
+
+    def metrics(self):
+        with self._lock:
+            oldest = next(iter(self._pending.values()), None)
+            return {
+                "enabled": self.running,
+                "depth": len(self._pending),
+                "oldest_pending_seconds": time.time() - oldest[3] if oldest else 0,
+                "enqueued": self.enqueued,
+                "coalesced": self.coalesced,
+                "recovered": self.recovered,
+                "adopted_journals": self.adopted_journals,
+                "journal": self.journal_path,
+                "flushed_rows": self.flushed_rows,
+                "batches": self.batches,
+                "errors": self.errors,
+                "last_flush_seconds": self.last_flush_seconds,
+                "journal_bytes": self._journal.tell() if self._journal else 0
+            }
+
+
+_pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+_city_cache = CityCache(CITY_CACHE_SIZE, CITY_CACHE_TTL)
+_write_behind = WriteBehindQueue(WRITE_BEHIND_JOURNAL)
+
+
+def database_exists():
+    return os.path.exists(DB_PATH)
+
+
+@contextmanager
+def transaction(immediate=False):
+    """
+    Borrow a connection and run the block in one transaction (commit or roll
+    back). immediate=True takes the write lock up front, for read-then-write
+    work that other processes sharing the file must not interleave with.
+    """
+    with _pool.connection() as conn:
+        with conn:
+            if immediate:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+
+
+def get_city(city_id):
+    """Return one city row as a dict, or None if it does not exist (read-through cached)."""
+    if CITY_CACHE_SIZE > 0:
+        cached = _city_cache.get(city_id)
+        if cached is not CityCache.MISSING:
+            return _write_behind.overlay(city_id, dict(cached) if cached else None)
+        generation = _city_cache.generation
+    with _pool.connection() as conn:
+        row = conn.execute(SELECT_CITY, (city_id,)).fetchone()
+    city = dict(zip(CITY_COLUMNS, row)) if row else None
+    if CITY_CACHE_SIZE > 0:
+        _city_cache.put(city_id, city, generation)
+        city = dict(city) if city else None
+    return _write_behind.overlay(city_id, city)
+
+
+def get_cities(city_ids):
+    """
+    Return {city_id: row dict or None} for a batch of ids. Cached rows are
+    served from the city cache; the rest come from a single IN query (one per
+    MAX_IN_PARAMS ids) and are cached on the way out.
+    """
+    city_ids = list(dict.fromkeys(city_ids))
+    found = {}
+    pending = []
+    for city_id in city_ids:
+        cached = _city_cache.get(city_id) if CITY_CACHE_SIZE > 0 else CityCache.MISSING
+        if cached is CityCache.MISSING:
+            pending.append(city_id)
+        else:
+            found[city_id] = dict(cached) if cached else None
+    generation = _city_cache.generation
+    for start in range(0, len(pending), MAX_IN_PARAMS):
+        chunk = pending[start:start + MAX_IN_PARAMS]
+        sql = SELECT_CITIES_IN.format(placeholders=",".join("?" * len(chunk)))
+        with _pool.connection() as conn:
+            rows = {row[0]: dict(zip(CITY_COLUMNS, row)) for row in conn.execute(sql, chunk)}
+        for city_id in chunk:
+            city = rows.get(city_id)
+            found[city_id] = city
+            if CITY_CACHE_SIZE > 0:
+                _city_cache.put(city_id, dict(city) if city else None, generation)
+    return {city_id: _write_behind.overlay(city_id, found[city_id]) for city_id in city_ids}
+
+
+def update_allocation(city_id, resources_allocated, risk_level):
+    """Set a city's allocation and risk level; return the number of rows changed."""
+    try:
+        with transaction() as conn:
+            changed = conn.execute(UPDATE_ALLOCATION, (resources_allocated, risk_level, city_id)).rowcount
+            if changed:
+                record_direct_writes(conn, [(resources_allocated, risk_level, city_id)])
+            return changed
+    finally:
+        _city_cache.invalidate([city_id])
+
+
+def set_allocation(city_id, resources_allocated, risk_level):
+    """
+    Allocation update from the provider endpoints. With write-behind running
+    the update is journaled and queued; otherwise (or when the queue is full)
+    it is written now. Returns (rows changed, queued), rows being 0 for an
+    unknown city.
+    """
+    if _write_behind.running:
+        if get_city(city_id) is None:
+            return 0, False
+        if _write_behind.submit(city_id, resources_allocated, risk_level):
+            return 1, True
+        flush_write_behind()  # queue full: drain it so this write is not overwritten later
+    return update_allocation(city_id, resources_allocated, risk_level), False
+
+
+def start_write_behind():
+    """Start the write-behind writer when WRITE_BEHIND=1; return whether it runs."""
+    if WRITE_BEHIND:
+        _write_behind.start()
+    return _write_behind.running
+
+
+def flush_write_behind():
+    """Write every queued update now, so later writes are ordered after them."""
+    return _write_behind.flush() if _write_behind.running else 0
+
+
+def resources_for_risk_level(risk_level):
+    """Resources for a contract's risk level (case-insensitive), or None if unknown or not a string."""
+    if not isinstance(risk_level, str):
+        return None
+    key = risk_level.lower() if risk_level.lower() in RISK_LEVEL_RESOURCES else risk_level
+    return RISK_LEVEL_RESOURCES.get(key)
+
+
+def invalidate_cities(city_ids=None):
+    """Drop the given cities from the city cache, or every cached row if city_ids is None."""
+    if city_ids is None:
+        _city_cache.clear()
+    else:
+        _city_cache.invalidate(list(city_ids))
+
+
+# ─── World State Bookkeeping ───────────────────────────────────────
+# Every function below runs inside the caller's transaction(immediate=True).
+_state_tracking = False  # set once ensure_state_tables ran: endpoint writes are logged from then on
+
+def ensure_state_tables():
+    """Create the world-state tables and record the current rows as the base state, once."""
+    global _state_tracking
+    with transaction(immediate=True) as conn:
+        had_dirty_table = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'state_dirty_cities'").fetchone()
+        for statement in CREATE_STATE_TABLES:
+            conn.execute(statement)
+        _state_tracking = True
+        base = conn.execute("SELECT snapshot_id FROM state_snapshots WHERE block_index = ?",
+                            (BASE_STATE_INDEX,)).fetchone()
+        if base:
+            if not had_dirty_table:
+                conn.execute(MARK_DIRTY_SINCE_BASE, base)
+            return False
+        take_snapshot(conn, BASE_STATE_INDEX, "")
+        conn.execute("DELETE FROM state_blocks")
+        conn.execute("DELETE FROM state_undo")
+        conn.execute("INSERT INTO state_blocks (block_index, block_hash) VALUES (?, ?)", (BASE_STATE_INDEX, ""))
+        print(f"[DB] Recorded base world state in {DB_PATH}")
+        return True
+
+
+def state_history(conn):
+    """Applied (block_index, block_hash) pairs still in the undo window, newest first."""
+    return conn.execute("SELECT block_index, block_hash FROM state_blocks ORDER BY block_index DESC").fetchall()
+
+
+def apply_block_state(conn, block_index, block_hash, updates):
+    """
+    Apply one block's {city_id: (resources_allocated, risk_level)} and mark it
+    applied, saving the before-image of every row it changes for rollback.
+    Returns the number of rows changed.
+    """
+    changed = 0
+    if updates:
+        ids = list(updates)
+        for start in range(0, len(ids), MAX_IN_PARAMS):
+            chunk = ids[start:start + MAX_IN_PARAMS]
+            sql = SELECT_ALLOCATIONS_IN.format(placeholders=",".join("?" * len(chunk)))
+            conn.executemany(INSERT_UNDO, ((block_index,) + tuple(row) for row in conn.execute(sql, chunk).fetchall()))
+        rows = [(resources, risk_level, city_id) for city_id, (resources, risk_level) in updates.items()]
+        changed = conn.executemany(UPDATE_ALLOCATION, rows).rowcount
+        conn.executemany(MARK_DIRTY, ((city_id,) for city_id in ids))
+    conn.execute("INSERT OR REPLACE INTO state_blocks (block_index, block_hash) VALUES (?, ?)",
+                 (block_index, block_hash))
+    return changed
+
+
+def rollback_state(conn, to_index):
+    """Undo every applied block above to_index, newest first; return the city ids restored."""
+    touched = set()
+    blocks = conn.execute("SELECT block_index FROM state_blocks WHERE block_index > ? ORDER BY block_index DESC",
+                          (to_index,)).fetchall()
+    for (block_index,) in blocks:
+        rows = conn.execute(SELECT_UNDO, (block_index,)).fetchall()
+        conn.executemany(UPDATE_ALLOCATION, rows)
+        touched.update(row[2] for row in rows)
+    conn.execute("DELETE FROM state_undo WHERE block_index > ?", (to_index,))
+    conn.execute("DELETE FROM state_blocks WHERE block_index > ?", (to_index,))
+    return touched
+
+
+def state_snapshots(conn):
+    """(snapshot_id, block_index, block_hash) of every snapshot, newest block first."""
+    return conn.execute("SELECT snapshot_id, block_index, block_hash FROM state_snapshots "
+                        "ORDER BY block_index DESC, snapshot_id DESC").fetchall()
+
+
+def take_snapshot(conn, block_index, block_hash, keep=None):
+    """
+    Record the allocation columns as the state after block_index: every city
+    for the base snapshot, only the cities changed since the base otherwise.
+    With keep set, only the newest keep snapshots survive besides the base.
+    """
+    snapshot_id = conn.execute("INSERT INTO state_snapshots (block_index, block_hash, created_at) VALUES (?, ?, ?)",
+                               (block_index, block_hash, time.time())).lastrowid
+    conn.execute(INSERT_SNAPSHOT_ROWS if block_index == BASE_STATE_INDEX else INSERT_DIRTY_SNAPSHOT_ROWS,
+                 (snapshot_id,))
+    if keep is not None:
+        stale = conn.execute("SELECT snapshot_id FROM state_snapshots WHERE block_index != ? "
+                             "ORDER BY block_index DESC, snapshot_id DESC LIMIT -1 OFFSET ?",
+                             (BASE_STATE_INDEX, keep)).fetchall()
+        conn.executemany("DELETE FROM state_snapshot_rows WHERE snapshot_id = ?", stale)
+        conn.executemany("DELETE FROM state_snapshots WHERE snapshot_id = ?", stale)
+        oldest = conn.execute("SELECT MIN(block_index) FROM state_snapshots WHERE block_index != ?",
+                              (BASE_STATE_INDEX,)).fetchone()[0]
+        conn.execute(COMPACT_DIRECT_WRITES, (oldest,))
+    return snapshot_id
+
+
+def restore_snapshot(conn, snapshot_id):
+    """
+    Reset every city to the snapshot and make its block the applied tip. The
+    undo history and any newer snapshots (from the abandoned fork) are dropped.
+    Cities changed since the base but absent from the snapshot go back to
+    their base row. Returns (block_index, rows reverted).
+    """
+    block_index, block_hash = conn.execute("SELECT block_index, block_hash FROM state_snapshots WHERE snapshot_id = ?",
+                                           (snapshot_id,)).fetchone()
+    base_id = conn.execute("SELECT snapshot_id FROM state_snapshots WHERE block_index = ?",
+                           (BASE_STATE_INDEX,)).fetchone()[0]
+    reverted = conn.execute(COUNT_RESTORE_CHANGES, (base_id, snapshot_id)).fetchone()[0]
+    print(f"[DB] Restoring world state to the snapshot of block {block_index}: {reverted} rows revert to it")
+    if snapshot_id != base_id:
+        conn.execute(RESTORE_DIRTY_FROM_BASE, (base_id,))
+    conn.execute(RESTORE_SNAPSHOT, (snapshot_id,))
+    newer = conn.execute("SELECT snapshot_id FROM state_snapshots WHERE block_index > ?", (block_index,)).fetchall()
+    conn.executemany("DELETE FROM state_snapshot_rows WHERE snapshot_id = ?", newer)
+    conn.executemany("DELETE FROM state_snapshots WHERE snapshot_id = ?", newer)
+    conn.execute("DELETE FROM state_undo")
+    conn.execute("DELETE FROM state_blocks")
+    conn.execute("INSERT INTO state_blocks (block_index, block_hash) VALUES (?, ?)", (block_index, block_hash))
+    return block_index, reverted
+
+
+def record_direct_writes(conn, rows):
+    """Log endpoint updates [(resources_allocated, risk_level, city_id)] at the current applied tip."""
+    if not _state_tracking or not rows:
+        return
+    tip = conn.execute("SELECT MAX(block_index) FROM state_blocks").fetchone()[0]
+    if tip is None:
+        return
+    conn.executemany(INSERT_DIRECT_WRITE, ((tip, city_id, res, risk) for res, risk, city_id in rows))
+    conn.executemany(MARK_DIRTY, ((city_id,) for _, _, city_id in rows))
+
+
+def reapply_direct_writes(conn, since_index, at_index):
+    """
+    After a rollback or restore to at_index, write back the endpoint updates
+    made at applied tip since_index or later, oldest first, and file them
+    under at_index, where they now sit. Returns the city ids written.
+    """
+    rows = conn.execute(SELECT_DIRECT_WRITES_SINCE, (since_index,)).fetchall()
+    conn.executemany(UPDATE_ALLOCATION, rows)
+    conn.execute("UPDATE state_direct_writes SET block_index = ? WHERE block_index >= ?", (at_index, since_index))
+    return [row[2] for row in rows]
+
+
+def prune_state(conn, below_index):
+    """Forget undo history for blocks below below_index (snapshots cover anything older)."""
+    conn.execute("DELETE FROM state_undo WHERE block_index < ?", (below_index,))
+    conn.execute("DELETE FROM state_blocks WHERE block_index < ?", (below_index,))
+
+
+def warm_up():
+    """Preload up to CITY_CACHE_SIZE rows into the city cache; return how many were loaded."""
+    if CITY_CACHE_SIZE <= 0:
+        return 0
+    generation = _city_cache.generation
+    with _pool.connection() as conn:
+        rows = conn.execute(SELECT_ALL_CITIES, (CITY_CACHE_SIZE,)).fetchall()
+    for row in rows:
+        _city_cache.put(row[0], dict(zip(CITY_COLUMNS, row)), generation)
+    print(f"[DB] Warmed city cache with {len(rows)} rows")
+    return len(rows)
+
+
+def metrics():
+    return dict(_pool.metrics(), city_cache=_city_cache.metrics(), write_behind=_write_behind.metrics())
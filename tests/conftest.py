@@ -0,0 +1,30 @@
+# conftest.py
+"""
+Shared fixtures. The services run from src/ and scripts/ with those
+directories on sys.path, so the tests import them the same way.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "scripts")]
+
+import db_setup
+import resource_db
+
+
+@pytest.fixture
+def city_db(tmp_path, monkeypatch):
+    """
+    resource_db pointed at a fresh database of the 10 sample cities, with its
+    own pool, an empty city cache and world-state tracking off. Returns the path.
+    """
+    path = str(tmp_path / "disaster_resources.db")
+    db_setup.setup_database(path)
+    monkeypatch.setattr(resource_db, "DB_PATH", path)
+    monkeypatch.setattr(resource_db, "_pool", resource_db.ConnectionPool(path, 2))
+    monkeypatch.setattr(resource_db, "_city_cache", resource_db.CityCache(100, 0))
+    monkeypatch.setattr(resource_db, "_state_tracking", False)
+    return path
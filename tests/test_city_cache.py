@@ -0,0 +1,66 @@
+# test_city_cache.py
+import resource_db
+from resource_db import CityCache
+
+ROW = {"city_id": 1, "resources_allocated": 300}
+
+
+def test_put_then_get_and_negative_entries():
+    cache = CityCache(10, 0)
+    assert cache.get(1) is CityCache.MISSING
+    cache.put(1, ROW, cache.generation)
+    cache.put(2, None, cache.generation)
+    assert cache.get(1) == ROW
+    assert cache.get(2) is None  # known to be missing, not a miss
+    assert cache.metrics()["hits"] == 2
+
+
+def test_read_that_raced_a_write_is_not_cached():
+    cache = CityCache(10, 0)
+    generation = cache.generation  # a reader starts...
+    cache.invalidate([1])          # ...a write to the city lands...
+    cache.put(1, ROW, generation)  # ...and the reader's pre-write row comes back
+    assert cache.get(1) is CityCache.MISSING
+
+
+def test_invalidate_and_clear_bump_the_generation():
+    cache = CityCache(10, 0)
+    cache.put(1, ROW, cache.generation)
+    cache.put(2, ROW, cache.generation)
+    before = cache.generation
+    cache.invalidate([1])
+    assert cache.generation == before + 1
+    assert cache.get(1) is CityCache.MISSING and cache.get(2) == ROW
+    cache.clear()
+    assert cache.generation == before + 2
+    assert cache.get(2) is CityCache.MISSING
+    assert cache.metrics()["invalidations"] == 2
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resource_db.time, "time", lambda: now[0])
+    cache = CityCache(10, 30)
+    cache.put(1, ROW, cache.generation)
+    now[0] += 29
+    assert cache.get(1) == ROW
+    now[0] += 2
+    assert cache.get(1) is CityCache.MISSING
+
+
+def test_least_recently_used_row_is_evicted():
+    cache = CityCache(2, 0)
+    cache.put(1, ROW, cache.generation)
+    cache.put(2, ROW, cache.generation)
+    cache.get(1)
+    cache.put(3, ROW, cache.generation)
+    assert cache.get(2) is CityCache.MISSING
+    assert cache.get(1) == ROW and cache.get(3) == ROW
+
+
+def test_writes_invalidate_cached_cities(city_db):
+    assert resource_db.get_city(4)["resources_allocated"] == 100
+    assert resource_db.get_cities([4, 99]) == {4: resource_db.get_city(4), 99: None}
+    assert resource_db.update_allocation(4, 400, "veryHigh") == 1
+    assert resource_db.get_city(4)["resources_allocated"] == 400
+    assert resource_db.get_cities([4])[4]["disaster_risk_level"] == "veryHigh"
@@ -0,0 +1,81 @@
+# test_merkle.py
+import hashlib
+
+import pytest
+
+from node import Blockchain, block_view, merkle_levels, merkle_proof, merkle_root, verify_merkle_proof
+
+
+def transactions(n):
+    return [{"sender": f"s{i}", "recipient": "all", "contract_id": "update_resource_allocation",
+             "contract_payload": {"authority": "provider", "city_id": i + 1, "risk_level": "high"}}
+            for i in range(n)]
+
+
+def versioned_block(txs):
+    return {"version": 2, "index": 2, "timestamp": 1.0, "transactions": txs, "proof": 1,
+            "previous_hash": "0" * 64, "mined_by": "m", "tx_count": len(txs), "tx_root": merkle_root(txs)}
+
+
+def test_empty_root_is_hash_of_nothing():
+    assert merkle_root([]) == hashlib.sha256(b"").hexdigest()
+
+
+def test_root_depends_on_order_and_content():
+    txs = transactions(3)
+    assert merkle_root(txs) != merkle_root(txs[::-1])
+    assert merkle_root(txs) != merkle_root(txs[:2] + [dict(txs[2], recipient="x")])
+
+
+@pytest.mark.parametrize("n", range(1, 10))
+def test_every_leaf_proves_into_the_root(n):
+    txs = transactions(n)
+    levels = merkle_levels(txs)
+    root = merkle_root(txs)
+    for i, tx in enumerate(txs):
+        assert verify_merkle_proof(tx, merkle_proof(levels, i), n, root)
+
+
+@pytest.mark.parametrize("n", [2, 5, 8])
+def test_proofs_reject_tampering(n):
+    txs = transactions(n)
+    levels = merkle_levels(txs)
+    root = merkle_root(txs)
+    proof = merkle_proof(levels, 1)
+    assert not verify_merkle_proof(dict(txs[1], recipient="x"), proof, n, root)
+    assert not verify_merkle_proof(txs[1], dict(proof, index=0), n, root)
+    assert not verify_merkle_proof(txs[1], dict(proof, path=proof["path"] + [root]), n, root)
+    assert not verify_merkle_proof(txs[1], proof, 1, root)  # index past tx_count
+    assert not verify_merkle_proof(txs[1], {"index": "x", "path": []}, n, root)
+
+
+def test_odd_last_leaf_cannot_be_paired_with_another_node():
+    txs = transactions(3)
+    levels = merkle_levels(txs)
+    forged = {"index": 2, "path": [levels[0][0]] + merkle_proof(levels, 2)["path"][1:]}
+    assert not verify_merkle_proof(txs[2], forged, 3, merkle_root(txs))
+
+
+def test_headers_view_hashes_like_the_block_and_verifies():
+    block = versioned_block(transactions(5))
+    view = block_view(block, "headers", {"city_id_min": 2, "city_id_max": 3})
+    assert view["headers_only"] and len(view["transactions"]) == 2
+    assert Blockchain.hash(view) == Blockchain.hash(block)
+    assert Blockchain.transactions_verified(view)
+    view["transactions"][0] = dict(view["transactions"][0], recipient="x")
+    assert not Blockchain.transactions_verified(view)
+
+
+def test_full_block_must_rebuild_its_root():
+    block = versioned_block(transactions(4))
+    assert Blockchain.transactions_verified(block)
+    assert not Blockchain.transactions_verified(dict(block, transactions=transactions(3)))
+    assert not Blockchain.transactions_verified(dict(block, version=3))
+
+
+def test_version_1_blocks_keep_whole_block_hash_and_are_sent_whole():
+    legacy = {"index": 2, "timestamp": 1.0, "transactions": transactions(2), "proof": 1,
+              "previous_hash": "0" * 64, "mined_by": "m"}
+    assert Blockchain.hash(legacy) != Blockchain.hash(dict(legacy, transactions=[]))
+    assert block_view(legacy, "headers", {"city_id_min": 1}) is legacy
+    assert Blockchain.transactions_verified(legacy)
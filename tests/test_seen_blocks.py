@@ -0,0 +1,28 @@
+# test_seen_blocks.py
+from node import SeenBlockCache
+
+
+def test_remembers_added_hashes():
+    cache = SeenBlockCache(3)
+    cache.add("a")
+    assert "a" in cache
+    assert "b" not in cache
+    assert len(cache) == 1
+
+
+def test_adding_twice_keeps_one_entry():
+    cache = SeenBlockCache(3)
+    cache.add("a")
+    cache.add("a")
+    assert len(cache) == 1
+
+
+def test_evicts_least_recently_seen_first():
+    cache = SeenBlockCache(3)
+    for block_hash in ("a", "b", "c"):
+        cache.add(block_hash)
+    assert "a" in cache  # a lookup refreshes "a", so "b" is now the oldest
+    cache.add("d")
+    assert len(cache) == 3
+    assert "b" not in cache
+    assert all(block_hash in cache for block_hash in ("a", "c", "d"))
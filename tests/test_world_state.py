@@ -0,0 +1,97 @@
+# test_world_state.py
+import pytest
+
+import node
+import resource_db
+
+LOCAL = "10.0.0.1:5002:provider-0"
+
+
+def allocations():
+    with resource_db.transaction() as conn:
+        return {row[0]: (row[1], row[2]) for row in conn.execute(
+            "SELECT city_id, resources_allocated, disaster_risk_level FROM disaster_resources")}
+
+
+def test_rollback_and_snapshot_round_trip(city_db):
+    resource_db.ensure_state_tables()
+    base = allocations()
+    with resource_db.transaction(immediate=True) as conn:
+        resource_db.apply_block_state(conn, 1, "h1", {1: (100, "low")})
+        resource_db.apply_block_state(conn, 2, "h2", {2: (400, "veryHigh")})
+        snapshot_id = resource_db.take_snapshot(conn, 2, "h2")
+        resource_db.apply_block_state(conn, 3, "h3", {3: (300, "high"), 1: (200, "medium")})
+    after_3 = allocations()
+    assert after_3[1] == (200, "medium") and after_3[3] == (300, "high")
+
+    with resource_db.transaction(immediate=True) as conn:
+        assert resource_db.rollback_state(conn, 1) == {1, 2, 3}
+        assert resource_db.state_history(conn)[0] == (1, "h1")
+    assert allocations() == {**base, 1: (100, "low")}
+
+    with resource_db.transaction(immediate=True) as conn:
+        resource_db.apply_block_state(conn, 2, "h2", {2: (400, "veryHigh")})
+        resource_db.apply_block_state(conn, 3, "h3", {3: (300, "high"), 1: (200, "medium")})
+        assert resource_db.restore_snapshot(conn, snapshot_id)[0] == 2
+        assert resource_db.state_history(conn) == [(2, "h2")]
+    assert allocations() == {**base, 1: (100, "low"), 2: (400, "veryHigh")}
+
+    with resource_db.transaction(immediate=True) as conn:
+        base_id = [s[0] for s in resource_db.state_snapshots(conn) if s[1] == resource_db.BASE_STATE_INDEX][0]
+        resource_db.restore_snapshot(conn, base_id)
+    assert allocations() == base
+
+
+def test_direct_writes_are_reapplied_after_rollback(city_db):
+    resource_db.ensure_state_tables()
+    with resource_db.transaction(immediate=True) as conn:
+        resource_db.apply_block_state(conn, 1, "h1", {5: (100, "low")})
+        resource_db.apply_block_state(conn, 2, "h2", {6: (100, "low")})
+    resource_db.update_allocation(6, 400, "veryHigh")  # endpoint write at applied tip 2
+    with resource_db.transaction(immediate=True) as conn:
+        resource_db.rollback_state(conn, 1)  # undoing block 2 also undoes the write on top of it
+        assert conn.execute("SELECT resources_allocated FROM disaster_resources WHERE city_id = 6").fetchone()[0] != 400
+        assert resource_db.reapply_direct_writes(conn, 2, 1) == [6]
+    assert allocations()[6] == (400, "veryHigh")
+
+
+@pytest.fixture
+def provider_chain(city_db, monkeypatch):
+    """A provider Blockchain whose world state is materialized into city_db."""
+    monkeypatch.setattr(node, "STATE_SNAPSHOT_INTERVAL", 3)
+    monkeypatch.setattr(node, "STATE_UNDO_DEPTH", 2)
+    bc = node.Blockchain()
+    bc.register_node(LOCAL, is_local=True)
+    bc.set_peer_role(LOCAL, "provider")
+    monkeypatch.setattr(node, "bc", bc)
+    assert bc.world_state.attach("provider")
+    return bc
+
+
+def mine(bc, chain, city_id, risk_level, timestamp):
+    txs = [{"contract_id": "update_resource_allocation",
+            "contract_payload": {"authority": "provider", "city_id": city_id, "risk_level": risk_level}}]
+    prev = chain[-1]
+    return {"version": node.BLOCK_VERSION, "index": prev["index"] + 1, "timestamp": timestamp, "transactions": txs,
+            "proof": bc.proof_of_work(prev["proof"]), "previous_hash": bc.hash(prev), "mined_by": "m",
+            "tx_count": 1, "tx_root": node.merkle_root(txs)}
+
+
+def test_reorg_past_the_undo_window_restores_a_snapshot(provider_chain):
+    bc = provider_chain
+    base = allocations()
+    for i in range(6):
+        bc.append_block(mine(bc, bc.chain, 1 + i % 2, "veryHigh", 1.0 + i))
+    assert allocations()[1] == (400, "veryHigh")
+
+    fork = list(bc.chain[:2])
+    for i in range(8):
+        fork.append(mine(bc, fork, 3, "low", 100.0 + i))
+    assert bc.replace_chain(fork) is not False
+
+    state = allocations()
+    assert state[1] == (400, "veryHigh")  # block 2 is shared by both chains
+    assert state[2] == base[2]            # only the abandoned blocks touched city 2
+    assert state[3] == (100, "low")
+    metrics = bc.world_state.metrics()
+    assert metrics["snapshot_restores"] == 1 and metrics["errors"] == 0
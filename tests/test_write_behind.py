@@ -0,0 +1,69 @@
+# test_write_behind.py
+import fcntl
+import json
+
+import pytest
+
+import resource_db
+from resource_db import WriteBehindQueue
+
+
+def entry(seq, city_id, resources, risk_level):
+    return json.dumps({"seq": seq, "city_id": city_id, "resources_allocated": resources,
+                       "risk_level": risk_level}) + "\n"
+
+
+@pytest.fixture
+def journal_dir(tmp_path, city_db, monkeypatch):
+    monkeypatch.setattr(resource_db, "WRITE_BEHIND_ALLOW_EPHEMERAL", True)
+    monkeypatch.setattr(resource_db, "WRITE_BEHIND_INTERVAL", 60)  # flushes happen only when the test asks
+    path = tmp_path / "write_behind"
+    path.mkdir()
+    return path
+
+
+def test_replay_stops_at_a_torn_last_line(journal_dir):
+    untouched = resource_db.get_city(6)
+    journal = journal_dir / "provider-0.journal"
+    journal.write_text(entry(1, 4, 400, "veryHigh") + entry(2, 5, 100, "low") + entry(3, 4, 200, "medium")
+                       + '{"seq": 4, "city_id": 6, "resour')
+    queue = WriteBehindQueue(str(journal))
+    queue.start()
+
+    assert queue.recovered == 3 and len(queue) == 2  # city 4's two updates coalesce
+    assert queue.overlay(4, {"resources_allocated": 300})["resources_allocated"] == 200
+    assert queue.seq == 3
+    lines = journal.read_text().splitlines()
+    assert [json.loads(line)["city_id"] for line in lines] == [5, 4]  # torn tail dropped on rewrite
+
+    assert queue.flush() == 2
+    assert resource_db.get_city(4)["resources_allocated"] == 200
+    assert resource_db.get_city(5)["disaster_risk_level"] == "low"
+    assert resource_db.get_city(6) == untouched  # the torn update is never applied
+    assert journal.read_text() == ""
+
+
+def test_orphaned_journals_are_adopted_but_live_ones_are_left(journal_dir):
+    (journal_dir / "provider-gone.journal").write_text(entry(7, 2, 100, "low"))
+    live = journal_dir / "provider-live.journal"
+    live.write_text(entry(1, 3, 400, "veryHigh"))
+    with open(str(live) + ".lock", "a") as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)  # its provider is still running
+        queue = WriteBehindQueue(str(journal_dir / "provider-0.journal"))
+        queue.start()
+
+    assert queue.adopted_journals == 1 and len(queue) == 1
+    assert not (journal_dir / "provider-gone.journal").exists()
+    assert live.exists()
+    assert queue.seq == 1  # adopted entries are renumbered after ours
+    assert queue.flush() == 1
+    assert resource_db.get_city(2)["resources_allocated"] == 100
+    assert resource_db.get_city(3)["resources_allocated"] != 400
+
+
+def test_a_journal_owned_by_a_running_provider_is_refused(journal_dir):
+    journal = str(journal_dir / "provider-0.journal")
+    with open(journal + ".lock", "a") as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        with pytest.raises(RuntimeError):
+            WriteBehindQueue(journal).start()